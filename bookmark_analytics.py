@@ -0,0 +1,282 @@
+import sys
+import time
+from pathlib import Path
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+from bookmark_tree import BOOKMARK_ROOTS, WEBKIT_EPOCH_OFFSET_US, load_bookmarks, synthetic_bookmarks
+
+try:
+    import numpy as np
+except ImportError:  # Optional: pip install numpy
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional: Parquet output
+    pa = None
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("Bookmark analytics needs numpy (pip install numpy)")
+
+
+def decode_webkit_times(raw):
+    """WebKit-epoch microsecond strings -> datetime64[us] in one vectorized pass; 0/missing -> NaT"""
+    _require_numpy()
+    # map(int) parses in C without per-item bytecode; faster than a str-array astype
+    micros = np.fromiter(map(int, raw), dtype=np.int64, count=len(raw))
+    decoded = (micros - WEBKIT_EPOCH_OFFSET_US).astype('datetime64[us]')
+    decoded[micros <= 0] = np.datetime64('NaT')
+    return decoded
+
+
+class _Interner:
+    """Strings -> dense int codes (dictionary encoding)"""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+def _object_array(values):
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def flatten_columns(sources):
+    """Columnar view of every URL bookmark in one or more trees.
+
+    sources: iterable of (device label, tree). Returns a dict of equal-length
+    arrays (device, root, folder and domain are codes into the string tables
+    under 'tables') plus the url and name columns.
+    """
+    _require_numpy()
+    devices, roots, folders, domains = _Interner(), _Interner(), _Interner(), _Interner()
+    host_codes = {}
+    columns = {name: [] for name in ('device', 'root', 'id', 'folder', 'domain', 'date_added', 'date_last_used')}
+    urls, names = [], []
+
+    for device, data in sources:
+        device_code = devices.code(device)
+        for root_name in BOOKMARK_ROOTS:
+            root = data.get('roots', {}).get(root_name)
+            if not isinstance(root, dict):
+                continue
+            root_code = roots.code(root_name)
+            stack = [(root, root_name)]
+            while stack:
+                node, path = stack.pop()
+                folder_code = folders.code(path)
+                for child in node.get('children', []):
+                    if not isinstance(child, dict):
+                        continue
+                    if child.get('type') == 'folder':
+                        stack.append((child, f"{path}/{child.get('name', '')}"))
+                        continue
+                    url = child.get('url', '')
+                    host = url.split("/", 3)[2] if "://" in url else ""
+                    domain_code = host_codes.get(host)
+                    if domain_code is None:
+                        try:
+                            hostname = urlsplit(url).hostname or ""
+                        except ValueError:  # Malformed IPv6 literal etc.
+                            hostname = ""
+                        domain_code = host_codes[host] = domains.code(hostname.removeprefix("www."))
+                    columns['device'].append(device_code)
+                    columns['root'].append(root_code)
+                    columns['id'].append(child.get('id') or '0')
+                    columns['folder'].append(folder_code)
+                    columns['domain'].append(domain_code)
+                    columns['date_added'].append(child.get('date_added') or '0')
+                    columns['date_last_used'].append(child.get('date_last_used') or '0')
+                    urls.append(url)
+                    names.append(child.get('name', ''))
+
+    return {
+        'device': np.asarray(columns['device'], dtype=np.int32),
+        'root': np.asarray(columns['root'], dtype=np.int8),
+        'id': np.fromiter(map(int, columns['id']), dtype=np.int64, count=len(columns['id'])),
+        'folder': np.asarray(columns['folder'], dtype=np.int32),
+        'domain': np.asarray(columns['domain'], dtype=np.int32),
+        'date_added': decode_webkit_times(columns['date_added']),
+        'date_last_used': decode_webkit_times(columns['date_last_used']),
+        # Object arrays: a fixed-width str_ array pads every entry to the longest URL
+        'url': _object_array(urls),
+        'name': _object_array(names),
+        'tables': {'device': devices.values, 'root': roots.values, 'folder': folders.values,
+                   'domain': domains.values},
+    }
+
+
+def load_columns(paths):
+    """Columns for exported Bookmarks files; each file is labelled by its path"""
+    return flatten_columns((str(path), load_bookmarks(path)) for path in paths)
+
+
+# --- aggregations ----------------------------------------------------------
+
+def growth_over_time(columns, unit='M'):
+    """(period, added in period, running total) for each period with additions"""
+    added = columns['date_added']
+    periods, counts = np.unique(added[~np.isnat(added)].astype(f'datetime64[{unit}]'), return_counts=True)
+    return list(zip(periods.astype(str).tolist(), counts.tolist(), np.cumsum(counts).tolist()))
+
+
+def stale_bookmarks(columns, days=365, now=None, limit=None):
+    """Indexes of bookmarks not used (or, if never used, not added) within `days`, oldest first"""
+    now = np.datetime64(now or datetime.now(), 'us')
+    last = np.where(np.isnat(columns['date_last_used']), columns['date_added'], columns['date_last_used'])
+    stale = np.flatnonzero(~np.isnat(last) & (last < now - np.timedelta64(days, 'D')))
+    stale = stale[np.argsort(last[stale], kind='stable')]
+    return stale[:limit] if limit else stale
+
+
+def top_domains(columns, n=20):
+    """(domain, bookmark count) for the n most bookmarked domains"""
+    counts = np.bincount(columns['domain'], minlength=len(columns['tables']['domain']))
+    order = np.argsort(-counts, kind='stable')[:n]
+    return [(columns['tables']['domain'][code] or "(none)", int(counts[code])) for code in order if counts[code]]
+
+
+def per_device(columns):
+    counts = np.bincount(columns['device'], minlength=len(columns['tables']['device']))
+    return dict(zip(columns['tables']['device'], counts.tolist()))
+
+
+# --- storage ---------------------------------------------------------------
+
+def _pack_strings(values):
+    """Strings -> (offsets, UTF-8 bytes); .npz holds these without pickling or fixed-width padding"""
+    encoded = [value.encode('utf-8', 'surrogatepass') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def _unpack_strings(offsets, data):
+    data = data.tobytes()
+    bounds = offsets.tolist()
+    return [data[start:end].decode('utf-8', 'surrogatepass') for start, end in zip(bounds, bounds[1:])]
+
+
+def save_columns(columns, path):
+    """Write .npz (numpy only) or .parquet (needs pyarrow) with dictionary-encoded string columns"""
+    path = Path(path)
+    if path.suffix == ".parquet":
+        if pa is None:
+            raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow)")
+        fields = {}
+        for name, values in columns.items():
+            if name == 'tables':
+                continue
+            if name in columns['tables']:
+                fields[name] = pa.DictionaryArray.from_arrays(values, pa.array(columns['tables'][name]))
+            else:
+                fields[name] = pa.array(values)
+        pq.write_table(pa.table(fields), path)
+        return path
+
+    arrays = {}
+    strings = {f"table_{name}": values for name, values in columns['tables'].items()}
+    for name, values in columns.items():
+        if name == 'tables':
+            continue
+        if values.dtype == object:
+            strings[f"str_{name}"] = values
+        else:
+            arrays[name] = values
+    for key, values in strings.items():
+        arrays[f"{key}.offsets"], arrays[f"{key}.utf8"] = _pack_strings(values)
+    np.savez_compressed(path, **arrays)
+    return path
+
+
+def read_columns(path):
+    """Columns written by save_columns as .npz"""
+    _require_numpy()
+    columns, tables = {}, {}
+    with np.load(path) as stored:
+        for name in stored.files:
+            if name.endswith(".utf8"):
+                continue
+            if name.endswith(".offsets"):
+                key = name[:-len(".offsets")]
+                values = _unpack_strings(stored[name], stored[f"{key}.utf8"])
+                if key.startswith("table_"):
+                    tables[key[len("table_"):]] = values
+                else:
+                    columns[key[len("str_"):]] = _object_array(values)
+            else:
+                columns[name] = stored[name]
+    columns['tables'] = tables
+    return columns
+
+
+def report(columns, stale_days=365):
+    print(f"📊 {len(columns['id'])} bookmarks across {len(columns['tables']['device'])} file(s)")
+    for device, count in per_device(columns).items():
+        print(f"   {device}: {count}")
+    print("📈 Growth (last 12 months with additions):")
+    for period, added, total in growth_over_time(columns)[-12:]:
+        print(f"   {period}: +{added} → {total}")
+    print("🌐 Top domains:")
+    for domain, count in top_domains(columns, 10):
+        print(f"   {count:>6}  {domain}")
+    stale = stale_bookmarks(columns, stale_days)
+    print(f"🕸️ {len(stale)} bookmarks unused for over {stale_days} days; oldest:")
+    for index in stale[:5]:
+        print(f"   {columns['name'][index]} ({columns['url'][index]})")
+
+
+def benchmark(count=100000):
+    """Vectorized vs per-bookmark timestamp decoding on a synthetic tree"""
+    data = synthetic_bookmarks(count)
+    start = time.perf_counter()
+    columns = flatten_columns([("synthetic", data)])
+    flatten_time = time.perf_counter() - start
+
+    raw = [node['date_added'] for folder in data['roots']['bookmark_bar']['children'] for node in folder['children']]
+    start = time.perf_counter()
+    decode_webkit_times(raw)
+    vectorized = time.perf_counter() - start
+    start = time.perf_counter()
+    epoch = datetime(1601, 1, 1)
+    [epoch + timedelta(microseconds=int(value)) for value in raw]
+    looped = time.perf_counter() - start
+
+    start = time.perf_counter()
+    growth_over_time(columns), top_domains(columns), stale_bookmarks(columns)
+    aggregate = time.perf_counter() - start
+    print(f"⏱️ {len(raw)} bookmarks: flatten {flatten_time:.2f}s, aggregations {aggregate * 1000:.1f} ms")
+    print(f"⏱️ Timestamp decoding: vectorized {vectorized * 1000:.1f} ms vs loop {looped * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    # Usage: python bookmark_analytics.py report [exported files or .npz ...]
+    #        python bookmark_analytics.py export <out.npz|out.parquet> [exported files ...]
+    #        python bookmark_analytics.py bench [count]
+    args = sys.argv[1:]
+    default = [Path.cwd() / "exported_bookmarks" / "Bookmarks_Chrome.json"]
+    if args and args[0] == "bench":
+        benchmark(int(args[1]) if len(args) > 1 else 100000)
+    elif len(args) > 1 and args[0] == "export":
+        out = save_columns(load_columns(args[2:] or default), args[1])
+        print(f"💾 Wrote {out}")
+    elif args and args[0] == "report":
+        files = args[1:] or default
+        if len(files) == 1 and str(files[0]).endswith(".npz"):
+            report(read_columns(files[0]))
+        else:
+            report(load_columns(files))
+    else:
+        print("Usage: python bookmark_analytics.py report [files] | export <out> [files] | bench [count]")
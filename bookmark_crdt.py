@@ -0,0 +1,447 @@
+import sys
+import copy
+import json
+import random
+import hashlib
+import tempfile
+from pathlib import Path
+from bookmark_tree import BOOKMARK_ROOTS, load_bookmarks
+from bookmarks_export import get_chrome_bookmarks_path, get_device_id, get_state_dir
+from chrome_checksum import set_checksum
+from sync_filters import load_sync_filter, scope_to_shared
+
+
+ROOT_PREFIX = "root:"
+POSITION_SPACE = 2 ** 32
+FIELDS = ('name', 'url')
+
+
+def root_guid(root_name):
+    return f"{ROOT_PREFIX}{root_name}"
+
+
+def position_between(before, after):
+    """Dense position strictly between two positions (lists of ints); None means open end"""
+    before = before or []
+    position = []
+    depth = 0
+    while True:
+        low = before[depth] if depth < len(before) else 0
+        high = after[depth] if after is not None and depth < len(after) else POSITION_SPACE
+        if high - low > 1:
+            return position + [low + (high - low) // 2]
+        position.append(low)
+        if after is not None and high != low:
+            # Diverged from `after`; only `before` constrains deeper digits now
+            after = None
+        depth += 1
+
+
+def _index_tree(data):
+    """guid -> (parent guid, index among siblings, node) for every node below the roots"""
+    index = {}
+    stack = [(root_guid(name), data.get('roots', {}).get(name)) for name in BOOKMARK_ROOTS]
+    while stack:
+        parent_guid, parent = stack.pop()
+        if not isinstance(parent, dict):
+            continue
+        for position, child in enumerate(parent.get('children', [])):
+            if isinstance(child, dict) and child.get('guid'):
+                index[child['guid']] = (parent_guid, position, child)
+                if child.get('type') == 'folder':
+                    stack.append((child['guid'], child))
+    return index
+
+
+class BookmarkReplica:
+    """Operation-based tree CRDT for a bookmark tree, keyed by guid.
+
+    Every device appends to its own operation log. The tree is derived by replaying
+    the union of all logs in (lamport, device) order, so replicas that have seen the
+    same operations always materialize the same tree:
+      - add/move carry a dense position; children are ordered by (position, guid)
+      - a move that would make a node its own ancestor is skipped
+      - name/url are last-writer-wins per field
+      - remove is a sticky tombstone
+    """
+
+    def __init__(self, device=None):
+        self.device = device or get_device_id()
+        self.logs = {}  # device -> list of ops
+        self.clock = 0
+        self._state = None
+
+    # --- operation log -------------------------------------------------
+
+    def _emit(self, op, **fields):
+        self.clock += 1
+        record = dict(fields, op=op, ts=[self.clock, self.device])
+        self.logs.setdefault(self.device, []).append(record)
+        self._state = None
+        return record
+
+    def merge_ops(self, ops):
+        """Apply operations received from other replicas (duplicates are ignored)"""
+        added = 0
+        for op in ops:
+            device = op['ts'][1]
+            log = self.logs.setdefault(device, [])
+            if log and log[-1]['ts'][0] >= op['ts'][0]:
+                continue
+            log.append(op)
+            self.clock = max(self.clock, op['ts'][0])
+            added += 1
+        if added:
+            self._state = None
+        return added
+
+    def ops_since(self, version_vector):
+        """Operations not covered by a {device: last counter} vector"""
+        missing = []
+        for device, log in self.logs.items():
+            seen = version_vector.get(device, 0)
+            missing.extend(op for op in log if op['ts'][0] > seen)
+        return missing
+
+    def version_vector(self):
+        return {device: log[-1]['ts'][0] for device, log in self.logs.items() if log}
+
+    # --- materialization ------------------------------------------------
+
+    def state(self):
+        """guid -> node dict, derived by replaying all operations in total order"""
+        if self._state is not None:
+            return self._state
+
+        nodes = {root_guid(name): {'guid': root_guid(name), 'type': 'folder', 'name': name,
+                                   'parent': None, 'pos': [], 'removed': False}
+                 for name in BOOKMARK_ROOTS}
+
+        def is_ancestor(guid, node_guid):
+            while node_guid is not None:
+                if node_guid == guid:
+                    return True
+                node_guid = nodes[node_guid]['parent']
+            return False
+
+        ops = sorted((op for log in self.logs.values() for op in log), key=lambda op: tuple(op['ts']))
+        for op in ops:
+            guid = op['guid']
+            node = nodes.get(guid)
+            if op['op'] == 'add' and node is None:
+                if op['parent'] not in nodes:
+                    continue
+                nodes[guid] = dict(op['fields'], guid=guid, parent=op['parent'],
+                                   pos=op['pos'], removed=False)
+            elif node is None or node['removed'] or node['parent'] is None:
+                continue
+            elif op['op'] in ('add', 'move'):
+                if op['parent'] in nodes and not is_ancestor(guid, op['parent']):
+                    node['parent'], node['pos'] = op['parent'], op['pos']
+            elif op['op'] == 'set':
+                node[op['field']] = op['value']
+            elif op['op'] == 'remove':
+                node['removed'] = True
+
+        self._state = nodes
+        return nodes
+
+    def children(self):
+        """parent guid -> ordered list of live child guids"""
+        nodes = self.state()
+        children = {}
+        for guid, node in nodes.items():
+            if node['parent'] is not None and not node['removed']:
+                children.setdefault(node['parent'], []).append(guid)
+        for siblings in children.values():
+            siblings.sort(key=lambda guid: (nodes[guid]['pos'], guid))
+        return children
+
+    def to_chrome_tree(self):
+        """Materialize the replica as a Chrome Bookmarks JSON document"""
+        nodes = self.state()
+        children = self.children()
+        next_id = 1
+
+        def render(guid):
+            nonlocal next_id
+            node = nodes[guid]
+            rendered = {'id': str(next_id), 'guid': guid, 'name': node.get('name', ''),
+                        'type': node['type'], 'date_added': node.get('date_added', '0')}
+            next_id += 1
+            if node['type'] == 'url':
+                rendered['url'] = node.get('url', '')
+            else:
+                rendered['children'] = [render(child) for child in children.get(guid, [])]
+            return rendered
+
+        roots = {}
+        for name in BOOKMARK_ROOTS:
+            root = render(root_guid(name))
+            del root['guid']
+            roots[name] = root
+        return {'roots': roots, 'version': 1}
+
+    # --- local edits ------------------------------------------------------
+
+    def record_tree(self, data, base=None):
+        """Emit the ops that turn base into data; returns how many.
+
+        base is the tree this device last applied or recorded (Chrome's state
+        after the previous import/export), not the merged replica: nodes other
+        devices added or changed since then are not in Chrome yet and must not
+        be read as local deletions or reverts. Without a base every node is
+        (re)asserted and nothing is removed.
+        """
+        nodes = self.state()
+        known = _index_tree(base) if base else {}
+        seen = set()
+        emitted = 0
+
+        def replica_pos(guid, parent_guid):
+            node = nodes.get(guid)
+            if node is not None and node['parent'] == parent_guid and not node['removed']:
+                return node['pos']
+            return None
+
+        def visit(parent_guid, tree_children):
+            nonlocal emitted
+            previous_index = -1  # base index of the last sibling left where it was
+            lower = None  # replica position of the previous sibling
+            child_guids = [child.get('guid') for child in tree_children]
+            for index, child in enumerate(tree_children):
+                guid = child_guids[index]
+                if not guid:
+                    continue
+                seen.add(guid)
+                before = known.get(guid)
+                in_place = before is not None and before[0] == parent_guid and before[1] > previous_index
+
+                if in_place:
+                    previous_index = before[1]
+                    position = replica_pos(guid, parent_guid)
+                    lower = position if position is not None else lower
+                else:
+                    # Upper bound: next sibling that stays where it was
+                    upper = None
+                    for later in child_guids[index + 1:]:
+                        later_before = known.get(later)
+                        if later_before is not None and later_before[0] == parent_guid \
+                                and later_before[1] > previous_index:
+                            upper = replica_pos(later, parent_guid)
+                            break
+                    if upper is not None and lower is not None and upper <= lower:
+                        upper = None
+                    position = position_between(lower, upper)
+                    if before is None and guid not in nodes:
+                        fields = {key: child[key] for key in ('type', 'name', 'url', 'date_added') if key in child}
+                        self._emit('add', guid=guid, parent=parent_guid, pos=position, fields=fields)
+                    else:
+                        self._emit('move', guid=guid, parent=parent_guid, pos=position)
+                    emitted += 1
+                    lower = position
+
+                if before is not None:
+                    for field in FIELDS:
+                        if field in child and child[field] != before[2].get(field):
+                            self._emit('set', guid=guid, field=field, value=child[field])
+                            emitted += 1
+
+                if child.get('type') == 'folder':
+                    visit(guid, child.get('children', []))
+
+        for name in BOOKMARK_ROOTS:
+            root = data.get('roots', {}).get(name)
+            if isinstance(root, dict):
+                visit(root_guid(name), root.get('children', []))
+
+        for guid in known.keys() - seen:
+            node = nodes.get(guid)
+            if node is not None and not node['removed']:
+                self._emit('remove', guid=guid)
+                emitted += 1
+        return emitted
+
+    # --- persistence --------------------------------------------------
+
+    def load_dir(self, oplog_dir):
+        """Load every device log (<device>.jsonl) from a directory"""
+        for log_file in sorted(Path(oplog_dir).glob("*.jsonl")):
+            with open(log_file, 'r', encoding='utf-8') as f:
+                self.merge_ops(json.loads(line) for line in f if line.strip())
+        return self
+
+    def save_dir(self, oplog_dir):
+        """Append this device's new ops to its own log file; returns the file path"""
+        oplog_dir = Path(oplog_dir)
+        oplog_dir.mkdir(parents=True, exist_ok=True)
+        log_file = oplog_dir / f"{self.device}.jsonl"
+
+        persisted = 0
+        if log_file.exists():
+            with open(log_file, 'r', encoding='utf-8') as f:
+                persisted = sum(1 for line in f if line.strip())
+
+        pending = self.logs.get(self.device, [])[persisted:]
+        if pending:
+            with open(log_file, 'a', encoding='utf-8') as f:
+                for op in pending:
+                    f.write(json.dumps(op, ensure_ascii=False, separators=(',', ':')) + "\n")
+        return log_file if pending else None
+
+
+def _applied_file(oplog_dir):
+    """Where this device keeps the tree it last applied for an op-log directory (local, never synced)"""
+    key = hashlib.sha1(str(Path(oplog_dir).resolve()).encode('utf-8')).hexdigest()[:12]
+    return get_state_dir() / f"crdt_applied_{key}.json"
+
+
+def load_applied(oplog_dir):
+    try:
+        return load_bookmarks(_applied_file(oplog_dir))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def save_applied(oplog_dir, data):
+    applied_file = _applied_file(oplog_dir)
+    tmp_file = applied_file.with_suffix(".tmp")
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    tmp_file.replace(applied_file)
+
+
+def export_crdt(export_dir, bookmarks_file=None):
+    """Record local Chrome changes into this device's op log; returns paths to stage"""
+    oplog_dir = Path(export_dir) / "oplog"
+    replica = BookmarkReplica().load_dir(oplog_dir)
+    local = load_bookmarks(bookmarks_file or get_chrome_bookmarks_path())
+    base = load_applied(oplog_dir)
+    sync_filter = load_sync_filter()
+    if sync_filter is not None:
+        # Out-of-scope nodes come from the replica on both sides, so they never produce ops
+        shared = replica.to_chrome_tree()
+        base = scope_to_shared(base, shared, sync_filter) if base else None
+        local = scope_to_shared(local, shared, sync_filter)
+    emitted = replica.record_tree(local, base)
+    log_file = replica.save_dir(oplog_dir)
+    save_applied(oplog_dir, local)
+    print(f"🧬 Recorded {emitted} bookmark operations")
+    if emitted:
+        from change_feed import get_change_feed
+        get_change_feed().publish_trees(base, local)
+    return [log_file] if log_file else []
+
+
+def import_crdt(oplog_dir):
+    """Materialize the merged op logs and import the result into Chrome"""
+    from bookmarks_import_fixed import import_bookmarks, is_chrome_running
+    from chrome_checksum import read_bookmarks_consistent
+    from deferred_import import defer_enabled
+
+    replica = BookmarkReplica().load_dir(oplog_dir)
+    merged_file = Path(tempfile.gettempdir()) / "Bookmarks_Chrome.crdt.json"
+    with open(merged_file, 'w', encoding='utf-8') as f:
+        json.dump(set_checksum(replica.to_chrome_tree()), f, indent=3, ensure_ascii=False)
+    deferred = defer_enabled() and is_chrome_running()
+    imported = import_bookmarks(merged_file, defer=deferred)
+    if imported and not deferred:
+        # What Chrome holds now is the base the next export diffs against
+        save_applied(oplog_dir, read_bookmarks_consistent(get_chrome_bookmarks_path()))
+    return imported
+
+
+def simulate(devices=3, rounds=200, seed=0):
+    """Convergence harness: N in-process replicas making random concurrent edits.
+
+    Each device edits its own browser tree, which only picks up merged ops when
+    it imports, so exports regularly happen with unimported peer changes pending.
+    Checks convergence and that nothing is tombstoned that no device deleted.
+    """
+    rng = random.Random(seed)
+    replicas = [BookmarkReplica(device=f"device-{i}") for i in range(devices)]
+    browsers = [replica.to_chrome_tree() for replica in replicas]
+    deleted = set()
+    next_guid = 0
+
+    def subtree_guids(node):
+        guids = [node['guid']]
+        for child in node.get('children', []):
+            guids.extend(subtree_guids(child))
+        return guids
+
+    for _ in range(rounds):
+        device = rng.randrange(devices)
+        replica = replicas[device]
+        base = browsers[device]
+        tree = copy.deepcopy(base)
+        folders = []
+        items = []
+
+        def walk(node, parent):
+            for child in node.get('children', []):
+                items.append((child, node))
+                if child['type'] == 'folder':
+                    folders.append(child)
+                    walk(child, node)
+
+        for root in tree['roots'].values():
+            folders.append(root)
+            walk(root, None)
+
+        action = rng.random()
+        if action < 0.45 or not items:
+            next_guid += 1
+            kind = 'folder' if rng.random() < 0.3 else 'url'
+            node = {'guid': f"g{next_guid}", 'type': kind, 'name': f"n{next_guid}"}
+            node.update({'children': []} if kind == 'folder' else {'url': f"https://e.com/{next_guid}"})
+            target = rng.choice(folders)
+            target['children'].insert(rng.randint(0, len(target['children'])), node)
+        elif action < 0.65:
+            node, parent = rng.choice(items)
+            parent['children'].remove(node)
+            # A browser can't drop a folder into itself
+            inside = set(subtree_guids(node))
+            target = rng.choice([folder for folder in folders if folder.get('guid') not in inside])
+            target['children'].insert(rng.randint(0, len(target['children'])), node)
+        elif action < 0.85:
+            node, _ = rng.choice(items)
+            node['name'] = f"renamed-{rng.randint(0, 999)}"
+        else:
+            node, parent = rng.choice(items)
+            parent['children'].remove(node)
+            deleted.update(subtree_guids(node))
+
+        replica.record_tree(tree, base)
+        browsers[device] = tree
+
+        # Occasional partial sync between two random replicas
+        if rng.random() < 0.3:
+            a, b = rng.sample(replicas, 2)
+            b.merge_ops(a.ops_since(b.version_vector()))
+        # Occasional import: the browser catches up with its replica
+        if rng.random() < 0.3:
+            importer = rng.randrange(devices)
+            browsers[importer] = replicas[importer].to_chrome_tree()
+
+    for a in replicas:
+        for b in replicas:
+            b.merge_ops(a.ops_since(b.version_vector()))
+
+    trees = [json.dumps(replica.to_chrome_tree(), sort_keys=True) for replica in replicas]
+    converged = len(set(trees)) == 1
+    wrongly_removed = [guid for guid, node in replicas[0].state().items() if node['removed'] and guid not in deleted]
+    ops = sum(len(log) for log in replicas[0].logs.values())
+    print(f"{'✅' if converged and not wrongly_removed else '❌'} {devices} devices, {ops} ops: "
+          f"{'converged' if converged else 'DIVERGED'}, {len(wrongly_removed)} nodes removed that nobody deleted")
+    return converged and not wrongly_removed
+
+
+if __name__ == "__main__":
+    # Usage: python bookmark_crdt.py simulate [devices] [rounds]
+    if len(sys.argv) > 1 and sys.argv[1] == "simulate":
+        devices = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+        rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+        sys.exit(0 if all(simulate(devices, rounds, seed) for seed in range(10)) else 1)
+    else:
+        export_crdt(Path.cwd() / "exported_bookmarks")
@@ -1,16 +1,23 @@
+import os
 import time
 import subprocess
 import threading
-import hashlib
-import json
 from pathlib import Path
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+from polling_observer import create_observer
+from watchdog.events import FileSystemEventHandler, FileModifiedEvent
 from bookmarks_export import export_bookmarks, get_chrome_bookmarks_path
+from bookmark_search import update_search_index
+from sync_state import SyncState
+from sync_queue import push_or_enqueue, get_outbound_queue
+from sync_history import commit_sync_changes
+from change_feed import maybe_start_feed_server
+from chrome_checksum import read_bookmarks_consistent
+from bookmark_tree import extract_structure, structure_hash
+from sync_filters import load_sync_filter, filter_tree
 
 
 class BookmarkOnlyHandler(FileSystemEventHandler):
-    def __init__(self, export_dir):
+    def __init__(self, export_dir, bookmarks_path=None, state=None):
         self.export_dir = Path(export_dir)
         self.export_dir.mkdir(parents=True, exist_ok=True)
         
@@ -19,26 +26,40 @@ class BookmarkOnlyHandler(FileSystemEventHandler):
         self.last_sync_time = 0
         self.cooldown_period = 5  # 5 seconds between syncs
         self.processing = False
+        self.latency_stamp = None
+        self.parse_pool = None  # Optional parse_pool.ParsePool for parse/hash work
+        self.sync_filter = load_sync_filter()  # Per-machine selective sync rules, if any
         
-        # Initialize with current bookmark state
-        chrome_bookmarks = get_chrome_bookmarks_path()
-        self.last_bookmark_hash = self.get_bookmark_structure_hash(chrome_bookmarks)
-        print(f"📊 Initial bookmark hash: {self.last_bookmark_hash[:8]}...")
+        # Warm start from the state saved at the last sync; parse only on first run
+        self.bookmarks_path = Path(bookmarks_path) if bookmarks_path else get_chrome_bookmarks_path()
+        self.state = state or SyncState()
+        snapshot = self.state.load_snapshot('bookmark_only', self.bookmarks_path)
+        if snapshot:
+            self.last_bookmark_hash = snapshot['structure_hash']
+        else:
+            self.last_bookmark_hash = self.get_bookmark_structure_hash(self.bookmarks_path)
+            self.state.save_snapshot('bookmark_only', self.bookmarks_path,
+                                     structure_hash=self.last_bookmark_hash)
+            self.state.record_sync(self.bookmarks_path, self.export_dir / "Bookmarks_Chrome.json",
+                                   self.export_dir.parent)
+        print(f"📊 Initial bookmark hash: {(self.last_bookmark_hash or 'None')[:8]}...")
 
     def get_bookmark_structure_hash(self, filepath):
         """Get hash of only bookmark structure (URLs, names, folders)"""
         try:
             if not Path(filepath).exists():
                 return None
-                
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # Extract only bookmark structure
-            bookmark_structure = self.extract_bookmark_urls_and_names(data)
-            structure_json = json.dumps(bookmark_structure, sort_keys=True)
-            
-            return hashlib.md5(structure_json.encode()).hexdigest()
+
+            # Off the event thread when a process pool is attached
+            if self.parse_pool:
+                rules = self.sync_filter.rules if self.sync_filter else None
+                return self.parse_pool.analyze(filepath, ('structure_hash',), rules=rules)['structure_hash']
+
+            data = read_bookmarks_consistent(filepath)
+            # Out-of-scope folders are pruned before the walk, so they are never hashed
+            if self.sync_filter:
+                data = filter_tree(data, self.sync_filter)
+            return structure_hash(data)
             
         except Exception as e:
             print(f"❌ Error reading bookmark structure: {e}")
@@ -46,48 +67,7 @@ class BookmarkOnlyHandler(FileSystemEventHandler):
 
     def extract_bookmark_urls_and_names(self, data):
         """Extract only URLs, names, and folder structure"""
-        def extract_from_node(node):
-            if not isinstance(node, dict):
-                return None
-                
-            result = {}
-            
-            # Only include bookmark type and name
-            if 'type' in node:
-                result['type'] = node['type']
-            
-            if 'name' in node:
-                result['name'] = node['name']
-            
-            # Include URL only for actual bookmarks (not folders)
-            if 'url' in node and node.get('type') == 'url':
-                result['url'] = node['url']
-            
-            # Process children recursively
-            if 'children' in node and isinstance(node['children'], list):
-                children = []
-                for child in node['children']:
-                    child_result = extract_from_node(child)
-                    if child_result:
-                        children.append(child_result)
-                if children:
-                    result['children'] = children
-            
-            return result
-        
-        # Extract from bookmark roots only
-        if 'roots' not in data:
-            return {}
-            
-        extracted = {'roots': {}}
-        for root_name, root_data in data['roots'].items():
-            # Focus on bookmark_bar, other, and synced bookmarks
-            if root_name in ['bookmark_bar', 'other', 'synced']:
-                extracted_root = extract_from_node(root_data)
-                if extracted_root:
-                    extracted['roots'][root_name] = extracted_root
-        
-        return extracted
+        return extract_structure(data)
 
     def on_any_event(self, event):
         if event.is_directory or self.processing:
@@ -135,13 +115,19 @@ class BookmarkOnlyHandler(FileSystemEventHandler):
                 print(f"   Old hash: {self.last_bookmark_hash[:8] if self.last_bookmark_hash else 'None'}...")
                 print(f"   New hash: {current_hash[:8]}...")
                 
+                # Edit (file mtime) and detection times, stamped on the commit for latency tracking
+                self.latency_stamp = (os.path.getmtime(event.src_path), current_time)
+
                 # Export and sync
-                export_bookmarks(self.export_dir)
+                export_file = export_bookmarks(self.export_dir, self.bookmarks_path)
+                update_search_index(export_file)
                 self.git_push_changes()
                 
                 # Update state
                 self.last_bookmark_hash = current_hash
                 self.last_sync_time = current_time
+                self.state.save_snapshot('bookmark_only', self.bookmarks_path, structure_hash=current_hash)
+                self.state.record_sync(self.bookmarks_path, export_file, self.export_dir.parent)
                 
                 print("✅ Bookmark sync completed")
                 
@@ -159,9 +145,9 @@ class BookmarkOnlyHandler(FileSystemEventHandler):
             
             if result.stdout.strip():  # There are changes
                 subprocess.run(["git", "add", "."], check=True)
-                subprocess.run(["git", "commit", "-m", "🔖 Bookmark changes detected"], check=True)
-                subprocess.run(["git", "push"], check=True)
-                print("🚀 Pushed bookmark changes to Git")
+                commit_sync_changes("🔖 Bookmark changes detected", stamp=self.latency_stamp)
+                if push_or_enqueue(bookmarks_file=self.bookmarks_path):
+                    print("🚀 Pushed bookmark changes to Git")
             else:
                 print("ℹ️ No changes to push")
                 
@@ -184,10 +170,28 @@ def main():
     
     # Create handler and observer
     event_handler = BookmarkOnlyHandler(export_dir)
-    observer = Observer()
+    observer = create_observer()
     observer.schedule(event_handler, path=str(folder_to_watch), recursive=False)
     
     observer.start()
+
+    # Structured change events for local consumers (BOOKMARKS_SYNC_FEED)
+    maybe_start_feed_server()
+
+    # Retry syncs left unpushed by a previous run (offline, remote down, ...)
+    outbound_queue = get_outbound_queue()
+    if outbound_queue.depth():
+        print(f"📮 {outbound_queue.depth()} queued syncs pending, flushing in background")
+        outbound_queue.start()
+
+    # Catch up on anything that happened while the monitor was not running
+    direction = event_handler.state.catch_up_direction(
+        chrome_bookmarks_path, export_dir / "Bookmarks_Chrome.json", export_dir.parent)
+    if direction == 'export':
+        print("🔄 Local bookmarks changed while offline, checking...")
+        event_handler.on_any_event(FileModifiedEvent(str(chrome_bookmarks_path)))
+    elif direction == 'import':
+        print("📥 Synced bookmarks changed while offline (the import monitor will apply them)")
     
     try:
         while True:
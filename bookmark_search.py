@@ -0,0 +1,151 @@
+import sys
+import time
+import sqlite3
+import hashlib
+from pathlib import Path
+from bookmark_tree import load_bookmarks, iter_bookmarks
+from bookmarks_export import get_state_dir
+
+
+class BookmarkSearchIndex:
+    """SQLite FTS5 index over bookmark names, URLs and folder paths"""
+
+    def __init__(self, db_path=None):
+        self.db_path = Path(db_path) if db_path else get_state_dir() / "search_index.db"
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS indexed (
+                id INTEGER PRIMARY KEY,
+                guid TEXT UNIQUE NOT NULL,
+                fingerprint TEXT NOT NULL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS bookmarks_fts USING fts5(
+                guid UNINDEXED, name, url, path, tokenize='unicode61'
+            );
+        """)
+
+    def close(self):
+        self.conn.close()
+
+    def _current_entries(self, data):
+        """Map guid -> (name, url, path, fingerprint) for the given tree"""
+        entries = {}
+        for node, path, _ in iter_bookmarks(data):
+            guid = node.get('guid') or node.get('id')
+            if not guid:
+                continue
+            name = node.get('name', '')
+            url = node.get('url', '')
+            fingerprint = hashlib.md5(f"{name}\0{url}\0{path}".encode()).hexdigest()
+            entries[guid] = (name, url, path, fingerprint)
+        return entries
+
+    def update(self, data):
+        """Bring the index in line with a bookmark tree, touching only changed rows"""
+        entries = self._current_entries(data)
+        indexed = dict(self.conn.execute("SELECT guid, fingerprint FROM indexed"))
+
+        stale = [guid for guid, fingerprint in indexed.items()
+                 if entries.get(guid, (None,) * 4)[3] != fingerprint]
+        fresh = [guid for guid, entry in entries.items()
+                 if indexed.get(guid) != entry[3]]
+
+        with self.conn:
+            # FTS rows share their rowid with the matching row in `indexed`
+            self.conn.executemany(
+                "DELETE FROM bookmarks_fts WHERE rowid = (SELECT id FROM indexed WHERE guid = ?)",
+                [(guid,) for guid in stale])
+            self.conn.executemany("DELETE FROM indexed WHERE guid = ?",
+                                  [(guid,) for guid in stale])
+            for guid in fresh:
+                name, url, path, fingerprint = entries[guid]
+                row_id = self.conn.execute(
+                    "INSERT INTO indexed (guid, fingerprint) VALUES (?, ?)",
+                    (guid, fingerprint)).lastrowid
+                self.conn.execute(
+                    "INSERT INTO bookmarks_fts (rowid, guid, name, url, path) VALUES (?, ?, ?, ?, ?)",
+                    (row_id, guid, name, url, path))
+
+        removed = len(set(stale) - set(fresh))
+        return len(fresh), removed
+
+    def update_from_file(self, filepath):
+        """Update the index from an exported bookmarks file"""
+        return self.update(load_bookmarks(filepath))
+
+    def rebuild_from_file(self, filepath):
+        """Drop everything and index the file from scratch"""
+        with self.conn:
+            self.conn.execute("DELETE FROM bookmarks_fts")
+            self.conn.execute("DELETE FROM indexed")
+        return self.update_from_file(filepath)
+
+    def search(self, query, limit=20):
+        """Return ranked hits (best first) for a free-text query"""
+        terms = [term.replace('"', '""') for term in query.split()]
+        if not terms:
+            return []
+        match = " ".join(f'"{term}"*' for term in terms)
+
+        rows = self.conn.execute("""
+            SELECT guid, name, url, path, bm25(bookmarks_fts, 0, 10.0, 5.0, 2.0) AS score
+            FROM bookmarks_fts
+            WHERE bookmarks_fts MATCH ?
+            ORDER BY score
+            LIMIT ?
+        """, (match, limit)).fetchall()
+
+        return [
+            {'guid': guid, 'name': name, 'url': url, 'path': path, 'score': -score}
+            for guid, name, url, path, score in rows
+        ]
+
+
+def update_search_index(export_file, db_path=None):
+    """Incrementally refresh the search index after a sync; never raises"""
+    try:
+        index = BookmarkSearchIndex(db_path)
+        try:
+            changed, removed = index.update_from_file(export_file)
+        finally:
+            index.close()
+        if changed or removed:
+            print(f"🔎 Search index updated: {changed} indexed, {removed} removed")
+    except Exception as e:
+        print(f"⚠️ Search index update failed: {e}")
+
+
+def search_bookmarks(query, limit=20, db_path=None):
+    """Search the local bookmark index"""
+    index = BookmarkSearchIndex(db_path)
+    try:
+        return index.search(query, limit)
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    # Usage: python bookmark_search.py <query...>   |   python bookmark_search.py --rebuild
+    export_file = Path.cwd() / "exported_bookmarks" / "Bookmarks_Chrome.json"
+
+    if len(sys.argv) < 2:
+        print("Usage: python bookmark_search.py <query> | --rebuild")
+        sys.exit(1)
+
+    if sys.argv[1] == "--rebuild":
+        index = BookmarkSearchIndex()
+        indexed, _ = index.rebuild_from_file(export_file)
+        index.close()
+        print(f"✅ Indexed {indexed} bookmarks from {export_file}")
+        sys.exit(0)
+
+    if export_file.exists():
+        update_search_index(export_file)
+
+    start = time.perf_counter()
+    hits = search_bookmarks(" ".join(sys.argv[1:]))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    for hit in hits:
+        print(f"🔖 {hit['name']}\n   {hit['url']}\n   📁 {hit['path']}")
+    print(f"\n{len(hits)} hits in {elapsed_ms:.1f} ms")
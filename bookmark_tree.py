@@ -0,0 +1,207 @@
+import json
+import random
+import hashlib
+
+
+BOOKMARK_ROOTS = ['bookmark_bar', 'other', 'synced']
+# Chrome timestamps count microseconds from 1601-01-01, Unix/PRTime ones from 1970
+WEBKIT_EPOCH_OFFSET_US = 11644473600 * 1000000
+
+
+def load_bookmarks(filepath):
+    """Load a Chrome Bookmarks / exported JSON file"""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def iter_bookmarks(data, roots=None):
+    """Yield (node, folder_path, root_name) for every URL bookmark in the tree"""
+    roots = roots or BOOKMARK_ROOTS
+    stack = []
+    for root_name in reversed(roots):
+        root = data.get('roots', {}).get(root_name)
+        if isinstance(root, dict):
+            stack.append((root, root_name, root_name))
+
+    while stack:
+        node, path, root_name = stack.pop()
+        if node.get('type') == 'url':
+            yield node, path, root_name
+            continue
+
+        children = node.get('children')
+        if not isinstance(children, list):
+            continue
+
+        for child in reversed(children):
+            if not isinstance(child, dict):
+                continue
+            if child.get('type') == 'folder':
+                child_path = f"{path}/{child.get('name', '')}"
+            else:
+                child_path = path
+            stack.append((child, child_path, root_name))
+
+
+def index_nodes(data, roots=None):
+    """Map guid -> {parent, index, type, name, url, path} for every node below the roots"""
+    roots = roots or BOOKMARK_ROOTS
+    nodes = {}
+
+    def visit(node, parent, index, path):
+        guid = node.get('guid') or node.get('id')
+        if node.get('type') == 'folder' and parent is not None:
+            path = f"{path}/{node.get('name', '')}"
+        nodes[guid] = {
+            'parent': parent,
+            'index': index,
+            'type': node.get('type'),
+            'name': node.get('name', ''),
+            'url': node.get('url'),
+            'path': path,
+        }
+        for child_index, child in enumerate(node.get('children', [])):
+            if isinstance(child, dict):
+                visit(child, guid, child_index, path)
+
+    for root_name in roots:
+        root = data.get('roots', {}).get(root_name)
+        if isinstance(root, dict):
+            visit(root, None, 0, root_name)
+    return nodes
+
+
+def diff_trees(old_data, new_data):
+    """Compare two trees by guid; returns lists of node records per change kind"""
+    old_nodes = index_nodes(old_data) if old_data else {}
+    new_nodes = index_nodes(new_data) if new_data else {}
+
+    changes = {'added': [], 'removed': [], 'moved': [], 'renamed': [], 'edited': []}
+    for guid, node in new_nodes.items():
+        before = old_nodes.get(guid)
+        if before is None:
+            changes['added'].append(dict(node, guid=guid))
+            continue
+        if before['parent'] != node['parent']:
+            changes['moved'].append(dict(node, guid=guid, old_path=before['path']))
+        if before['name'] != node['name']:
+            changes['renamed'].append(dict(node, guid=guid, old_name=before['name']))
+        if before['url'] != node['url']:
+            changes['edited'].append(dict(node, guid=guid, old_url=before['url']))
+
+    for guid, node in old_nodes.items():
+        if guid not in new_nodes:
+            changes['removed'].append(dict(node, guid=guid))
+    return changes
+
+
+# --- detector stages (module level so a worker process can run them) -------
+
+def extract_structure(data):
+    """Only URLs, names and folder structure of the bookmark roots"""
+    def extract_from_node(node):
+        if not isinstance(node, dict):
+            return None
+
+        result = {}
+        if 'type' in node:
+            result['type'] = node['type']
+        if 'name' in node:
+            result['name'] = node['name']
+        # Include URL only for actual bookmarks (not folders)
+        if 'url' in node and node.get('type') == 'url':
+            result['url'] = node['url']
+
+        if 'children' in node and isinstance(node['children'], list):
+            children = []
+            for child in node['children']:
+                child_result = extract_from_node(child)
+                if child_result:
+                    children.append(child_result)
+            if children:
+                result['children'] = children
+        return result
+
+    if 'roots' not in data:
+        return {}
+
+    extracted = {'roots': {}}
+    for root_name, root_data in data['roots'].items():
+        if root_name in BOOKMARK_ROOTS:
+            extracted_root = extract_from_node(root_data)
+            if extracted_root:
+                extracted['roots'][root_name] = extracted_root
+    return extracted
+
+
+def structure_hash(data):
+    """MD5 of extract_structure(data); ignores ids, dates and other metadata"""
+    return hashlib.md5(json.dumps(extract_structure(data), sort_keys=True).encode()).hexdigest()
+
+
+def count_url_nodes(data):
+    """Number of URL bookmarks below the roots"""
+    count = 0
+    stack = [data.get('roots', {})]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, dict):
+            continue
+        if node.get('type') == 'url':
+            count += 1
+        if 'children' in node:
+            stack.extend(node['children'])
+        # The roots object itself has neither type nor children
+        if not node.get('type') and not node.get('children'):
+            stack.extend(value for value in node.values() if isinstance(value, dict))
+    return count
+
+
+def core_bookmark_hash(data):
+    """MD5 of the sorted (path, name, url) records of every bookmark and folder"""
+    core_data = []
+
+    def extract_core(node, path=""):
+        if not isinstance(node, dict):
+            return
+        if node.get('type') == 'url':
+            core_data.append({'url': node.get('url', ''), 'name': node.get('name', ''), 'path': path})
+        elif node.get('type') == 'folder':
+            folder_path = f"{path}/{node.get('name', '')}" if path else node.get('name', '')
+            core_data.append({'type': 'folder', 'name': node.get('name', ''), 'path': folder_path})
+            for child in node.get('children', []):
+                extract_core(child, folder_path)
+        elif 'children' in node:
+            for child in node['children']:
+                extract_core(child, path)
+        elif not node.get('type'):
+            # Root level processing
+            for key, value in node.items():
+                if key in BOOKMARK_ROOTS and isinstance(value, dict):
+                    extract_core(value, key)
+
+    if 'roots' in data:
+        extract_core(data['roots'])
+
+    # Sort for consistent hashing
+    core_data.sort(key=lambda x: (x.get('path', ''), x.get('name', ''), x.get('url', '')))
+    return hashlib.md5(json.dumps(core_data, sort_keys=True).encode()).hexdigest()
+
+
+def synthetic_bookmarks(count, seed=1):
+    """Deterministic tree of count URL bookmarks in folders of 200, for benchmarks"""
+    rng = random.Random(seed)
+    folders = []
+    for f in range(max(1, count // 200)):
+        children = [{
+            'date_added': str(13300000000000000 + rng.randint(0, 10 ** 12)),
+            'guid': f"{rng.getrandbits(128):032x}",
+            'id': str(f * 1000 + b),
+            'name': f"Bookmark {f}-{b} " + "".join(rng.choice("abcdefgh ") for _ in range(20)),
+            'type': 'url',
+            'url': f"https://example{rng.randint(0, 5000)}.com/path/{rng.getrandbits(40):x}",
+        } for b in range(200)]
+        folders.append({'children': children, 'guid': f"{rng.getrandbits(128):032x}",
+                        'id': str(f), 'name': f"Folder {f}", 'type': 'folder'})
+    return {'roots': {'bookmark_bar': {'children': folders, 'name': 'Bookmarks bar', 'type': 'folder'}},
+            'version': 1}
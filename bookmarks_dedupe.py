@@ -0,0 +1,193 @@
+import sys
+import json
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from bookmark_tree import load_bookmarks, iter_bookmarks
+from bookmarks_export import get_chrome_profile_bookmark_paths
+
+
+# Query parameters that only carry tracking information
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'mc_cid', 'mc_eid',
+    '_ga', '_gl', 'igshid', 'ref_src', 'spm',
+}
+TRACKING_PREFIXES = ('utm_', 'pk_', 'hsa_')
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def _is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def canonicalize_url(url):
+    """Canonical form used for exact duplicate detection"""
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url
+
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS:
+        return url.strip()
+
+    host = (parts.hostname or '').rstrip('.')
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host if port in (None, DEFAULT_PORTS[scheme]) else f"{host}:{port}"
+
+    path = parts.path or '/'
+    if len(path) > 1:
+        path = path.rstrip('/')
+
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if not _is_tracking_param(k)]
+    query.sort()
+
+    # Keep client-side routes (#/inbox, #!/page), drop plain anchors
+    fragment = parts.fragment if parts.fragment.startswith(('/', '!')) else ''
+
+    return urlunsplit((scheme, netloc, path, urlencode(query), fragment))
+
+
+def near_duplicate_key(canonical_url):
+    """Looser key: ignores scheme, www. prefix, query string and fragment"""
+    parts = urlsplit(canonical_url)
+    if parts.scheme not in DEFAULT_PORTS:
+        return canonical_url
+    host = parts.netloc[4:] if parts.netloc.startswith('www.') else parts.netloc
+    return f"{host}{parts.path.lower()}"
+
+
+def canonicalize_urls(urls):
+    """Canonicalize a batch of URLs, processing each distinct URL only once"""
+    unique = set(urls)
+    return {url: canonicalize_url(url) for url in unique}
+
+
+def collect_entries(sources):
+    """Flatten bookmark files into a list of entry dicts tagged with their source"""
+    entries = []
+    for source in sources:
+        try:
+            data = load_bookmarks(source)
+        except Exception as e:
+            print(f"❌ Could not read {source}: {e}")
+            continue
+
+        for node, path, _ in iter_bookmarks(data):
+            entries.append({
+                'source': str(source),
+                'id': node.get('id'),
+                'guid': node.get('guid'),
+                'name': node.get('name', ''),
+                'url': node.get('url', ''),
+                'path': path,
+                'date_added': node.get('date_added', '0'),
+            })
+    return entries
+
+
+def find_duplicates(entries):
+    """Group entries into exact and near duplicate groups using hash indexes"""
+    canonical = canonicalize_urls(entry['url'] for entry in entries)
+
+    exact_index = {}
+    for entry in entries:
+        exact_index.setdefault(canonical[entry['url']], []).append(entry)
+
+    near_index = {}
+    for canonical_url in exact_index:
+        near_index.setdefault(near_duplicate_key(canonical_url), []).append(canonical_url)
+
+    exact_groups = [
+        {'canonical_url': url, 'entries': group}
+        for url, group in exact_index.items() if len(group) > 1
+    ]
+    near_groups = [
+        {
+            'key': key,
+            'canonical_urls': urls,
+            'entries': [entry for url in urls for entry in exact_index[url]],
+        }
+        for key, urls in near_index.items() if len(urls) > 1
+    ]
+    return exact_groups, near_groups
+
+
+def build_merge_plan(exact_groups, source):
+    """Plan removal of exact duplicates in one file, keeping the oldest bookmark"""
+    remove = []
+    for group in exact_groups:
+        local = [entry for entry in group['entries'] if entry['source'] == str(source)]
+        if len(local) < 2:
+            continue
+        local.sort(key=lambda entry: int(entry['date_added'] or 0))
+        remove.extend(entry['guid'] for entry in local[1:] if entry['guid'])
+    return {'source': str(source), 'remove': remove}
+
+
+def apply_merge_plan(data, plan):
+    """Remove the planned duplicate bookmarks from a bookmark tree in place"""
+    remove = set(plan.get('remove', []))
+    removed = 0
+
+    def prune(node):
+        nonlocal removed
+        children = node.get('children')
+        if not isinstance(children, list):
+            return
+        kept = []
+        for child in children:
+            if isinstance(child, dict) and child.get('type') == 'url' and child.get('guid') in remove:
+                removed += 1
+                continue
+            if isinstance(child, dict):
+                prune(child)
+            kept.append(child)
+        node['children'] = kept
+
+    for root in data.get('roots', {}).values():
+        if isinstance(root, dict):
+            prune(root)
+    return removed
+
+
+def dedupe(sources, report_file, merge_plan_file=None):
+    """Write a duplicate report (and optionally a merge plan for the first source)"""
+    entries = collect_entries(sources)
+    exact_groups, near_groups = find_duplicates(entries)
+
+    report = {
+        'sources': [str(source) for source in sources],
+        'bookmarks': len(entries),
+        'exact_duplicate_groups': exact_groups,
+        'near_duplicate_groups': near_groups,
+    }
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    redundant = sum(len(group['entries']) - 1 for group in exact_groups)
+    print(f"📊 {len(entries)} bookmarks, {len(exact_groups)} exact groups "
+          f"({redundant} redundant), {len(near_groups)} near groups")
+    print(f"📝 Report: {report_file}")
+
+    if merge_plan_file:
+        plan = build_merge_plan(exact_groups, sources[0])
+        with open(merge_plan_file, 'w', encoding='utf-8') as f:
+            json.dump(plan, f, indent=2)
+        print(f"🧹 Merge plan ({len(plan['remove'])} removals): {merge_plan_file}")
+
+    return report
+
+
+if __name__ == "__main__":
+    # Usage: python bookmarks_dedupe.py [--profiles] [--merge-plan]
+    sources = [Path.cwd() / "exported_bookmarks" / "Bookmarks_Chrome.json"]
+    if "--profiles" in sys.argv:
+        sources += get_chrome_profile_bookmark_paths()
+
+    merge_plan_file = Path.cwd() / "dedupe_merge_plan.json" if "--merge-plan" in sys.argv else None
+    dedupe(sources, Path.cwd() / "dedupe_report.json", merge_plan_file)
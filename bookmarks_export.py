@@ -1,6 +1,6 @@
 # bookmarks_export.py
 import os
-import shutil
+import json
 import platform
 from datetime import datetime
 from pathlib import Path
@@ -21,13 +21,70 @@ def get_chrome_bookmarks_path():
         raise Exception("Unsupported OS")
 
 
-def export_bookmarks(export_path):
-    bookmarks_file = get_chrome_bookmarks_path()
+def get_state_dir():
+    """Get the local (never synced) directory for sync state, caches and indexes"""
+    state_dir = Path(os.environ.get("BOOKMARKS_SYNC_STATE_DIR", Path.home() / ".bookmarks_sync"))
+    state_dir.mkdir(parents=True, exist_ok=True)
+    return state_dir
+
+
+def get_device_id():
+    """Stable name of this machine, used to tag sync data it produces"""
+    return os.environ.get("BOOKMARKS_SYNC_DEVICE") or platform.node() or "unknown-device"
+
+
+def get_chrome_profile_bookmark_paths():
+    """Get Bookmarks files of every local Chrome profile (Default, Profile 1, ...)"""
+    user_data_dir = get_chrome_bookmarks_path().parent.parent
+    if not user_data_dir.exists():
+        return []
+
+    paths = []
+    for profile_dir in sorted(user_data_dir.iterdir()):
+        if profile_dir.name != "Default" and not profile_dir.name.startswith("Profile "):
+            continue
+        bookmarks_file = profile_dir / "Bookmarks"
+        if bookmarks_file.exists():
+            paths.append(bookmarks_file)
+    return paths
+
+
+def export_bookmarks(export_path, bookmarks_file=None):
+    bookmarks_file = Path(bookmarks_file) if bookmarks_file else get_chrome_bookmarks_path()
     export_path = Path(export_path).expanduser()
     export_path.mkdir(parents=True, exist_ok=True)
     export_file = export_path / f"Bookmarks_Chrome.json"
-    shutil.copy2(bookmarks_file, export_file)
-    print(f"✅ Exported: {export_file}")
+
+    # Subscribers to the change feed get typed events diffed against the previous export
+    from change_feed import get_change_feed
+    feed = get_change_feed()
+    previous = feed.previous_snapshot(export_file)
+
+    from sync_filters import load_sync_filter
+    sync_filter = load_sync_filter()
+    if sync_filter is not None:
+        # Selective sync: only the in-scope part of the tree leaves this machine,
+        # merged into the export so other machines' folders stay in it
+        from chrome_checksum import read_bookmarks_consistent
+        from sync_filters import scope_to_shared
+        try:
+            with open(export_file, 'r', encoding='utf-8') as f:
+                shared = json.load(f)
+        except (OSError, ValueError):
+            shared = None
+        filtered = scope_to_shared(read_bookmarks_consistent(bookmarks_file), shared, sync_filter)
+        with open(export_file, 'w', encoding='utf-8') as f:
+            json.dump(filtered, f, indent=3, ensure_ascii=False)
+        print(f"✅ Exported (filtered): {export_file}")
+    else:
+        from fast_copy import fast_copy
+        method = fast_copy(bookmarks_file, export_file)
+        if method == 'skipped':
+            print(f"📄 Export already up to date: {export_file}")
+        else:
+            print(f"✅ Exported: {export_file} ({method})")
+
+    feed.publish_export(previous, export_file)
     return export_file
 
 
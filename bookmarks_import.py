@@ -1,9 +1,9 @@
 # bookmarks_import.py
 import os
-import shutil
 import platform
 from datetime import datetime
 from pathlib import Path
+from fast_copy import fast_copy
 
 
 def get_chrome_bookmarks_path():
@@ -22,16 +22,22 @@ def get_chrome_bookmarks_path():
 
 
 def import_bookmarks(import_file):
+    """Replace Chrome's bookmarks with import_file; returns True once imported"""
     import_file = Path(import_file).expanduser()
     if not import_file.exists():
         print(f"❌ Import file not found: {import_file}")
-        return
+        return False
 
     bookmarks_file = get_chrome_bookmarks_path()
 
+    # With selective sync rules, out-of-scope local folders are kept
+    from sync_filters import apply_sync_filter_file
+    import_file = apply_sync_filter_file(import_file, bookmarks_file)
+
     # Replace with synced bookmarks
-    shutil.copy2(import_file, bookmarks_file)
-    print(f"✅ Imported bookmarks from: {import_file}")
+    method = fast_copy(import_file, bookmarks_file)
+    print(f"✅ Imported bookmarks from: {import_file} ({method})")
+    return True
 
 
 if __name__ == "__main__":
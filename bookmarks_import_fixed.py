@@ -1,10 +1,13 @@
 import os
-import shutil
+import json
 import platform
+import tempfile
 import time
 import psutil
 from datetime import datetime
 from pathlib import Path
+from chrome_checksum import set_checksum
+from fast_copy import fast_copy, backup_file, same_contents
 
 
 def get_chrome_bookmarks_path():
@@ -59,15 +62,20 @@ def safe_copy_bookmarks(source, destination, max_retries=3):
             if not wait_for_file_access(source):
                 raise PermissionError(f"Cannot access source file: {source}")
             
-            # Create backup of destination if it exists
+            # Nothing to write if the destination already has these bytes
+            if destination.exists() and same_contents(source, destination):
+                print("📄 Bookmarks already up to date, skipping copy")
+                return True
+
+            # Create backup of destination if it exists (a hard link: the copy below gets a new inode)
             if destination.exists():
                 backup_path = destination.with_suffix('.backup')
-                shutil.copy2(destination, backup_path)
+                backup_file(destination, backup_path)
                 print(f"📋 Created backup: {backup_path}")
             
             # Perform the copy
-            shutil.copy2(source, destination)
-            print(f"✅ Successfully copied bookmarks")
+            method = fast_copy(source, destination, skip_unchanged=False)
+            print(f"✅ Successfully copied bookmarks ({method})")
             return True
             
         except (PermissionError, OSError) as e:
@@ -80,13 +88,50 @@ def safe_copy_bookmarks(source, destination, max_retries=3):
     return False
 
 
-def import_bookmarks(import_file):
+def apply_merge_plan_file(import_file, merge_plan_file):
+    """Write a deduplicated copy of the import file using a dedupe merge plan"""
+    from bookmarks_dedupe import apply_merge_plan
+
+    with open(merge_plan_file, 'r', encoding='utf-8') as f:
+        plan = json.load(f)
+    with open(import_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    removed = apply_merge_plan(data, plan)
+    set_checksum(data)  # Chrome flags a stale checksum as corruption
+    deduped_file = Path(tempfile.gettempdir()) / f"{import_file.stem}.deduped.json"
+    with open(deduped_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=3, ensure_ascii=False)
+    print(f"🧹 Removed {removed} duplicate bookmarks before import")
+    return deduped_file
+
+
+def import_bookmarks(import_file, merge_plan_file=None, defer=None):
+    """Import a synced snapshot into Chrome.
+
+    With defer (default: BOOKMARKS_SYNC_DEFER_IMPORT) and Chrome running, the
+    snapshot is queued and applied once Chrome exits instead of being
+    overwritten from Chrome's memory.
+    """
     import_file = Path(import_file).expanduser()
     if not import_file.exists():
         print(f"❌ Import file not found: {import_file}")
         return False
 
+    if merge_plan_file:
+        import_file = apply_merge_plan_file(import_file, Path(merge_plan_file).expanduser())
+
+    from deferred_import import defer_enabled, defer_import
+    if (defer_enabled() if defer is None else defer) and is_chrome_running():
+        # Selective sync is applied at apply time, against the file Chrome leaves behind
+        defer_import(import_file)
+        return True
+
     bookmarks_file = get_chrome_bookmarks_path()
+
+    # With selective sync rules, out-of-scope local folders are kept
+    from sync_filters import apply_sync_filter_file
+    import_file = apply_sync_filter_file(import_file, bookmarks_file)
     
     # Check if Chrome is running and warn user
     if is_chrome_running():
@@ -0,0 +1,175 @@
+import os
+import sys
+import json
+import hashlib
+import tempfile
+from pathlib import Path
+from bookmark_tree import load_bookmarks
+from chrome_checksum import set_checksum
+from bookmarks_export import get_chrome_bookmarks_path
+from sync_filters import load_sync_filter, scope_to_shared
+
+
+MANIFEST_NAME = "manifest.json"
+
+
+def _shard_name(root_name, folder=None):
+    if folder is None:
+        return f"{root_name}.json"
+    key = folder.get('guid') or folder.get('id')
+    return f"{root_name}__{key}.json"
+
+
+def _serialize(obj):
+    return json.dumps(obj, indent=1, ensure_ascii=False).encode('utf-8')
+
+
+def split_into_shards(data):
+    """Split a bookmark tree into one shard per root plus one per top-level folder"""
+    shards = {}
+    for root_name, root in data.get('roots', {}).items():
+        if not isinstance(root, dict):
+            continue
+
+        root_shard = {key: value for key, value in root.items() if key != 'children'}
+        root_shard['children'] = []
+        for child in root.get('children', []):
+            if isinstance(child, dict) and child.get('type') == 'folder':
+                name = _shard_name(root_name, child)
+                shards[name] = child
+                root_shard['children'].append({'shard': name})
+            else:
+                root_shard['children'].append(child)
+        shards[_shard_name(root_name)] = root_shard
+
+    manifest = {
+        'format': 1,
+        'roots': list(data.get('roots', {}).keys()),
+        'meta': {key: value for key, value in data.items() if key != 'roots'},
+    }
+    return manifest, shards
+
+
+def assemble_shards(shard_dir, load_shard=None):
+    """Rebuild the full bookmark tree from a shard directory.
+
+    load_shard(name) -> parsed JSON reads the manifest and shards from
+    elsewhere (e.g. a git revision) instead of shard_dir.
+    """
+    shard_dir = Path(shard_dir)
+
+    if load_shard is None:
+        def load_shard(name):
+            with open(shard_dir / name, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+    manifest = load_shard(MANIFEST_NAME)
+
+    data = dict(manifest.get('meta', {}))
+    data['roots'] = {}
+    for root_name in manifest['roots']:
+        root = load_shard(_shard_name(root_name))
+        root['children'] = [
+            load_shard(child['shard']) if 'shard' in child else child
+            for child in root.get('children', [])
+        ]
+        data['roots'][root_name] = root
+    return data
+
+
+def export_sharded(export_path, bookmarks_file=None):
+    """Export as shards, writing only shards whose content changed.
+
+    Returns the list of written or deleted paths so callers can stage just those.
+    """
+    bookmarks_file = bookmarks_file or get_chrome_bookmarks_path()
+    shard_dir = Path(export_path).expanduser() / "shards"
+    shard_dir.mkdir(parents=True, exist_ok=True)
+
+    # Change feed subscribers get events diffed against the shards being replaced
+    from change_feed import get_change_feed
+    feed = get_change_feed()
+
+    data = load_bookmarks(bookmarks_file)
+    sync_filter = load_sync_filter()
+    shared = None
+    if sync_filter is not None or feed.active():
+        try:
+            shared = assemble_shards(shard_dir)
+        except (OSError, ValueError, KeyError):
+            shared = None
+    if sync_filter is not None:
+        # Same rule as the single-file export: replace only our in-scope part of the shared tree
+        data = scope_to_shared(data, shared, sync_filter)
+
+    changed, total = write_shards(shard_dir, data)
+    print(f"✅ Exported shards: {len(changed)} files changed, {total} shards total ({shard_dir})")
+    if changed:
+        feed.publish_trees(shared, data)
+    return changed
+
+
+def _write_atomic(path, payload):
+    """Readers (git add, a concurrent import) never see a half-written file"""
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(payload)
+    os.replace(tmp, path)
+
+
+def write_shards(shard_dir, data):
+    """Write data as shards plus manifest, touching only shards whose content changed.
+
+    Returns (written or deleted paths, shard count).
+    """
+    shard_dir = Path(shard_dir)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    manifest_file = shard_dir / MANIFEST_NAME
+    try:
+        old_hashes = load_bookmarks(manifest_file).get('shards', {})
+    except (OSError, ValueError):
+        old_hashes = {}  # Missing, or left with conflict markers by a merge
+
+    manifest, shards = split_into_shards(data)
+
+    changed = []
+    new_hashes = {}
+    for name, shard in shards.items():
+        payload = _serialize(shard)
+        digest = hashlib.sha256(payload).hexdigest()
+        new_hashes[name] = digest
+        if old_hashes.get(name) != digest or not (shard_dir / name).exists():
+            _write_atomic(shard_dir / name, payload)
+            changed.append(shard_dir / name)
+
+    on_disk = {path.name for path in shard_dir.glob("*.json")} - {MANIFEST_NAME}
+    for name in (set(old_hashes) | on_disk) - set(new_hashes):
+        stale = shard_dir / name
+        if stale.exists():
+            stale.unlink()
+        changed.append(stale)
+
+    manifest['shards'] = dict(sorted(new_hashes.items()))
+    manifest_payload = _serialize(manifest)
+    if not manifest_file.exists() or manifest_file.read_bytes() != manifest_payload:
+        _write_atomic(manifest_file, manifest_payload)
+        changed.append(manifest_file)
+    return changed, len(shards)
+
+
+def import_sharded(shard_dir):
+    """Reassemble the shard directory and import it into Chrome"""
+    from bookmarks_import_fixed import import_bookmarks
+
+    data = set_checksum(assemble_shards(shard_dir))
+    assembled_file = Path(tempfile.gettempdir()) / "Bookmarks_Chrome.assembled.json"
+    _write_atomic(assembled_file, json.dumps(data, indent=3, ensure_ascii=False).encode('utf-8'))
+    return import_bookmarks(assembled_file)
+
+
+if __name__ == "__main__":
+    # Usage: python bookmarks_shards.py export | import
+    export_dir = Path.cwd() / "exported_bookmarks"
+    if len(sys.argv) > 1 and sys.argv[1] == "import":
+        import_sharded(export_dir / "shards")
+    else:
+        export_sharded(export_dir)
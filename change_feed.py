@@ -0,0 +1,287 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from collections import namedtuple
+from bookmark_tree import diff_trees, load_bookmarks
+from bookmarks_export import get_state_dir, get_device_id
+
+
+# kind: add | remove | move | rename | edit
+ChangeEvent = namedtuple('ChangeEvent', ['seq', 'kind', 'guid', 'type', 'name', 'url', 'path',
+                                         'old_path', 'old_name', 'old_url', 'source', 'device', 'timestamp'])
+
+DIFF_KINDS = {'added': 'add', 'removed': 'remove', 'moved': 'move', 'renamed': 'rename', 'edited': 'edit'}
+QUEUE_SIZE = 1000
+DEFAULT_TCP_ADDRESS = "127.0.0.1:8765"  # Windows has no Unix sockets
+BLOCK_TIMEOUT = 5.0  # How long a publisher waits on a full subscriber queue before dropping its oldest events
+
+
+class Subscription:
+    """Bounded queue of ChangeEvents on the subscriber's event loop.
+
+    A full queue blocks the publisher for up to BLOCK_TIMEOUT; after that the
+    oldest events are dropped and counted in `dropped` (resync from the export).
+    """
+
+    def __init__(self, feed, loop, maxsize=QUEUE_SIZE):
+        self.feed = feed
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def _put_dropping_oldest(self, event):
+        """put_nowait; a full queue makes room by dropping its oldest event"""
+        while True:
+            try:
+                self.queue.put_nowait(event)
+                return
+            except asyncio.QueueFull:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except asyncio.QueueEmpty:
+                    pass  # Drained meanwhile; try again
+
+    async def _offer(self, events, timeout):
+        # One deadline for the whole batch: once it passed, the rest drop without waiting
+        deadline = self.loop.time() + timeout
+        for event in events:
+            try:
+                self.queue.put_nowait(event)
+                continue
+            except asyncio.QueueFull:
+                pass
+            remaining = deadline - self.loop.time()
+            if remaining > 0:
+                try:
+                    await asyncio.wait_for(self.queue.put(event), remaining)
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+            self._put_dropping_oldest(event)
+
+    def _offer_nowait(self, events):
+        for event in events:
+            self._put_dropping_oldest(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.queue.get()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.feed.unsubscribe(self)
+
+
+class ChangeFeed:
+    """Structured bookmark change events for in-process subscribers and the NDJSON socket"""
+
+    def __init__(self):
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.server = None
+
+    def active(self):
+        return bool(self.subscribers)
+
+    def subscribe(self, maxsize=QUEUE_SIZE):
+        """Call from a coroutine; events arrive on that coroutine's event loop"""
+        subscription = Subscription(self, asyncio.get_running_loop(), maxsize)
+        with self.lock:
+            self.subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            if subscription in self.subscribers:
+                self.subscribers.remove(subscription)
+
+    def events_from_diff(self, changes, source):
+        events = []
+        now = time.time()
+        device = get_device_id()
+        for diff_kind, kind in DIFF_KINDS.items():
+            for node in changes.get(diff_kind, []):
+                with self.lock:
+                    self.seq += 1
+                    seq = self.seq
+                events.append(ChangeEvent(seq, kind, node['guid'], node['type'], node['name'], node.get('url'),
+                                          node['path'], node.get('old_path'), node.get('old_name'),
+                                          node.get('old_url'), source, device, now))
+        return events
+
+    def publish(self, events):
+        """Deliver events to every subscriber; may block (see Subscription) when one is slow"""
+        if not events:
+            return
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is subscription.loop:
+                # Blocking here would deadlock the subscriber's own loop
+                subscription._offer_nowait(events)
+                continue
+            try:
+                asyncio.run_coroutine_threadsafe(subscription._offer(events, BLOCK_TIMEOUT), subscription.loop).result()
+            except RuntimeError:
+                self.unsubscribe(subscription)  # Its loop is gone
+
+    def previous_snapshot(self, export_file):
+        """The export as it was before being overwritten, if anyone is listening"""
+        if not self.active() or not export_file.exists():
+            return None
+        try:
+            return load_bookmarks(export_file)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def publish_export(self, previous, export_file, source='export'):
+        if not self.active():
+            return []
+        return self.publish_trees(previous, load_bookmarks(export_file), source)
+
+    def publish_trees(self, previous, current, source='export'):
+        """Events for exports that are not a single file (shards, op logs), diffed as trees"""
+        if not self.active():
+            return []
+        events = self.events_from_diff(diff_trees(previous, current), source)
+        self.publish(events)
+        return events
+
+    def start_server(self, address=None):
+        """Serve the feed as NDJSON on a Unix socket (or host:port) in a background thread"""
+        if self.server is not None:
+            return self.server
+        self.server = FeedServer(self, address or default_address())
+        self.server.start()
+        return self.server
+
+
+def default_address():
+    """BOOKMARKS_SYNC_FEED, else a socket in the state dir (loopback TCP on Windows)"""
+    if os.environ.get("BOOKMARKS_SYNC_FEED"):
+        return os.environ["BOOKMARKS_SYNC_FEED"]
+    return DEFAULT_TCP_ADDRESS if os.name == 'nt' else str(get_state_dir() / "change_feed.sock")
+
+
+def _address(address):
+    host, _, port = address.rpartition(":")
+    if port.isdigit() and not address.startswith("/"):
+        return host or "127.0.0.1", int(port)
+    if os.name == 'nt':
+        raise ValueError(f"Change feed address must be host:port on Windows, not {address!r}")
+    return address
+
+
+class FeedServer:
+    """One line of JSON per ChangeEvent to each connected client; {"kind": "lagged"} after drops"""
+
+    def __init__(self, feed, address):
+        self.feed = feed
+        self.address = _address(address)
+        self.loop = None
+        self.server = None
+        self.ready = threading.Event()
+        self.clients = 0
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        self.ready.wait()
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        if isinstance(self.address, tuple):
+            self.server = self.loop.run_until_complete(asyncio.start_server(self._client, *self.address))
+        else:
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+            self.server = self.loop.run_until_complete(asyncio.start_unix_server(self._client, self.address))
+        print(f"📡 Change feed on {self.address}")
+        self.ready.set()
+        self.loop.run_forever()
+
+    async def _client(self, reader, writer):
+        self.clients += 1
+        subscription = self.feed.subscribe()
+        pump = asyncio.ensure_future(self._pump(subscription, writer))
+        hangup = asyncio.ensure_future(reader.read())  # Clients don't send anything; EOF means they left
+        try:
+            await asyncio.wait([pump, hangup], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            pump.cancel()
+            hangup.cancel()
+            subscription.close()
+            self.clients -= 1
+            writer.close()
+
+    async def _pump(self, subscription, writer):
+        reported = 0
+        try:
+            async for event in subscription:
+                if subscription.dropped > reported:
+                    writer.write(json.dumps({'kind': 'lagged', 'dropped': subscription.dropped - reported}).encode() + b"\n")
+                    reported = subscription.dropped
+                writer.write(json.dumps(event._asdict(), ensure_ascii=False).encode() + b"\n")
+                await writer.drain()  # A slow reader fills its queue, which pushes back on the publisher
+        except (ConnectionError, BrokenPipeError):
+            pass
+
+_feed = ChangeFeed()
+
+
+def get_change_feed():
+    return _feed
+
+
+def maybe_start_feed_server():
+    """Start the NDJSON socket if BOOKMARKS_SYNC_FEED is set (a socket path or host:port)"""
+    if os.environ.get("BOOKMARKS_SYNC_FEED"):
+        _feed.start_server()
+
+
+async def tail(address):
+    address = _address(address)
+    if isinstance(address, tuple):
+        reader, _ = await asyncio.open_connection(*address)
+    else:
+        reader, _ = await asyncio.open_unix_connection(address)
+    while line := await reader.readline():
+        event = json.loads(line)
+        if event['kind'] == 'lagged':
+            print(f"⚠️ Missed {event['dropped']} events")
+        else:
+            print(f"{event['seq']:>6} {event['kind']:<6} {event['path']} | {event['name']} {event['url'] or ''}")
+
+
+if __name__ == "__main__":
+    # Usage: python change_feed.py tail [socket path | host:port]
+    #        python change_feed.py diff <old export> <new export>   (events between two snapshots, as NDJSON)
+    if len(sys.argv) > 1 and sys.argv[1] == "tail":
+        try:
+            asyncio.run(tail(sys.argv[2] if len(sys.argv) > 2 else default_address()))
+        except KeyboardInterrupt:
+            pass
+    elif len(sys.argv) > 3 and sys.argv[1] == "diff":
+        changes = diff_trees(load_bookmarks(sys.argv[2]), load_bookmarks(sys.argv[3]))
+        for event in _feed.events_from_diff(changes, 'diff'):
+            print(json.dumps(event._asdict(), ensure_ascii=False))
+    else:
+        print("Usage: python change_feed.py tail [address] | diff <old> <new>")
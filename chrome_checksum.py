@@ -0,0 +1,90 @@
+import sys
+import json
+import time
+import hashlib
+from pathlib import Path
+
+
+# Same root order Chrome's BookmarkCodec uses when it computes the checksum
+CHECKSUM_ROOTS = ['bookmark_bar', 'other', 'synced']
+_URL = b"url"
+_FOLDER = b"folder"
+
+
+class TornReadError(ValueError):
+    """Bookmarks file could not be read consistently (mid-write or corrupt)"""
+
+
+def compute_checksum(data):
+    """MD5 Chrome stores in the Bookmarks file.
+
+    Every node contributes its id, its title as UTF-16LE, then "url" plus the URL
+    or "folder" followed by its children, in document order.
+    """
+    md5 = hashlib.md5()
+    update = md5.update
+    stack = []
+    roots = data.get('roots', {})
+    for root_name in reversed(CHECKSUM_ROOTS):
+        if isinstance(roots.get(root_name), dict):
+            stack.append(roots[root_name])
+
+    # Iterative pre-order walk: deep folder trees never hit the recursion limit
+    while stack:
+        node = stack.pop()
+        update(str(node.get('id', '')).encode('utf-8'))
+        update(node.get('name', '').encode('utf-16-le'))
+        if node.get('type') == 'url':
+            update(_URL)
+            update(node.get('url', '').encode('utf-8'))
+        else:
+            update(_FOLDER)
+            stack.extend(reversed([child for child in node.get('children', []) if isinstance(child, dict)]))
+    return md5.hexdigest()
+
+
+def set_checksum(data):
+    """Store a correct checksum on a merged or rewritten tree before it goes to Chrome"""
+    data['checksum'] = compute_checksum(data)
+    return data
+
+
+def verify_checksum(data):
+    """True when the embedded checksum matches (files without one are accepted)"""
+    expected = data.get('checksum')
+    return expected is None or expected == compute_checksum(data)
+
+
+def read_bookmarks_consistent(filepath, retries=5, delay=0.2):
+    """Parse a Bookmarks file, retrying while Chrome is still writing it.
+
+    A read counts as consistent when the JSON parses and the embedded checksum
+    matches; otherwise it is retried. Raises TornReadError if it never settles.
+    """
+    last_error = None
+    for attempt in range(retries):
+        try:
+            with open(filepath, 'rb') as f:
+                data = json.loads(f.read().decode('utf-8'))
+            if verify_checksum(data):
+                return data
+            last_error = "checksum mismatch"
+        except (ValueError, UnicodeDecodeError) as e:
+            last_error = e
+        if attempt < retries - 1:
+            time.sleep(delay)
+    raise TornReadError(f"Inconsistent read of {filepath} after {retries} attempts: {last_error}")
+
+
+if __name__ == "__main__":
+    # Usage: python chrome_checksum.py <Bookmarks file>   (verify and time the checksum)
+    if len(sys.argv) < 2:
+        print("Usage: python chrome_checksum.py <Bookmarks file>")
+        sys.exit(1)
+    with open(Path(sys.argv[1]), 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    start = time.perf_counter()
+    checksum = compute_checksum(data)
+    elapsed = (time.perf_counter() - start) * 1000
+    status = "✅ matches" if data.get('checksum') == checksum else f"❌ stored {data.get('checksum')}"
+    print(f"🔐 {checksum} ({elapsed:.1f} ms) {status}")
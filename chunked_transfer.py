@@ -0,0 +1,215 @@
+import os
+import sys
+import json
+import time
+import random
+import struct
+import hashlib
+from pathlib import Path
+from bookmark_tree import synthetic_bookmarks
+from bookmarks_export import get_state_dir
+
+
+MIN_CHUNK = 2 * 1024
+AVG_CHUNK_BITS = 13  # 8 KiB average
+MAX_CHUNK = 64 * 1024
+
+# Gear table for the rolling hash; fixed seed so every host cuts identically
+_rng = random.Random(0x6B6D)
+GEAR = [_rng.getrandbits(64) for _ in range(256)]
+MASK64 = (1 << 64) - 1
+
+
+def chunk_boundaries(data, min_size=MIN_CHUNK, avg_bits=AVG_CHUNK_BITS, max_size=MAX_CHUNK):
+    """Content-defined chunk end offsets using a gear rolling hash.
+
+    A boundary is cut where the top avg_bits bits of the hash are zero, so an edit
+    only moves the boundaries of the chunks around it.
+    """
+    mask = ((1 << avg_bits) - 1) << (64 - avg_bits)
+    gear = GEAR
+    ends = []
+    start = 0
+    size = len(data)
+    while start < size:
+        end = min(start + max_size, size)
+        i = start + min_size
+        if i >= end:
+            ends.append(end)
+            start = end
+            continue
+        h = 0
+        while i < end:
+            h = ((h << 1) + gear[data[i]]) & MASK64
+            i += 1
+            if not h & mask:
+                break
+        ends.append(i)
+        start = i
+    return ends
+
+
+class ChunkStore:
+    """Content-addressed chunk directory (sha256, two-level fan-out)"""
+
+    def __init__(self, root=None):
+        self.root = Path(root) if root else get_state_dir() / "chunks"
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, digest):
+        return self.root / digest[:2] / digest[2:]
+
+    def has(self, digest):
+        return self._path(digest).exists()
+
+    def put(self, digest, data):
+        path = self._path(digest)
+        if path.exists():
+            return False
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        return True
+
+    def get(self, digest):
+        return self._path(digest).read_bytes()
+
+
+def build_manifest(filepath, store=None):
+    """Chunk a file; returns its manifest and stores the chunks if a store is given"""
+    return chunk_bytes(Path(filepath).read_bytes(), store)
+
+
+def chunk_bytes(data, store=None):
+    """Manifest for an in-memory payload; stores the chunks if a store is given"""
+    chunks = []
+    start = 0
+    for end in chunk_boundaries(data):
+        piece = data[start:end]
+        digest = hashlib.sha256(piece).hexdigest()
+        if store is not None:
+            store.put(digest, piece)
+        chunks.append([digest, end - start])
+        start = end
+    return {
+        'size': len(data),
+        'sha256': hashlib.sha256(data).hexdigest(),
+        'chunks': chunks,
+    }
+
+
+def missing_chunks(manifest, store):
+    """Chunk digests from the manifest the store does not hold yet"""
+    missing = []
+    seen = set()
+    for digest, _ in manifest['chunks']:
+        if digest not in seen and not store.has(digest):
+            missing.append(digest)
+        seen.add(digest)
+    return missing
+
+
+def write_pack(store, digests, pack_file):
+    """Bundle chunks into a single pack file to send: [len][32-byte digest][data]..."""
+    with open(pack_file, 'wb') as f:
+        for digest in digests:
+            data = store.get(digest)
+            f.write(struct.pack("!I", len(data)) + bytes.fromhex(digest) + data)
+    return Path(pack_file).stat().st_size
+
+
+def read_pack(pack_file, store):
+    """Verify and add every chunk of a pack file to the store"""
+    added = 0
+    with open(pack_file, 'rb') as f:
+        while True:
+            header = f.read(36)
+            if not header:
+                break
+            length = struct.unpack("!I", header[:4])[0]
+            digest = header[4:].hex()
+            data = f.read(length)
+            if hashlib.sha256(data).hexdigest() != digest:
+                raise ValueError(f"Corrupt chunk {digest[:12]} in {pack_file}")
+            added += store.put(digest, data)
+    return added
+
+
+def assemble_chunks(manifest, store):
+    """Payload bytes from stored chunks, verified against the manifest"""
+    data = b"".join(store.get(digest) for digest, _ in manifest['chunks'])
+    if hashlib.sha256(data).hexdigest() != manifest['sha256']:
+        raise ValueError("Assembled payload does not match manifest")
+    return data
+
+
+def rebuild_file(manifest, store, destination):
+    """Reassemble a file from stored chunks and verify it before replacing destination"""
+    destination = Path(destination)
+    tmp = destination.with_name(destination.name + ".rebuild")
+    digest = hashlib.sha256()
+    with open(tmp, 'wb') as f:
+        for chunk_digest, _ in manifest['chunks']:
+            data = store.get(chunk_digest)
+            digest.update(data)
+            f.write(data)
+    if digest.hexdigest() != manifest['sha256']:
+        tmp.unlink()
+        raise ValueError("Rebuilt file does not match manifest")
+    os.replace(tmp, destination)
+    return destination
+
+
+def benchmark(count=100000, workdir=None):
+    """Measure chunking speed and transfer size for a single-bookmark edit"""
+    workdir = Path(workdir or get_state_dir() / "chunk_bench")
+    workdir.mkdir(parents=True, exist_ok=True)
+    sender = ChunkStore(workdir / "sender")
+    receiver = ChunkStore(workdir / "receiver")
+
+    data = synthetic_bookmarks(count)
+    original = workdir / "Bookmarks_v1.json"
+    original.write_text(json.dumps(data, indent=3))
+
+    start = time.perf_counter()
+    manifest_v1 = build_manifest(original, sender)
+    elapsed = time.perf_counter() - start
+    size_mb = manifest_v1['size'] / 1e6
+    print(f"📦 {count} bookmarks, {size_mb:.1f} MB -> {len(manifest_v1['chunks'])} chunks "
+          f"in {elapsed:.2f}s ({size_mb / elapsed:.1f} MB/s)")
+
+    # Receiver already holds v1
+    write_pack(sender, missing_chunks(manifest_v1, receiver), workdir / "v1.pack")
+    read_pack(workdir / "v1.pack", receiver)
+
+    # Single bookmark added in the middle of the tree
+    middle = data['roots']['bookmark_bar']['children'][len(data['roots']['bookmark_bar']['children']) // 2]
+    middle['children'].insert(100, {'guid': 'new', 'id': '999999', 'name': 'New bookmark',
+                                    'type': 'url', 'url': 'https://example.com/new'})
+    edited = workdir / "Bookmarks_v2.json"
+    edited.write_text(json.dumps(data, indent=3))
+
+    manifest_v2 = build_manifest(edited, sender)
+    missing = missing_chunks(manifest_v2, receiver)
+    pack_size = write_pack(sender, missing, workdir / "v2.pack")
+    manifest_size = len(json.dumps(manifest_v2))
+    read_pack(workdir / "v2.pack", receiver)
+    rebuild_file(manifest_v2, receiver, workdir / "Bookmarks_rebuilt.json")
+
+    sent = pack_size + manifest_size
+    print(f"✏️ Single-bookmark edit: {len(missing)} of {len(manifest_v2['chunks'])} chunks new, "
+          f"{sent / 1024:.1f} KiB sent vs {manifest_v2['size'] / 1024:.1f} KiB full "
+          f"({100 * sent / manifest_v2['size']:.2f}%)")
+    return sent, manifest_v2['size']
+
+
+if __name__ == "__main__":
+    # Usage: python chunked_transfer.py bench [bookmarks]
+    #        python chunked_transfer.py manifest <file>     (prints manifest, stores chunks)
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 100000)
+    elif len(sys.argv) > 2 and sys.argv[1] == "manifest":
+        print(json.dumps(build_manifest(sys.argv[2], ChunkStore()), indent=1))
+    else:
+        print("Usage: python chunked_transfer.py bench [bookmarks] | manifest <file>")
@@ -0,0 +1,322 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+from sync_history import EXPORT_PATH, format_change_trailers, parse_change_trailers
+
+
+# Subjects of the commits written by the export monitors
+AUTO_SYNC_SUBJECTS = {
+    "🔁 Auto-sync bookmark changes",
+    "🔁 Auto-sync new bookmark",
+    "🔖 Bookmark changes detected",
+    "🔖 Bookmark structure changed",
+    "🎯 Confirmed bookmark change",
+}
+CHECKPOINT_PREFIX = "📦 Checkpoint"
+COMPACTION_TAG = "sync-compaction"
+
+FIELD_SEP = "\x1f"
+RECORD_SEP = "\x1e"
+LOG_FORMAT = FIELD_SEP.join(["%H", "%T", "%P", "%an", "%ae", "%ad", "%cn", "%ce", "%cd", "%ct", "%B"]) + RECORD_SEP
+
+
+def _git(repo_dir, *args, env=None, check=True):
+    result = subprocess.run(["git", *args], cwd=repo_dir, capture_output=True,
+                            text=True, env=env, check=check)
+    return result.stdout.strip()
+
+
+def _read_history(repo_dir, tip):
+    """Return commits as dicts, parents before children"""
+    output = subprocess.run(
+        ["git", "log", "--reverse", "--topo-order", "--date=raw", f"--format={LOG_FORMAT}", tip],
+        cwd=repo_dir, capture_output=True, text=True, check=True).stdout
+
+    commits = []
+    for record in output.split(RECORD_SEP):
+        record = record.strip("\n")
+        if not record:
+            continue
+        sha, tree, parents, an, ae, ad, cn, ce, cd, ct, body = record.split(FIELD_SEP)
+        commits.append({
+            'sha': sha, 'tree': tree, 'parents': parents.split(), 'author_name': an, 'author_email': ae,
+            'author_date': ad, 'committer_name': cn, 'committer_email': ce,
+            'committer_date': cd, 'time': int(ct), 'message': body.strip("\n"),
+        })
+    return commits
+
+
+def is_auto_sync_commit(commit):
+    subject = commit['message'].split("\n", 1)[0]
+    return subject in AUTO_SYNC_SUBJECTS or subject.startswith(CHECKPOINT_PREFIX)
+
+
+def _period_key(timestamp, period):
+    moment = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    if period == "week":
+        year, week, _ = moment.isocalendar()
+        return f"{year}-W{week:02d}"
+    if period == "month":
+        return moment.strftime("%Y-%m")
+    return moment.strftime("%Y-%m-%d")
+
+
+def plan_compaction(commits, cutoff, period="day"):
+    """Group old consecutive auto-sync commits into per-period checkpoints.
+
+    Returns a list of (commit, group) to replay in order; the commit is the last
+    of its group and keeps its tree. Only a straight run of commits is squashed:
+    merges, and commits another branch forks from, end a group.
+    """
+    children = {}
+    for commit in commits:
+        for parent in commit['parents']:
+            children[parent] = children.get(parent, 0) + 1
+
+    plan = []
+    tails = {}  # sha of a group's last commit -> its index in plan
+    for commit in commits:
+        parents = commit['parents']
+        if len(parents) == 1 and parents[0] in tails and children[parents[0]] == 1 \
+                and commit['time'] < cutoff and is_auto_sync_commit(commit):
+            index = tails[parents[0]]
+            previous, group = plan[index]
+            if (previous['time'] < cutoff and is_auto_sync_commit(previous)
+                    and _period_key(previous['time'], period) == _period_key(commit['time'], period)):
+                plan[index] = (commit, group + [commit])
+                del tails[parents[0]]
+                tails[commit['sha']] = index
+                continue
+        tails[commit['sha']] = len(plan)
+        plan.append((commit, [commit]))
+    return plan
+
+
+def _commit_tree(repo_dir, commit, parents, message):
+    env = dict(os.environ,
+               GIT_AUTHOR_NAME=commit['author_name'], GIT_AUTHOR_EMAIL=commit['author_email'],
+               GIT_AUTHOR_DATE=commit['author_date'], GIT_COMMITTER_NAME=commit['committer_name'],
+               GIT_COMMITTER_EMAIL=commit['committer_email'], GIT_COMMITTER_DATE=commit['committer_date'])
+    args = ["commit-tree", commit['tree'], "-m", message]
+    for parent in parents:
+        args += ["-p", parent]
+    return _git(repo_dir, *args, env=env)
+
+
+def rewrite_history(repo_dir, plan, period="day"):
+    """Recreate the planned history with commit-tree; unchanged prefixes keep their hashes"""
+    rewritten = {}  # old sha of a group's last commit -> new sha
+    new_sha = None
+    for commit, group in plan:
+        message = commit['message']
+        if len(group) > 1:
+            day = _period_key(commit['time'], period)
+            message = f"{CHECKPOINT_PREFIX} {day}: {len(group)} auto-sync commits"
+            # Keep the summed change counts so history summaries stay blob-free
+            counts = {}
+            for squashed in group:
+                for key, value in parse_change_trailers(squashed['message']).items():
+                    counts[key] = value if key == 'count' else counts.get(key, 0) + value
+            if counts:
+                message += "\n\n" + format_change_trailers(counts)
+        # A group hangs off the parents of its first commit
+        new_sha = _commit_tree(repo_dir, commit, [rewritten[parent] for parent in group[0]['parents']], message)
+        rewritten[commit['sha']] = new_sha
+    return new_sha
+
+
+def repack(repo_dir):
+    """Drop unreachable objects left by the rewrite and repack"""
+    _git(repo_dir, "reflog", "expire", "--expire=now", "--all")
+    _git(repo_dir, "gc", "--prune=now", "--quiet")
+
+
+def compact_history(repo_dir=".", remote="origin", branch="main", retention_days=30,
+                    period="day", repack_remote=False):
+    """Squash auto-sync commits older than the retention window and force-push safely"""
+    repo_dir = Path(repo_dir)
+    _git(repo_dir, "fetch", remote, branch)
+    old_tip = _git(repo_dir, "rev-parse", f"{remote}/{branch}")
+
+    commits = _read_history(repo_dir, old_tip)
+    cutoff = time.time() - retention_days * 86400
+    plan = plan_compaction(commits, cutoff, period)
+    if len(plan) == len(commits):
+        print("✅ Nothing to compact")
+        return False
+
+    new_tip = rewrite_history(repo_dir, plan, period)
+    if _git(repo_dir, "rev-parse", f"{new_tip}^{{tree}}") != _git(repo_dir, "rev-parse", f"{old_tip}^{{tree}}"):
+        print("❌ Rewritten tip does not match the original tree, aborting")
+        return False
+
+    # The lease makes the push fail if any client pushed since our fetch
+    try:
+        _git(repo_dir, "push", f"--force-with-lease=refs/heads/{branch}:{old_tip}",
+             remote, f"{new_tip}:refs/heads/{branch}", f"+{new_tip}:refs/tags/{COMPACTION_TAG}")
+    except subprocess.CalledProcessError as e:
+        print(f"⚠️ Remote moved during compaction, will retry next run: {e.stderr.strip()}")
+        return False
+
+    print(f"📦 Compacted {len(commits)} commits into {len(plan)}")
+    sync_after_compaction(repo_dir, remote, branch)
+    repack(repo_dir)
+
+    if repack_remote:
+        remote_url = _git(repo_dir, "remote", "get-url", remote)
+        if Path(remote_url).is_dir():
+            repack(remote_url)
+    return True
+
+
+def _is_ancestor(repo_dir, ancestor, descendant):
+    return subprocess.run(["git", "merge-base", "--is-ancestor", ancestor, descendant],
+                          cwd=repo_dir, capture_output=True).returncode == 0
+
+
+def needs_recovery(repo_dir, remote="origin", branch="main"):
+    """True when the remote was compacted since this client last synced.
+
+    Compaction moves the sync-compaction tag to the rewritten tip. A client whose
+    HEAD does not contain that tip is still on the old history; one that does
+    (or a remote that never compacted) just has ordinary new commits to merge.
+    """
+    upstream = f"{remote}/{branch}"
+    if _is_ancestor(repo_dir, "HEAD", upstream) or _is_ancestor(repo_dir, upstream, "HEAD"):
+        return False
+    # Tags that already exist locally are not moved by a plain fetch
+    subprocess.run(["git", "fetch", "-q", remote, f"+refs/tags/{COMPACTION_TAG}:refs/tags/{COMPACTION_TAG}"],
+                   cwd=repo_dir, capture_output=True)
+    marker = subprocess.run(["git", "rev-parse", "--verify", "-q", f"refs/tags/{COMPACTION_TAG}^{{commit}}"],
+                            cwd=repo_dir, capture_output=True, text=True).stdout.strip()
+    return bool(marker) and _is_ancestor(repo_dir, marker, upstream) and not _is_ancestor(repo_dir, marker, "HEAD")
+
+
+def sync_after_compaction(repo_dir=".", remote="origin", branch="main"):
+    """Move a client onto the compacted history, replaying any unpushed local commits.
+
+    Expects `git fetch` to have run. Returns True if the client was moved.
+    """
+    if not needs_recovery(repo_dir, remote, branch):
+        return False
+
+    upstream = f"{remote}/{branch}"
+    remote_trees = {}
+    for line in _git(repo_dir, "log", "--format=%T %H", upstream).splitlines():
+        tree, sha = line.split()
+        remote_trees.setdefault(tree, sha)
+
+    # Newest local commit whose snapshot already exists in the compacted history
+    for line in _git(repo_dir, "log", "--format=%H %T", "HEAD").splitlines():
+        sha, tree = line.split()
+        if tree in remote_trees:
+            base, onto = sha, remote_trees[tree]
+            break
+    else:
+        print("❌ No common snapshot with the compacted remote, manual recovery needed")
+        return False
+
+    if base == _git(repo_dir, "rev-parse", "HEAD"):
+        _git(repo_dir, "reset", "--keep", upstream)
+        print("🔄 Switched to compacted history")
+    else:
+        _git(repo_dir, "rebase", "--onto", onto, base)
+        print("🔄 Replayed local commits onto compacted history")
+    return True
+
+
+def _simulated_commit(clone, urls, when, subject="🔁 Auto-sync bookmark changes"):
+    export_file = clone / EXPORT_PATH
+    export_file.parent.mkdir(parents=True, exist_ok=True)
+    export_file.write_text(json.dumps({'roots': {'bookmark_bar': {'children': [{'url': url} for url in urls]}}}))
+    env = dict(os.environ, GIT_AUTHOR_DATE=f"{int(when)} +0000", GIT_COMMITTER_DATE=f"{int(when)} +0000")
+    _git(clone, "add", EXPORT_PATH)
+    _git(clone, "commit", "-q", "-m", subject, env=env)
+
+
+def _exported_urls(clone, rev="HEAD"):
+    data = json.loads(_git(clone, "show", f"{rev}:{EXPORT_PATH}"))
+    return [child['url'] for child in data['roots']['bookmark_bar']['children']]
+
+
+def simulate(old_commits=40):
+    """Compact a local bare remote while simulated clients hold old, new and diverged histories"""
+    workdir = Path(tempfile.mkdtemp(prefix="compact_history_"))
+    remote = workdir / "remote.git"
+    _git(workdir, "init", "-q", "--bare", "-b", "main", str(remote))
+    clients = {}
+    for name in ("compactor", "stale", "idle", "current"):
+        clients[name] = workdir / name
+        _git(workdir, "clone", "-q", str(remote), str(clients[name]), check=False)
+        _git(clients[name], "config", "user.name", name)
+        _git(clients[name], "config", "user.email", f"{name}@local")
+        _git(clients[name], "checkout", "-q", "-B", "main")
+
+    compactor, stale = clients['compactor'], clients['stale']
+    start = time.time() - 90 * 86400
+    urls = []
+    for i in range(old_commits):
+        urls.append(f"https://example.com/{i}")
+        _simulated_commit(compactor, urls, start + i * 3600)
+        if i == 0:
+            _git(compactor, "push", "-q", "-u", "origin", "main")
+    _git(compactor, "push", "-q", "origin", "main")
+
+    # A concurrent old edit merged in, as push_resolver does
+    _git(stale, "pull", "-q", "origin", "main")
+    _git(stale, "branch", "-q", "--set-upstream-to=origin/main")
+    _simulated_commit(stale, urls + ["https://example.com/side"], start + old_commits * 3600)
+    _simulated_commit(compactor, urls + ["https://example.com/main"], start + old_commits * 3600)
+    _git(compactor, "push", "-q")
+    _git(stale, "pull", "-q", "--no-rebase", "--no-edit", "-X", "theirs")
+    _git(stale, "push", "-q")
+    for name in ("compactor", "idle", "current"):
+        _git(clients[name], "pull", "-q", "origin", "main")
+        _git(clients[name], "branch", "-q", "--set-upstream-to=origin/main")
+
+    # 'stale' has an unpushed edit when the remote gets compacted
+    merged_urls = _exported_urls(stale)
+    _simulated_commit(stale, merged_urls + ["https://example.com/offline"], time.time())
+    before = int(_git(compactor, "rev-list", "--count", "origin/main"))
+    compacted = compact_history(compactor, retention_days=30)
+    after = int(_git(compactor, "rev-list", "--count", "origin/main"))
+
+    checks = {'compacted': compacted and after < before}
+    for name in ("stale", "idle"):
+        _git(clients[name], "fetch", "-q")
+        checks[f"{name} detected compaction"] = needs_recovery(clients[name])
+        checks[f"{name} recovered"] = sync_after_compaction(clients[name])
+    checks['stale kept offline edit'] = "https://example.com/offline" in _exported_urls(stale)
+    checks['stale pushes fast-forward'] = subprocess.run(["git", "push", "-q"], cwd=stale,
+                                                         capture_output=True).returncode == 0
+
+    # Ordinary divergence on the compacted history is not a compaction
+    current = clients['current']
+    _git(current, "fetch", "-q")
+    sync_after_compaction(current)
+    _simulated_commit(current, _exported_urls(current, "origin/main") + ["https://example.com/local"], time.time())
+    _git(compactor, "pull", "-q")
+    _simulated_commit(compactor, _exported_urls(compactor) + ["https://example.com/remote"], time.time())
+    _git(compactor, "push", "-q")
+    _git(current, "fetch", "-q")
+    checks['ordinary divergence is not compaction'] = not needs_recovery(current)
+
+    for check, ok in checks.items():
+        print(f"{'✅' if ok else '❌'} {check}")
+    print(f"📦 {before} commits -> {after} on the remote ({workdir})")
+    return all(checks.values())
+
+
+if __name__ == "__main__":
+    # Usage: python compact_history.py [retention_days] [day|week|month]
+    #        python compact_history.py simulate [old_commits]   (local bare remote + simulated clients)
+    if len(sys.argv) > 1 and sys.argv[1] == "simulate":
+        sys.exit(0 if simulate(int(sys.argv[2]) if len(sys.argv) > 2 else 40) else 1)
+    retention_days = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    period = sys.argv[2] if len(sys.argv) > 2 else "day"
+    compact_history(Path.cwd(), retention_days=retention_days, period=period)
@@ -0,0 +1,290 @@
+import os
+import sys
+import json
+import time
+import shutil
+import select
+import threading
+from bookmark_tree import core_bookmark_hash
+from bookmarks_export import get_state_dir
+
+try:
+    import psutil
+except ImportError:  # Only needed to find the browser's processes
+    psutil = None
+
+
+BROWSER_NAMES = ('chrome', 'google chrome')
+VERIFY_SETTLE = 30      # Seconds after the browser starts before checking the import survived
+START_POLL_INTERVAL = 5
+APPLY_RETRY_INTERVAL = 30  # Seconds before retrying a failed apply
+
+
+def _deferred_dir():
+    path = get_state_dir() / "deferred"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _write_json(path, data):
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def browser_pids():
+    """PIDs of running browser main processes (not renderers/helpers, which exit with them)"""
+    if psutil is None:
+        return []
+    pids = []
+    for proc in psutil.process_iter(['name', 'cmdline']):
+        try:
+            name = (proc.info['name'] or '').lower()
+            if name.startswith(BROWSER_NAMES) and not any(
+                    arg.startswith('--type=') for arg in proc.info['cmdline'] or []):
+                pids.append(proc.pid)
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    return pids
+
+
+def wait_for_exit(pids, timeout=None):
+    """Block until every pid has exited, using the OS exit notification where there is one.
+
+    Linux: pidfd + poll; macOS/BSD: kqueue NOTE_EXIT; elsewhere psutil.wait_procs
+    (a process handle wait on Windows). Returns False on timeout.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    def remaining():
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+    if hasattr(os, 'pidfd_open'):
+        fds = {}
+        for pid in pids:
+            try:
+                fds[os.pidfd_open(pid)] = pid
+            except ProcessLookupError:
+                continue
+        poller = select.poll()
+        for fd in fds:
+            poller.register(fd, select.POLLIN)
+        try:
+            while fds:
+                left = remaining()
+                ready = poller.poll(None if left is None else int(left * 1000))
+                if not ready and left is not None:
+                    return False
+                for fd, _ in ready:
+                    poller.unregister(fd)
+                    del fds[fd]
+                    os.close(fd)
+        finally:
+            for fd in fds:
+                os.close(fd)
+        return True
+
+    if hasattr(select, 'kqueue'):
+        kq = select.kqueue()
+        try:
+            changes = [select.kevent(pid, filter=select.KQ_FILTER_PROC,
+                                     flags=select.KQ_EV_ADD | select.KQ_EV_ONESHOT, fflags=select.KQ_NOTE_EXIT)
+                       for pid in pids]
+            waiting = 0
+            for change in changes:
+                try:
+                    kq.control([change], 0, 0)
+                    waiting += 1
+                except ProcessLookupError:
+                    continue
+            while waiting:
+                events = kq.control(None, waiting, remaining())
+                if not events and deadline is not None:
+                    return False
+                waiting -= len(events)
+        finally:
+            kq.close()
+        return True
+
+    procs = []
+    for pid in pids:
+        try:
+            procs.append(psutil.Process(pid))
+        except psutil.NoSuchProcess:
+            continue
+    _, alive = psutil.wait_procs(procs, timeout=remaining())
+    return not alive
+
+
+def defer_import(import_file):
+    """Queue a snapshot to import once the browser exits; only the newest one is kept"""
+    deferred_dir = _deferred_dir()
+    pending_file = deferred_dir / "pending.json"
+    tmp_file = deferred_dir / "pending.json.tmp"
+    shutil.copyfile(import_file, tmp_file)
+    os.replace(tmp_file, pending_file)  # Replaces any older queued snapshot
+    _write_json(deferred_dir / "pending_meta.json", {'source': str(import_file), 'queued_at': time.time()})
+    print("⏳ Browser is running; import deferred until it exits")
+    get_deferred_importer().wake()
+
+
+class DeferredImporter:
+    """Applies the queued snapshot once after the browser exits, then checks it survived the next start"""
+
+    def __init__(self):
+        self.deferred_dir = _deferred_dir()
+        self.pending_file = self.deferred_dir / "pending.json"
+        self.applying_file = self.deferred_dir / "applying.json"
+        self.verify_file = self.deferred_dir / "verify.json"
+        self.apply_thread = None
+        self.verify_thread = None
+        self.lock = threading.Lock()
+
+    def wake(self):
+        with self.lock:
+            if self.apply_thread is None:
+                # Not a daemon: a one-shot import process stays up until the snapshot is applied
+                self.apply_thread = threading.Thread(target=self._apply_when_closed, daemon=False)
+                self.apply_thread.start()
+
+    def resume(self):
+        """Pick up a snapshot or verification left by a previous run"""
+        if self.applying_file.exists():
+            self._requeue()  # Interrupted mid-apply
+        if self.pending_file.exists():
+            self.wake()
+        if (_read_json(self.verify_file) or {}).get('result') == 'waiting':
+            self._start_verify()
+
+    def _apply_when_closed(self):
+        try:
+            while True:
+                with self.lock:
+                    if not self.pending_file.exists():
+                        self.apply_thread = None
+                        return
+                pids = browser_pids()
+                if pids:
+                    print(f"⏳ Waiting for the browser to exit ({len(pids)} process{'es' if len(pids) > 1 else ''})")
+                    wait_for_exit(pids)
+                    continue  # The browser may have restarted meanwhile
+                if not self._apply():
+                    time.sleep(APPLY_RETRY_INTERVAL)
+        finally:
+            # Also after an exception, so the next wake() starts a new thread
+            with self.lock:
+                if self.apply_thread is threading.current_thread():
+                    self.apply_thread = None
+
+    def _requeue(self):
+        """Put the snapshot being applied back in the queue, unless a newer one was queued meanwhile"""
+        with self.lock:
+            if self.pending_file.exists():
+                self.applying_file.unlink(missing_ok=True)
+            else:
+                os.replace(self.applying_file, self.pending_file)
+
+    def _apply(self):
+        """Import the queued snapshot; on failure it stays queued. Returns True once applied"""
+        from bookmarks_import_fixed import import_bookmarks, get_chrome_bookmarks_path
+        from chrome_checksum import read_bookmarks_consistent
+
+        os.replace(self.pending_file, self.applying_file)  # A newer snapshot queued now waits for the next exit
+        meta = _read_json(self.deferred_dir / "pending_meta.json") or {}
+        imported = False
+        try:
+            imported = import_bookmarks(self.applying_file, defer=False)
+        finally:
+            if not imported:
+                self._requeue()
+        if not imported:
+            print(f"⚠️ Deferred import failed; kept queued, retrying in {APPLY_RETRY_INTERVAL}s")
+            return False
+        self.applying_file.unlink(missing_ok=True)
+        # Commits pulled while it was queued are visible now
+        from sync_latency import get_latency_tracker
+        get_latency_tracker().mark_applied()
+
+        bookmarks_file = get_chrome_bookmarks_path()
+        expected = core_bookmark_hash(read_bookmarks_consistent(bookmarks_file))
+        _write_json(self.verify_file, {'expected': expected, 'applied_at': time.time(),
+                                       'queued_at': meta.get('queued_at'), 'result': 'waiting'})
+        print("✅ Applied deferred import; will verify after the browser's next start")
+        self._start_verify()
+        return True
+
+    def _start_verify(self):
+        with self.lock:
+            if self.verify_thread is None or not self.verify_thread.is_alive():
+                self.verify_thread = threading.Thread(target=self._verify_after_start, daemon=True)
+                self.verify_thread.start()
+
+    def _verify_after_start(self):
+        # No portable process-start notification; a slow poll is fine here
+        while not browser_pids():
+            time.sleep(START_POLL_INTERVAL)
+        time.sleep(VERIFY_SETTLE)
+        self.verify()
+
+    def verify(self):
+        """Compare the live file with what was applied: 'survived', 'lost' or None if nothing to check"""
+        from bookmarks_import_fixed import get_chrome_bookmarks_path
+        from chrome_checksum import read_bookmarks_consistent
+
+        record = _read_json(self.verify_file)
+        if not record or record.get('result') != 'waiting':
+            return None
+        current = core_bookmark_hash(read_bookmarks_consistent(get_chrome_bookmarks_path()))
+        record['result'] = 'survived' if current == record['expected'] else 'lost'
+        record['verified_at'] = time.time()
+        _write_json(self.verify_file, record)
+        if record['result'] == 'survived':
+            print("✅ Deferred import survived the browser restart")
+        else:
+            print("⚠️ Bookmarks differ from the deferred import after the browser restarted "
+                  "(overwritten by the browser, or edited since)")
+        return record['result']
+
+
+_importer = None
+
+
+def get_deferred_importer():
+    global _importer
+    if _importer is None:
+        _importer = DeferredImporter()
+    return _importer
+
+
+def defer_enabled():
+    return os.environ.get("BOOKMARKS_SYNC_DEFER_IMPORT", "").lower() in ("1", "true", "yes")
+
+
+if __name__ == "__main__":
+    # Usage: python deferred_import.py run       (apply a queued snapshot after the browser exits)
+    #        python deferred_import.py status
+    #        python deferred_import.py verify
+    importer = get_deferred_importer()
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command == "run":
+        importer.resume()
+        thread = importer.apply_thread
+        if thread is not None:
+            thread.join()
+        if importer.verify_thread is not None:
+            importer.verify_thread.join()
+    elif command == "verify":
+        print(f"🔎 {importer.verify() or 'nothing to verify'}")
+    else:
+        meta = _read_json(importer.deferred_dir / "pending_meta.json") if importer.pending_file.exists() else None
+        print(f"📦 Pending: {time.ctime(meta['queued_at']) if meta else 'none'}")
+        print(f"🔎 Last deferred import: {json.dumps(_read_json(importer.verify_file))}")
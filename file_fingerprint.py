@@ -0,0 +1,158 @@
+import os
+import sys
+import mmap
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import xxhash  # Optional: much faster non-cryptographic hashing
+except ImportError:
+    xxhash = None
+
+
+CHUNK_SIZE = 1024 * 1024
+MMAP_THRESHOLD = 16 * 1024 * 1024  # Map big files instead of copying them through a buffer
+
+
+def _new_hasher(algorithm):
+    if algorithm == 'blake2b':
+        return hashlib.blake2b(digest_size=16)
+    if algorithm in ('xxh3_64', 'xxh64'):
+        if xxhash is None:
+            raise ValueError(f"{algorithm} needs the xxhash package (pip install xxhash)")
+        return getattr(xxhash, algorithm)()
+    return hashlib.new(algorithm)
+
+
+def default_algorithm():
+    """BOOKMARKS_SYNC_HASH if set, else xxh3_64 when xxhash is installed, else blake2b"""
+    return os.environ.get("BOOKMARKS_SYNC_HASH") or ('xxh3_64' if xxhash else 'blake2b')
+
+
+def hash_file(f, size, algorithm):
+    """Hash an open binary file with constant memory: mmap for big files, else fixed chunks"""
+    hasher = _new_hasher(algorithm)
+    if size >= MMAP_THRESHOLD:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, len(view), CHUNK_SIZE):
+                    hasher.update(view[offset:offset + CHUNK_SIZE])
+            finally:
+                view.release()
+        return hasher.hexdigest()
+
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+    while True:
+        read = f.readinto(buffer)
+        if not read:
+            break
+        hasher.update(view[:read])
+    return hasher.hexdigest()
+
+
+class FingerprintCache:
+    """Fingerprints keyed by (path, inode, size, mtime_ns, algorithm).
+
+    An unchanged file is answered from its stat alone. A result is only cached
+    if the file's stat did not change while it was being hashed.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'bytes_hashed': 0}
+
+    def fingerprint(self, filepath, algorithm=None):
+        """'<algorithm>:<hex digest>' of the file's contents, or None if it can't be read"""
+        algorithm = algorithm or default_algorithm()
+        try:
+            with open(filepath, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                key = (os.fspath(filepath), stat.st_ino, stat.st_size, stat.st_mtime_ns, algorithm)
+                with self.lock:
+                    if key in self.entries:
+                        self.entries.move_to_end(key)
+                        self.stats['hits'] += 1
+                        return self.entries[key]
+
+                digest = f"{algorithm}:{hash_file(f, stat.st_size, algorithm)}"
+                after = os.fstat(f.fileno())
+        except (PermissionError, OSError):
+            return None
+
+        with self.lock:
+            self.stats['misses'] += 1
+            self.stats['bytes_hashed'] += stat.st_size
+            if (after.st_size, after.st_mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                self.entries[key] = digest
+                if len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return digest
+
+    def _stat_key(self, filepath, algorithm):
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        return (os.fspath(filepath), stat.st_ino, stat.st_size, stat.st_mtime_ns, algorithm or default_algorithm())
+
+    def peek(self, filepath, algorithm=None):
+        """Cached fingerprint if the file is unchanged since it was hashed, without reading it"""
+        key = self._stat_key(filepath, algorithm)
+        with self.lock:
+            return self.entries.get(key)
+
+    def seed(self, filepath, digest):
+        """Record a fingerprint known from elsewhere (e.g. the source of a copy) for the file as it is now"""
+        key = self._stat_key(filepath, digest.split(":", 1)[0])
+        if key is None:
+            return
+        with self.lock:
+            self.entries[key] = digest
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+_cache = FingerprintCache()
+
+
+def file_fingerprint(filepath, algorithm=None):
+    """Content fingerprint for change detection, cached per (inode, size, mtime_ns)"""
+    return _cache.fingerprint(filepath, algorithm)
+
+
+def cached_fingerprint(filepath, algorithm=None):
+    return _cache.peek(filepath, algorithm)
+
+
+def seed_fingerprint(filepath, digest):
+    _cache.seed(filepath, digest)
+
+
+def fingerprint_stats():
+    return dict(_cache.stats)
+
+
+if __name__ == "__main__":
+    # Usage: python file_fingerprint.py <file> [algorithm ...]   (compare algorithms)
+    if len(sys.argv) < 2:
+        print("Usage: python file_fingerprint.py <file> [algorithm ...]")
+        sys.exit(1)
+    path = sys.argv[1]
+    algorithms = sys.argv[2:] or ['md5', 'blake2b'] + (['xxh3_64'] if xxhash else [])
+    size_mb = os.path.getsize(path) / 1e6
+    for algorithm in algorithms:
+        cache = FingerprintCache()
+        start = time.perf_counter()
+        digest = cache.fingerprint(path, algorithm)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        cache.fingerprint(path, algorithm)
+        warm = time.perf_counter() - start
+        print(f"🔑 {digest}  cold {cold * 1000:.1f} ms ({size_mb / cold:.0f} MB/s), "
+              f"cached {warm * 1e6:.0f} µs")
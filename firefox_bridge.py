@@ -0,0 +1,415 @@
+import os
+import sys
+import json
+import time
+import uuid
+import base64
+import hashlib
+import sqlite3
+import platform
+import tempfile
+from pathlib import Path
+from bookmark_tree import WEBKIT_EPOCH_OFFSET_US, load_bookmarks, synthetic_bookmarks
+from bookmarks_export import get_state_dir
+from chrome_checksum import set_checksum
+
+
+# Chrome root -> (Chrome root guid, Firefox root guid, Chrome root name)
+ROOT_MAP = {
+    'bookmark_bar': ("0bc5d13f-2cba-5d74-951f-3f233fe6c908", "toolbar_____", "Bookmarks Bar"),
+    'other': ("82b081ec-3dd3-529c-8475-ab6c344590dd", "unfiled_____", "Other Bookmarks"),
+    'synced': ("4cf2e351-0e85-532b-bb37-df045d8f8d0f", "mobile______", "Mobile Bookmarks"),
+}
+TYPE_BOOKMARK = 1
+TYPE_FOLDER = 2
+MAX_CHARS_TO_HASH = 1500
+
+
+def get_firefox_places_path():
+    """places.sqlite of the most recently used local Firefox profile"""
+    system = platform.system()
+    if system == "Windows":
+        profiles_dir = Path(os.environ["APPDATA"]) / "Mozilla/Firefox/Profiles"
+    elif system == "Darwin":
+        profiles_dir = Path.home() / "Library/Application Support/Firefox/Profiles"
+    else:
+        profiles_dir = Path.home() / ".mozilla/firefox"
+    candidates = list(profiles_dir.glob("*/places.sqlite"))
+    if not candidates:
+        raise FileNotFoundError(f"No Firefox profile with places.sqlite in {profiles_dir}")
+    return max(candidates, key=lambda path: path.stat().st_mtime)
+
+
+# --- Firefox helpers --------------------------------------------------------
+
+def _hash_string(data):
+    """mozilla::HashString over bytes (golden-ratio rotate/xor)"""
+    h = 0
+    for byte in data:
+        h = (0x9E3779B9 * ((((h << 5) | (h >> 27)) & 0xFFFFFFFF) ^ byte)) & 0xFFFFFFFF
+    return h
+
+
+def url_hash(url):
+    """Value of moz_places.url_hash, which Firefox uses to look up places by URL"""
+    spec = url.encode('utf-8')[:MAX_CHARS_TO_HASH]
+    prefix = url.split(":", 1)[0].encode('utf-8') if ":" in url else b""
+    return ((_hash_string(prefix) & 0x0000FFFF) << 32) + _hash_string(spec)
+
+
+def reversed_host(url):
+    host = url.split("://", 1)[1].split("/", 1)[0] if "://" in url else ""
+    return host.lower()[::-1] + "."
+
+
+def new_firefox_guid():
+    return base64.urlsafe_b64encode(os.urandom(9)).decode()
+
+
+def to_prtime(chrome_time):
+    try:
+        return max(0, int(chrome_time) - WEBKIT_EPOCH_OFFSET_US)
+    except (TypeError, ValueError):
+        return int(time.time() * 1000000)
+
+
+def to_chrome_time(prtime):
+    return str((prtime or 0) + WEBKIT_EPOCH_OFFSET_US)
+
+
+class GuidMap:
+    """Persisted Chrome guid <-> Firefox guid mapping for one places database"""
+
+    def __init__(self, places_path):
+        key = hashlib.md5(str(Path(places_path).resolve()).encode()).hexdigest()[:12]
+        self.path = get_state_dir() / "firefox" / f"guid_map_{key}.json"
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.to_ff = json.load(f)
+        except (OSError, ValueError):
+            self.to_ff = {}
+        for chrome_guid, ff_guid, _ in ROOT_MAP.values():
+            self.to_ff[chrome_guid] = ff_guid
+        self.to_chrome = {ff: chrome for chrome, ff in self.to_ff.items()}
+
+    def firefox_guid(self, chrome_guid):
+        if chrome_guid not in self.to_ff:
+            self.to_ff[chrome_guid] = new_firefox_guid()
+            self.to_chrome[self.to_ff[chrome_guid]] = chrome_guid
+        return self.to_ff[chrome_guid]
+
+    def chrome_guid(self, ff_guid):
+        if ff_guid not in self.to_chrome:
+            self.to_chrome[ff_guid] = str(uuid.uuid4())
+            self.to_ff[self.to_chrome[ff_guid]] = ff_guid
+        return self.to_chrome[ff_guid]
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.to_ff, f)
+        os.replace(tmp, self.path)
+
+
+def connect_places(places_path, readonly=False):
+    """Open places.sqlite through SQLite (never a raw file copy, which would miss the WAL)"""
+    if readonly:
+        return sqlite3.connect(f"file:{Path(places_path).resolve()}?mode=ro", uri=True, timeout=5)
+    # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+    return sqlite3.connect(places_path, timeout=5, isolation_level=None)
+
+
+def backup_places(conn, places_path):
+    """Consistent copy (including WAL contents) via the SQLite backup API"""
+    backup_path = Path(places_path).with_name("places.sqlite.sync-backup")
+    with sqlite3.connect(backup_path) as backup:
+        conn.backup(backup)
+    backup.close()
+    return backup_path
+
+
+def _managed_rows(conn):
+    """Every row below (and including) the managed roots: guid -> (id, type, fk, parent, position,
+    title, url, dateAdded, lastModified, syncStatus)"""
+    roots = [ff_guid for _, ff_guid, _ in ROOT_MAP.values()]
+    rows = conn.execute(f"""
+        WITH RECURSIVE tree(id) AS (
+            SELECT id FROM moz_bookmarks WHERE guid IN ({",".join("?" * len(roots))})
+            UNION ALL
+            SELECT b.id FROM moz_bookmarks b JOIN tree ON b.parent = tree.id
+        )
+        SELECT b.guid, b.id, b.type, b.fk, b.parent, b.position, b.title, p.url,
+               b.dateAdded, b.lastModified, b.syncStatus
+        FROM moz_bookmarks b JOIN tree USING (id) LEFT JOIN moz_places p ON p.id = b.fk
+    """, roots).fetchall()
+    return {row[0]: row[1:] for row in rows}
+
+
+# --- Chrome JSON -> places.sqlite ---------------------------------------------
+
+def import_to_firefox(bookmarks_file, places_path, backup=True):
+    """Make the managed Firefox roots match a synced Chrome JSON tree.
+
+    Only the difference is written: new rows are bulk-inserted with preallocated
+    ids, changed rows bulk-updated and missing rows bulk-deleted, all in one
+    transaction. The Bookmarks Menu and tags are left alone; separators have no
+    Chrome equivalent and are not kept.
+    """
+    data = load_bookmarks(bookmarks_file)
+    guid_map = GuidMap(places_path)
+    conn = connect_places(places_path)
+    try:
+        if backup:
+            backup_places(conn, places_path)
+        # Fails fast with "database is locked" while Firefox holds the profile
+        conn.execute("BEGIN IMMEDIATE")
+        existing = _managed_rows(conn)
+        id_by_guid = {guid: row[0] for guid, row in existing.items()}
+        next_bookmark_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM moz_bookmarks").fetchone()[0]
+        next_place_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM moz_places").fetchone()[0]
+        has_origins = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'moz_origins'").fetchone()
+        place_ids = dict(conn.execute("SELECT url, id FROM moz_places"))
+
+        # Desired rows in pre-order so every parent id is known before its children
+        desired = []
+        stack = []
+        for root_name, (_, ff_root, _) in ROOT_MAP.items():
+            root = data.get('roots', {}).get(root_name)
+            if isinstance(root, dict) and ff_root in id_by_guid:
+                stack.extend((child, ff_root, position)
+                             for position, child in reversed(list(enumerate(root.get('children', [])))))
+        while stack:
+            node, parent_guid, position = stack.pop()
+            guid = guid_map.firefox_guid(node.get('guid') or f"chrome-id-{node.get('id')}")
+            desired.append((guid, node, parent_guid, position))
+            if node.get('type') == 'folder':
+                stack.extend((child, guid, child_position)
+                             for child_position, child in reversed(list(enumerate(node.get('children', [])))))
+
+        now = int(time.time() * 1000000)
+        new_places, new_origins = [], set()
+        inserts, updates, fk_delta = [], [], {}
+        for guid, node, parent_guid, position in desired:
+            is_url = node.get('type') == 'url'
+            fk = None
+            if is_url:
+                url = node.get('url', '')
+                fk = place_ids.get(url)
+                if fk is None:
+                    fk = place_ids[url] = next_place_id
+                    next_place_id += 1
+                    origin = None
+                    if "://" in url:
+                        prefix, host = url.split("://", 1)
+                        origin = (prefix + "://", host.split("/", 1)[0].lower())
+                        new_origins.add(origin)
+                    new_places.append([fk, url, node.get('name', ''), reversed_host(url), -1,
+                                       new_firefox_guid(), url_hash(url), origin])
+            if guid not in id_by_guid:
+                id_by_guid[guid] = next_bookmark_id
+                next_bookmark_id += 1
+            values = (TYPE_BOOKMARK if is_url else TYPE_FOLDER, fk, id_by_guid[parent_guid], position,
+                      node.get('name', ''))
+            before = existing.get(guid)
+            if before is None:
+                added = to_prtime(node.get('date_added'))
+                modified = to_prtime(node['date_modified']) if node.get('date_modified') else added
+                inserts.append((id_by_guid[guid],) + values + (added, modified, guid))
+                if fk:
+                    fk_delta[fk] = fk_delta.get(fk, 0) + 1
+            elif before[1:5] + (before[5] or '',) != values:
+                updates.append(values + (now, id_by_guid[guid]))
+                if before[2] != fk:
+                    if before[2]:
+                        fk_delta[before[2]] = fk_delta.get(before[2], 0) - 1
+                    if fk:
+                        fk_delta[fk] = fk_delta.get(fk, 0) + 1
+
+        desired_guids = {guid for guid, _, _, _ in desired}
+        roots = {ff_guid for _, ff_guid, _ in ROOT_MAP.values()}
+        deletes = [(guid, row) for guid, row in existing.items() if guid not in desired_guids and guid not in roots]
+        for _, row in deletes:
+            if row[2]:
+                fk_delta[row[2]] = fk_delta.get(row[2], 0) - 1
+
+        origin_ids = {}
+        if has_origins and new_origins:
+            conn.executemany("INSERT OR IGNORE INTO moz_origins (prefix, host, frecency) VALUES (?, ?, 0)",
+                             sorted(new_origins))
+            origin_ids = {(prefix, host): origin_id for origin_id, prefix, host
+                          in conn.execute("SELECT id, prefix, host FROM moz_origins")}
+        for place in new_places:
+            place[-1] = origin_ids.get(place[-1])
+        conn.executemany("""INSERT INTO moz_places (id, url, title, rev_host, frecency, guid, url_hash, origin_id)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", new_places)
+        conn.executemany("""INSERT INTO moz_bookmarks (id, type, fk, parent, position, title, dateAdded,
+                                                       lastModified, guid, syncStatus, syncChangeCounter)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1, 1)""", inserts)
+        conn.executemany("""UPDATE moz_bookmarks SET type = ?, fk = ?, parent = ?, position = ?, title = ?,
+                                lastModified = ?, syncChangeCounter = syncChangeCounter + 1
+                            WHERE id = ?""", updates)
+        conn.executemany("DELETE FROM moz_bookmarks WHERE id = ?", [(row[0],) for _, row in deletes])
+        # Tombstones so Firefox Sync propagates deletions of items it already uploaded
+        conn.executemany("INSERT OR IGNORE INTO moz_bookmarks_deleted (guid, dateRemoved) VALUES (?, ?)",
+                         [(guid, now) for guid, row in deletes if row[9] == 2])
+        conn.executemany("UPDATE moz_places SET foreign_count = MAX(0, foreign_count + ?) WHERE id = ?",
+                         [(delta, place_id) for place_id, delta in fk_delta.items() if delta])
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    guid_map.save()
+    print(f"🦊 Firefox import: {len(inserts)} added, {len(updates)} updated, {len(deletes)} removed "
+          f"({len(new_places)} new places)")
+    return {'added': len(inserts), 'updated': len(updates), 'removed': len(deletes)}
+
+
+# --- places.sqlite -> Chrome JSON ---------------------------------------------
+
+def export_from_firefox(places_path, export_path):
+    """Write the managed Firefox roots as Bookmarks_Chrome.json, like export_bookmarks"""
+    guid_map = GuidMap(places_path)
+    conn = connect_places(places_path, readonly=True)
+    try:
+        rows = _managed_rows(conn)
+    finally:
+        conn.close()
+
+    children = {}
+    by_id = {}
+    for guid, (row_id, row_type, _, parent, position, title, url, added, modified, _) in rows.items():
+        by_id[row_id] = guid
+        if row_type in (TYPE_BOOKMARK, TYPE_FOLDER):
+            children.setdefault(parent, []).append((position, row_id))
+
+    next_id = 4  # Chrome numbers its three roots 1-3
+    ids = {}
+
+    def build(row_id):
+        nonlocal next_id
+        guid = by_id[row_id]
+        _, row_type, _, _, _, title, url, added, modified, _ = rows[guid]
+        ids[row_id] = str(next_id)
+        next_id += 1
+        node = {'date_added': to_chrome_time(added), 'guid': guid_map.chrome_guid(guid),
+                'id': ids[row_id], 'name': title or ''}
+        if row_type == TYPE_BOOKMARK:
+            node.update(type='url', url=url or '')
+        else:
+            node.update(type='folder', date_modified=to_chrome_time(modified),
+                        children=[build(child) for _, child in sorted(children.get(row_id, []))])
+        return node
+
+    data = {'roots': {}, 'version': 1}
+    for root_id, (root_name, (chrome_guid, ff_guid, name)) in enumerate(ROOT_MAP.items(), start=1):
+        row = rows.get(ff_guid)
+        root = {'date_added': to_chrome_time(row[7] if row else 0), 'guid': chrome_guid,
+                'id': str(root_id), 'name': name, 'type': 'folder',
+                'date_modified': to_chrome_time(row[8] if row else 0), 'children': []}
+        if row:
+            root['children'] = [build(child) for _, child in sorted(children.get(row[0], []))]
+        data['roots'][root_name] = root
+
+    export_path = Path(export_path).expanduser()
+    export_path.mkdir(parents=True, exist_ok=True)
+    export_file = export_path / "Bookmarks_Chrome.json"
+    with open(export_file, 'w', encoding='utf-8') as f:
+        json.dump(set_checksum(data), f, indent=3, ensure_ascii=False)
+    guid_map.save()
+    print(f"✅ Exported Firefox bookmarks: {export_file}")
+    return export_file
+
+
+# --- local test database ------------------------------------------------------
+
+def create_places_db(places_path):
+    """Create an empty places.sqlite with the tables and roots the bridge uses"""
+    conn = sqlite3.connect(places_path)
+    conn.execute("PRAGMA journal_mode = WAL")  # Same journal mode Firefox uses
+    conn.executescript("""
+        CREATE TABLE moz_origins (id INTEGER PRIMARY KEY, prefix TEXT NOT NULL, host TEXT NOT NULL,
+                                  frecency INTEGER NOT NULL, UNIQUE (prefix, host));
+        CREATE TABLE moz_places (id INTEGER PRIMARY KEY, url LONGVARCHAR, title LONGVARCHAR,
+                                 rev_host LONGVARCHAR, visit_count INTEGER DEFAULT 0,
+                                 hidden INTEGER DEFAULT 0 NOT NULL, typed INTEGER DEFAULT 0 NOT NULL,
+                                 frecency INTEGER DEFAULT -1 NOT NULL, last_visit_date INTEGER,
+                                 guid TEXT, foreign_count INTEGER DEFAULT 0 NOT NULL,
+                                 url_hash INTEGER DEFAULT 0 NOT NULL, description TEXT,
+                                 preview_image_url TEXT, origin_id INTEGER REFERENCES moz_origins(id));
+        CREATE UNIQUE INDEX moz_places_guid_uniqueindex ON moz_places (guid);
+        CREATE INDEX moz_places_url_hashindex ON moz_places (url_hash);
+        CREATE TABLE moz_bookmarks (id INTEGER PRIMARY KEY, type INTEGER, fk INTEGER DEFAULT NULL,
+                                    parent INTEGER, position INTEGER, title LONGVARCHAR,
+                                    keyword_id INTEGER, folder_type TEXT, dateAdded INTEGER,
+                                    lastModified INTEGER, guid TEXT,
+                                    syncStatus INTEGER NOT NULL DEFAULT 0,
+                                    syncChangeCounter INTEGER NOT NULL DEFAULT 1);
+        CREATE INDEX moz_bookmarks_itemindex ON moz_bookmarks (fk, type);
+        CREATE INDEX moz_bookmarks_parentindex ON moz_bookmarks (parent, position);
+        CREATE UNIQUE INDEX moz_bookmarks_guid_uniqueindex ON moz_bookmarks (guid);
+        CREATE TABLE moz_bookmarks_deleted (guid TEXT PRIMARY KEY, dateRemoved INTEGER NOT NULL DEFAULT 0);
+    """)
+    now = int(time.time() * 1000000)
+    roots = [(1, 0, "", "root________"), (2, 1, "menu", "menu________"),
+             (3, 1, "toolbar", "toolbar_____"), (4, 1, "tags", "tags________"),
+             (5, 1, "unfiled", "unfiled_____"), (6, 1, "mobile", "mobile______")]
+    conn.executemany("""INSERT INTO moz_bookmarks (id, type, parent, position, title, dateAdded,
+                                                   lastModified, guid)
+                        VALUES (?, 2, ?, ?, ?, ?, ?, ?)""",
+                     [(row_id, parent, max(0, row_id - 2), title, now, now, guid)
+                      for row_id, parent, title, guid in roots])
+    conn.commit()
+    conn.close()
+    return Path(places_path)
+
+
+def benchmark(count=100000):
+    """Full import, incremental re-import and export against a fresh local database"""
+    workdir = Path(tempfile.mkdtemp(prefix="firefox_bridge_"))
+    places = create_places_db(workdir / "places.sqlite")
+    data = synthetic_bookmarks(count)
+    chrome_file = workdir / "Bookmarks_Chrome.json"
+    chrome_file.write_text(json.dumps(data))
+
+    start = time.perf_counter()
+    import_to_firefox(chrome_file, places, backup=False)
+    print(f"⏱️ Initial import of {count} bookmarks: {time.perf_counter() - start:.2f}s")
+
+    folder = data['roots']['bookmark_bar']['children'][0]
+    folder['children'][0]['name'] = "Renamed"
+    folder['children'].pop()
+    folder['children'].append({'guid': str(uuid.uuid4()), 'type': 'url', 'name': 'New', 'url': 'https://new.example'})
+    chrome_file.write_text(json.dumps(data))
+    start = time.perf_counter()
+    import_to_firefox(chrome_file, places, backup=False)
+    print(f"⏱️ Incremental import: {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    exported = export_from_firefox(places, workdir / "export")
+    print(f"⏱️ Export: {time.perf_counter() - start:.2f}s")
+    return exported
+
+
+if __name__ == "__main__":
+    # Usage: python firefox_bridge.py import [Bookmarks_Chrome.json] [places.sqlite]
+    #        python firefox_bridge.py export [export_dir] [places.sqlite]
+    #        python firefox_bridge.py create <places.sqlite>
+    #        python firefox_bridge.py bench [count]
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "import":
+        source = sys.argv[2] if len(sys.argv) > 2 else Path.cwd() / "exported_bookmarks" / "Bookmarks_Chrome.json"
+        import_to_firefox(source, sys.argv[3] if len(sys.argv) > 3 else get_firefox_places_path())
+    elif command == "export":
+        destination = sys.argv[2] if len(sys.argv) > 2 else Path.cwd() / "exported_bookmarks"
+        export_from_firefox(sys.argv[3] if len(sys.argv) > 3 else get_firefox_places_path(), destination)
+    elif command == "create" and len(sys.argv) > 2:
+        print(f"✅ Created {create_places_db(sys.argv[2])}")
+    elif command == "bench":
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 100000)
+    else:
+        print("Usage: python firefox_bridge.py import|export|create|bench ...")
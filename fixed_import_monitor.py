@@ -1,11 +1,23 @@
+import os
+import json
 import time
+import tempfile
 import subprocess
 import threading
-import hashlib
 from pathlib import Path
-from watchdog.observers import Observer
+from polling_observer import create_observer
 from watchdog.events import FileSystemEventHandler
-from bookmarks_import import import_bookmarks
+from bookmarks_import_fixed import import_bookmarks
+from compact_history import sync_after_compaction
+from sync_history import update_history_index, EXPORT_PATH
+from file_fingerprint import file_fingerprint
+from deferred_import import defer_enabled, get_deferred_importer
+from sync_latency import get_latency_tracker
+from push_resolver import three_way_merge
+
+
+# Remote tip whose snapshot was last imported (the worktree may lag behind it)
+IMPORTED_REF = "refs/bookmarks-sync/imported"
 
 
 class ImportChangeHandler(FileSystemEventHandler):
@@ -17,12 +29,8 @@ class ImportChangeHandler(FileSystemEventHandler):
         self.processing = False
 
     def get_file_hash(self, filepath):
-        """Get file hash to detect actual changes"""
-        try:
-            with open(filepath, 'rb') as f:
-                return hashlib.md5(f.read()).hexdigest()
-        except Exception:
-            return None
+        """Get file fingerprint to detect actual changes (free if its stat is unchanged)"""
+        return file_fingerprint(filepath)
 
     def on_modified(self, event):
         if event.is_directory or self.processing:
@@ -51,35 +59,120 @@ class ImportChangeHandler(FileSystemEventHandler):
                     time.sleep(2)
                     
                     try:
-                        import_bookmarks(event.src_path)
-                        self.last_hash = current_hash
-                        self.last_import_time = current_time
+                        imported, deferred = _import(event.src_path)
+                        if imported:
+                            if not deferred:
+                                # Pulled commits are now visible in Chrome (deferred: once it is applied)
+                                get_latency_tracker().mark_applied()
+                            self.last_hash = current_hash
+                            self.last_import_time = current_time
                     except Exception as e:
                         print(f"❌ Import failed: {e}")
                     finally:
                         self.processing = False
 
 
-def git_pull_changes():
+def _import(import_file):
+    """Import now, or queue it until Chrome exits; returns (imported or queued, deferred)"""
+    deferred = defer_enabled() and is_chrome_running()
+    return import_bookmarks(import_file, defer=deferred), deferred
+
+
+def _git(*args):
+    return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+
+
+def _export_at(rev):
+    """The exported tree at rev, or None if rev has no single-file export"""
+    result = subprocess.run(["git", "show", f"{rev}:{EXPORT_PATH}"], capture_output=True, text=True)
+    return json.loads(result.stdout) if result.returncode == 0 else None
+
+
+def _merge_worktree(tip):
+    if subprocess.run(["git", "merge", "--no-edit", "-q", tip]).returncode == 0:
+        update_history_index()
+        return True
+    subprocess.run(["git", "merge", "--abort"], capture_output=True)
+    print("⚠️ Worktree merge conflicted; left as is")
+    return False
+
+
+def update_worktree_enabled():
+    """BOOKMARKS_SYNC_UPDATE_WORKTREE=0 leaves the checkout alone; imports read git objects directly"""
+    return os.environ.get("BOOKMARKS_SYNC_UPDATE_WORKTREE", "1").lower() not in ("0", "false", "no")
+
+
+def import_remote_changes(handler, update_worktree=None):
+    """Fetch and import the snapshot at the new remote tip straight from the object store.
+
+    Only the final state is applied, however many commits arrived, and the
+    worktree is not needed for it; updating it afterwards is optional.
+    """
     try:
         # Check if there are remote changes first
         subprocess.run(["git", "fetch"], check=True, capture_output=True)
-        
-        # Check if local is behind remote
-        result = subprocess.run(
-            ["git", "rev-list", "--count", "HEAD..origin/main"], 
-            capture_output=True, text=True, check=True
-        )
-        
-        if result.stdout.strip() != "0":
-            subprocess.run(["git", "pull"], check=True)
-            print("📥 Pulled latest from GitHub")
-            return True
-        else:
+
+        # A compacted remote can't be pulled into the old history; move onto it, then import as usual
+        recovered = sync_after_compaction()
+
+        tip = _git("rev-parse", "origin/main")
+        imported = subprocess.run(["git", "rev-parse", "--verify", "-q", IMPORTED_REF],
+                                  capture_output=True, text=True).stdout.strip()
+        # After recovery HEAD contains the tip without its snapshot having been imported
+        already_local = not recovered and subprocess.run(
+            ["git", "merge-base", "--is-ancestor", tip, "HEAD"]).returncode == 0
+        if tip == imported or already_local:
             print("✅ Already up to date")
             return False
-    except subprocess.CalledProcessError as e:
-        print(f"❌ Git pull failed: {e}")
+
+        # Origin timestamps of the incoming commits, for edit-to-visible latency
+        tracker = get_latency_tracker()
+        incoming = tracker.incoming(tip, imported or "HEAD")
+        pulled_at = time.time()
+
+        remote = _export_at(tip)
+        if remote is None:
+            # Sharded or CRDT layout: the files arrive with the worktree merge and import from there
+            return _merge_worktree(tip)
+
+        # Local commits the tip lacks (e.g. a queued push) must survive the import
+        if subprocess.run(["git", "merge-base", "--is-ancestor", "HEAD", tip]).returncode != 0:
+            base = _git("merge-base", "HEAD", tip)
+            local = _export_at("HEAD")
+            if local is not None:
+                print("🔀 Local commits not pushed yet; importing them merged with the remote")
+                remote = three_way_merge(_export_at(base), local, remote)
+
+        snapshot = Path(tempfile.gettempdir()) / "Bookmarks_Chrome.remote.json"
+        with open(snapshot, 'w', encoding='utf-8') as f:
+            json.dump(remote, f, indent=3, ensure_ascii=False)
+
+        with handler.import_lock:
+            handler.processing = True
+            try:
+                print(f"📥 Importing remote snapshot {tip[:8]}...")
+                imported, deferred = _import(snapshot)
+                if not imported:
+                    # Leave IMPORTED_REF behind so the next check retries this tip
+                    return False
+                # The same bytes landing in the worktree later must not import again
+                handler.last_hash = file_fingerprint(snapshot)
+                handler.last_import_time = time.time()
+            finally:
+                handler.processing = False
+
+        # A queued import owns the snapshot now; it marks the commits applied when it lands
+        _git("update-ref", IMPORTED_REF, tip)
+        tracker.record_pulled(incoming, pulled_at)
+        if not deferred:
+            tracker.mark_applied()
+
+        if update_worktree_enabled() if update_worktree is None else update_worktree:
+            _merge_worktree(tip)  # The import already applied either way
+        return True
+    except (subprocess.CalledProcessError, OSError, ValueError) as e:
+        # Nothing was recorded as imported, so the next check retries this tip
+        print(f"❌ Remote import failed: {e}")
         return False
 
 
@@ -107,9 +200,13 @@ if __name__ == "__main__":
     if is_chrome_running():
         print("⚠️ Chrome is running. Close Chrome for reliable sync or expect occasional permission errors.")
 
+    # Apply (or verify) a deferred import queued while Chrome was running
+    get_deferred_importer().resume()
+
     event_handler = ImportChangeHandler()
-    observer = Observer()
-    observer.schedule(event_handler, path=str(bookmarks_dir), recursive=False)
+    observer = create_observer()
+    observer.schedule(event_handler, path=str(bookmarks_dir), recursive=False,
+                      filenames=("Bookmarks_Chrome.json",))
 
     print(f"👀 Watching for synced file changes in: {bookmarks_dir}")
     print("🔄 Will check for remote updates every 30 seconds")
@@ -119,9 +216,8 @@ if __name__ == "__main__":
 
     try:
         while True:
-            if git_pull_changes():
-                # If we pulled changes, the file watcher will handle the import
-                time.sleep(5)  # Give file watcher time to process
+            if import_remote_changes(event_handler):
+                time.sleep(5)  # Let the worktree update's file event settle
             time.sleep(30)  # Check every 30 seconds
     except KeyboardInterrupt:
         print("\n🛑 Stopping import monitor...")
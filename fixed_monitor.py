@@ -2,7 +2,7 @@ import time
 import subprocess
 import threading
 from pathlib import Path
-from watchdog.observers import Observer
+from polling_observer import create_observer
 from watchdog.events import FileSystemEventHandler
 from bookmarks_export import export_bookmarks, get_chrome_bookmarks_path
 
@@ -92,7 +92,7 @@ if __name__ == "__main__":
         )
 
     event_handler = BookmarkChangeHandler(export_dir)
-    observer = Observer()
+    observer = create_observer()
     observer.schedule(event_handler, path=str(folder_to_watch), recursive=False)
 
     print(f"👀 Watching for changes in: {folder_to_watch}")
@@ -2,7 +2,7 @@
 import time
 import subprocess
 from pathlib import Path
-from watchdog.observers import Observer
+from polling_observer import create_observer
 from watchdog.events import FileSystemEventHandler
 from bookmarks_import import import_bookmarks
 
@@ -27,8 +27,9 @@ if __name__ == "__main__":
     bookmarks_dir = bookmarks_file.parent
 
     event_handler = ImportChangeHandler()
-    observer = Observer()
-    observer.schedule(event_handler, path=str(bookmarks_dir), recursive=False)
+    observer = create_observer()
+    observer.schedule(event_handler, path=str(bookmarks_dir), recursive=False,
+                      filenames=("Bookmarks_Chrome.json",))
 
     print(f"👀 Watching for synced file changes in: {bookmarks_dir}")
     observer.start()
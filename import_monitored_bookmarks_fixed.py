@@ -1,11 +1,17 @@
 import time
 import subprocess
 import threading
-import hashlib
 from pathlib import Path
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+from polling_observer import create_observer
+from watchdog.events import FileSystemEventHandler, FileModifiedEvent
 from bookmarks_import import import_bookmarks
+from bookmarks_shards import MANIFEST_NAME, import_sharded
+from bookmark_crdt import import_crdt
+from bookmark_search import update_search_index
+from compact_history import sync_after_compaction
+from bookmarks_export import get_chrome_bookmarks_path
+from sync_state import SyncState
+from file_fingerprint import file_fingerprint
 
 
 class ImportChangeHandler(FileSystemEventHandler):
@@ -19,22 +25,28 @@ class ImportChangeHandler(FileSystemEventHandler):
         self._update_current_hash()
 
     def _get_file_hash(self, file_path):
-        """Get MD5 hash of file to detect actual changes"""
-        try:
-            if not Path(file_path).exists():
-                return None
-            with open(file_path, 'rb') as f:
-                return hashlib.md5(f.read()).hexdigest()
-        except (PermissionError, OSError):
-            return None
+        """Get fingerprint of file to detect actual changes (free if its stat is unchanged)"""
+        return file_fingerprint(file_path)
 
     def _update_current_hash(self):
-        """Update hash of the synced bookmarks file"""
+        """Load the hash of the last imported file, hashing only on first run"""
         bookmarks_file = Path.cwd() / "exported_bookmarks" / "Bookmarks_Chrome.json"
-        self.last_hash = self._get_file_hash(bookmarks_file)
+        self.state = SyncState()
+        snapshot = self.state.load_snapshot('import', bookmarks_file)
+        if snapshot:
+            self.last_hash = snapshot['hash']
+            # Snapshots from before fingerprints carried their algorithm are plain MD5
+            if self.last_hash and ":" not in self.last_hash:
+                if file_fingerprint(bookmarks_file, 'md5') == f"md5:{self.last_hash}":
+                    self.last_hash = self._get_file_hash(bookmarks_file)
+                    self.state.save_snapshot('import', bookmarks_file, hash=self.last_hash)
+        else:
+            self.last_hash = self._get_file_hash(bookmarks_file)
+            self.state.save_snapshot('import', bookmarks_file, hash=self.last_hash)
 
     def on_modified(self, event):
-        if not event.src_path.endswith("Bookmarks_Chrome.json"):
+        # Monolithic export, the manifest of the sharded layout, or a device op log
+        if not event.src_path.endswith(("Bookmarks_Chrome.json", MANIFEST_NAME, ".jsonl")):
             return
 
         current_time = time.time()
@@ -68,15 +80,28 @@ class ImportChangeHandler(FileSystemEventHandler):
             if self._safe_import(event.src_path):
                 self.last_hash = current_hash
                 self.last_import_time = current_time
+                self.state.save_snapshot('import', event.src_path, hash=current_hash)
+                self.state.record_sync(get_chrome_bookmarks_path(), event.src_path)
                 
         finally:
             self.processing_lock.release()
 
+    def on_created(self, event):
+        # A new device's op log (or a first export) shows up as a created file
+        self.on_modified(event)
+
     def _safe_import(self, import_file):
         """Safely import bookmarks with error handling"""
         try:
-            import_bookmarks(import_file)
+            if import_file.endswith(MANIFEST_NAME):
+                import_sharded(Path(import_file).parent)
+            elif import_file.endswith(".jsonl"):
+                import_crdt(Path(import_file).parent)
+            else:
+                import_bookmarks(import_file)
             print("✅ Import completed successfully")
+            if import_file.endswith("Bookmarks_Chrome.json"):
+                update_search_index(import_file)
             return True
         except Exception as e:
             print(f"❌ Import failed: {e}")
@@ -98,6 +123,12 @@ class ImportChangeHandler(FileSystemEventHandler):
 def git_pull_changes():
     """Pull latest changes from git repository"""
     try:
+        # A compacted remote can't be pulled into the old history
+        subprocess.run(["git", "fetch"], capture_output=True, check=True)
+        if sync_after_compaction():
+            print("📥 Switched to compacted remote history")
+            return True
+
         result = subprocess.run(["git", "pull"], capture_output=True, text=True, check=True)
         
         # Only print if there were actual changes
@@ -119,14 +150,25 @@ if __name__ == "__main__":
     bookmarks_dir.mkdir(parents=True, exist_ok=True)
 
     event_handler = ImportChangeHandler()
-    observer = Observer()
-    observer.schedule(event_handler, path=str(bookmarks_dir), recursive=False)
+    observer = create_observer()
+    # Polled network mounts only see the files named here, so list every layout's trigger
+    observer.schedule(event_handler, path=str(bookmarks_dir), recursive=True,
+                      filenames=("Bookmarks_Chrome.json", f"shards/{MANIFEST_NAME}", "oplog/*.jsonl"))
 
     print(f"👀 Watching for synced file changes in: {bookmarks_dir}")
     print("⚡ Infinite loop protection: ACTIVE")
     
     observer.start()
 
+    # Apply synced changes that arrived while the monitor was not running
+    direction = event_handler.state.decide_direction(get_chrome_bookmarks_path(), bookmarks_file)
+    if direction == 'import':
+        print("🔄 Synced bookmarks changed while offline, importing...")
+        event_handler.on_modified(FileModifiedEvent(str(bookmarks_file)))
+    elif direction == 'conflict':
+        # Merged (or backed up and skipped) by the export monitor's catch-up, never overwritten here
+        print("⚠️ Local and synced bookmarks both changed while offline; the export monitor merges them")
+
     try:
         pull_counter = 0
         while True:
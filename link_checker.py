@@ -0,0 +1,386 @@
+import ssl
+import sys
+import json
+import time
+import socket
+import sqlite3
+import asyncio
+import threading
+from pathlib import Path
+from collections import deque
+from urllib.parse import urlsplit, urljoin, quote
+from bookmark_tree import WEBKIT_EPOCH_OFFSET_US, iter_bookmarks, load_bookmarks
+from bookmarks_export import get_state_dir
+from chrome_checksum import set_checksum
+
+
+USER_AGENT = "bookmarks-sync-link-checker/1.0"
+DEAD_FOLDER_NAME = "💀 Dead Links"
+DEAD_FOLDER_GUID = "d3adb00c-0000-4000-8000-000000000001"
+# How long a result stays fresh, by state
+TTLS = {'ok': 7 * 86400, 'dead': 86400, 'error': 3600}
+REDIRECTS = {301, 302, 303, 307, 308}
+MAX_HEADER_BYTES = 64 * 1024
+
+
+class HostPool:
+    """Idle keep-alive connections and a concurrency limit for one scheme/host/port"""
+
+    def __init__(self, limit):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.idle = []
+
+
+class HttpClient:
+    """Minimal asyncio HTTP/1.1 client with per-host connection pooling and limits"""
+
+    def __init__(self, per_host_limit=4, total_limit=200, timeout=10):
+        self.per_host_limit = per_host_limit
+        self.total = asyncio.Semaphore(total_limit)
+        self.timeout = timeout
+        self.pools = {}
+        self.ssl_context = ssl.create_default_context()
+        self.stats = {'requests': 0, 'connections_opened': 0, 'connections_reused': 0}
+
+    async def _open(self, scheme, host, port):
+        self.stats['connections_opened'] += 1
+        return await asyncio.wait_for(asyncio.open_connection(
+            host, port, ssl=self.ssl_context if scheme == 'https' else None,
+            server_hostname=host if scheme == 'https' else None, limit=MAX_HEADER_BYTES), self.timeout)
+
+    async def _exchange(self, reader, writer, method, target, host_header):
+        writer.write((f"{method} {target} HTTP/1.1\r\nHost: {host_header}\r\nUser-Agent: {USER_AGENT}\r\n"
+                      "Accept: */*\r\nConnection: keep-alive\r\n\r\n").encode('latin-1'))
+        await writer.drain()
+        while True:
+            try:
+                head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.timeout)
+            except asyncio.LimitOverrunError:
+                raise ValueError(f"Response headers exceed {MAX_HEADER_BYTES} bytes") from None
+            lines = head.decode('latin-1').split("\r\n")
+            fields = lines[0].split(" ", 2)
+            if len(fields) < 2 or not fields[1].isdigit():
+                raise ValueError(f"Malformed status line: {lines[0][:80]!r}")
+            status = int(fields[1])
+            if status >= 200 or status == 101:
+                break  # Skip interim 1xx responses
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        return status, headers
+
+    async def request(self, method, url, redirects=5):
+        """Returns (status, final_url); raises OSError/asyncio.TimeoutError on network failure"""
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f"Unsupported URL: {url}")
+        port = parts.port or (443 if scheme == 'https' else 80)
+        target = quote(parts.path or "/", safe="/%:@&=+$,;~!*'()[]") + (f"?{parts.query}" if parts.query else "")
+        host_header = parts.hostname if parts.port is None else f"{parts.hostname}:{parts.port}"
+        pool = self.pools.setdefault((scheme, parts.hostname, port), HostPool(self.per_host_limit))
+
+        # Host slot first: a request queued behind a busy host must not hold a global slot
+        async with pool.semaphore, self.total:
+            self.stats['requests'] += 1
+            reused = bool(pool.idle)
+            reader, writer = pool.idle.pop() if reused else await self._open(scheme, parts.hostname, port)
+            try:
+                try:
+                    status, headers = await self._exchange(reader, writer, method, target, host_header)
+                except (asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError):
+                    if not reused:
+                        raise
+                    # The server closed an idle pooled connection; retry once on a fresh one
+                    writer.close()
+                    reader, writer = await self._open(scheme, parts.hostname, port)
+                    status, headers = await self._exchange(reader, writer, method, target, host_header)
+                if reused:
+                    self.stats['connections_reused'] += 1
+            except BaseException:
+                writer.close()
+                raise
+            # HEAD responses have no body, so the connection can go straight back to the pool;
+            # GET bodies are never read, so those connections are closed
+            if method == 'HEAD' and headers.get('connection', '').lower() != 'close':
+                pool.idle.append((reader, writer))
+            else:
+                writer.close()
+
+        if status in REDIRECTS and headers.get('location') and redirects:
+            next_method = method if status in (307, 308) or method == 'HEAD' else 'GET'
+            return await self.request(next_method, urljoin(url, headers['location']), redirects - 1)
+        return status, url
+
+    def close(self):
+        for pool in self.pools.values():
+            for _, writer in pool.idle:
+                writer.close()
+            pool.idle.clear()
+
+
+async def probe(client, url):
+    """HEAD first, GET if the server rejects or mishandles HEAD"""
+    result = {'url': url, 'checked_at': time.time(), 'status': None, 'error': None}
+    try:
+        status, final_url = await client.request('HEAD', url)
+        if status >= 400:
+            status, final_url = await client.request('GET', url)
+        result.update(status=status, final_url=final_url)
+        result['state'] = 'ok' if status < 400 else 'dead' if status in (404, 410) else 'error'
+    except socket.gaierror as e:
+        result.update(state='dead', error=f"DNS: {e}")  # Host no longer exists
+    except ValueError as e:
+        result.update(state='error', error=str(e))
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ssl.SSLError) as e:
+        result.update(state='error', error=f"{type(e).__name__}: {e}")
+    return result
+
+
+class LinkCache:
+    """Probe results keyed by URL, with per-state TTLs"""
+
+    def __init__(self, db_path=None):
+        self.db_path = Path(db_path) if db_path else get_state_dir() / "link_cache.sqlite"
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS links (
+            url TEXT PRIMARY KEY, state TEXT, status INTEGER, error TEXT, final_url TEXT, checked_at REAL)""")
+
+    def lookup(self, urls, ttls=TTLS):
+        """Split urls into fresh cached results and URLs that need probing"""
+        fresh, stale = {}, []
+        now = time.time()
+        for url in urls:
+            row = self.conn.execute("SELECT state, status, error, final_url, checked_at FROM links WHERE url = ?",
+                                    (url,)).fetchone()
+            if row and now - row[4] < ttls.get(row[0], 0):
+                fresh[url] = {'url': url, 'state': row[0], 'status': row[1], 'error': row[2],
+                              'final_url': row[3], 'checked_at': row[4]}
+            else:
+                stale.append(url)
+        return fresh, stale
+
+    def store(self, results):
+        self.conn.executemany("INSERT OR REPLACE INTO links VALUES (?, ?, ?, ?, ?, ?)",
+                              [(r['url'], r['state'], r['status'], r['error'], r.get('final_url'), r['checked_at'])
+                               for r in results])
+        self.conn.commit()
+
+
+async def probe_all(urls, cache, per_host_limit=4, concurrency=200, timeout=10):
+    """Probe urls with a fixed set of workers; results are cached in batches as they finish.
+
+    Work is handed out as per-host slots (at most per_host_limit per host), so a
+    worker never sits waiting on a busy host while other hosts have URLs left.
+    """
+    client = HttpClient(per_host_limit, concurrency, timeout)
+    hosts = {}
+    for url in urls:
+        parts = urlsplit(url)
+        try:
+            key = (parts.scheme.lower(), parts.hostname, parts.port)
+        except ValueError:
+            key = None  # Malformed port: probe() reports it
+        hosts.setdefault(key, deque()).append(url)
+    # Interleave the hosts' slots so the first workers spread over as many hosts as possible
+    slots = asyncio.Queue()
+    for round_index in range(per_host_limit):
+        for key, pending in hosts.items():
+            if round_index < len(pending):
+                slots.put_nowait(key)
+    results, batch = {}, []
+
+    async def worker():
+        while True:
+            try:
+                key = slots.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            url = hosts[key].popleft()
+            result = await probe(client, url)
+            results[url] = result
+            batch.append(result)
+            if len(batch) >= 500:
+                cache.store(batch[:])
+                batch.clear()
+            if hosts[key]:
+                slots.put_nowait(key)  # Hand this host's slot to the next free worker
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, len(urls)) or 1)))
+    finally:
+        client.close()
+        cache.store(batch)
+    return results, client.stats
+
+
+def move_dead_links(data, dead_urls):
+    """Move bookmarks with dead URLs into a dead-links folder under 'other'"""
+    moved = []
+    for node, path, _ in list(iter_bookmarks(data)):
+        if node.get('url') in dead_urls and not path.endswith(DEAD_FOLDER_NAME):
+            moved.append(node)
+    if not moved:
+        return 0
+
+    moved_ids = {id(node) for node in moved}
+
+    def remove(node):
+        children = node.get('children')
+        if isinstance(children, list):
+            node['children'] = [child for child in children if id(child) not in moved_ids]
+            for child in node['children']:
+                remove(child)
+
+    for root in data.get('roots', {}).values():
+        if isinstance(root, dict):
+            remove(root)
+
+    other = data['roots'].setdefault('other', {'type': 'folder', 'name': 'Other Bookmarks', 'children': []})
+    folder = next((child for child in other.get('children', []) if child.get('guid') == DEAD_FOLDER_GUID), None)
+    if folder is None:
+        # Chrome ids are small sequential integers; take the next free one
+        ids, stack = [], [root for root in data['roots'].values() if isinstance(root, dict)]
+        while stack:
+            node = stack.pop()
+            if str(node.get('id', '')).isdigit():
+                ids.append(int(node['id']))
+            stack.extend(child for child in node.get('children', []) if isinstance(child, dict))
+        folder = {'type': 'folder', 'name': DEAD_FOLDER_NAME, 'guid': DEAD_FOLDER_GUID,
+                  'id': str(max(ids, default=0) + 1),
+                  'date_added': str(int(time.time() * 1000000) + WEBKIT_EPOCH_OFFSET_US), 'children': []}
+        other.setdefault('children', []).append(folder)
+    folder['children'].extend(moved)
+    set_checksum(data)
+    return len(moved)
+
+
+def check_links(export_file, report_file=None, dead_folder=False, per_host_limit=4, concurrency=200,
+                timeout=10, cache=None):
+    """Check every bookmark URL in an exported tree and write a JSON report"""
+    export_file = Path(export_file)
+    data = load_bookmarks(export_file)
+    bookmarks = [(node, path) for node, path, _ in iter_bookmarks(data)
+                 if node.get('url', '').startswith(('http://', 'https://'))]
+    urls = list(dict.fromkeys(node['url'] for node, _ in bookmarks))
+
+    cache = cache or LinkCache()
+    results, stale = cache.lookup(urls)
+    print(f"🔗 {len(urls)} unique URLs: {len(results)} cached, probing {len(stale)}")
+
+    start = time.perf_counter()
+    probed, stats = asyncio.run(probe_all(stale, cache, per_host_limit, concurrency, timeout)) if stale else ({}, {})
+    elapsed = time.perf_counter() - start
+    results.update(probed)
+
+    report = {'summary': {state: sum(1 for r in results.values() if r['state'] == state) for state in TTLS},
+              'probed': len(stale), 'seconds': round(elapsed, 2), 'client': stats,
+              'dead': [], 'errors': []}
+    for node, path in bookmarks:
+        result = results[node['url']]
+        if result['state'] != 'ok':
+            entry = {'name': node.get('name', ''), 'path': path, 'url': node['url'],
+                     'status': result['status'], 'error': result['error']}
+            report['dead' if result['state'] == 'dead' else 'errors'].append(entry)
+
+    report_file = Path(report_file) if report_file else export_file.with_name("link_report.json")
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"📋 {report['summary']['ok']} ok, {report['summary']['dead']} dead, "
+          f"{report['summary']['error']} errors in {elapsed:.1f}s -> {report_file}")
+
+    if dead_folder:
+        dead_urls = {url for url, result in results.items() if result['state'] == 'dead'}
+        moved = move_dead_links(data, dead_urls)
+        if moved:
+            with open(export_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=3, ensure_ascii=False)
+            print(f"💀 Moved {moved} dead bookmarks to '{DEAD_FOLDER_NAME}'")
+    return report
+
+
+def start_test_servers(count=4):
+    """Local HTTP stand-ins: /ok/*, /missing/* (404), /nohead/* (405 on HEAD, 200 on GET), /moved/*"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _respond(self, body):
+            if self.path.startswith("/missing"):
+                status = 404
+            elif self.path.startswith("/nohead") and self.command == "HEAD":
+                status = 405
+            elif self.path.startswith("/moved"):
+                self.send_response(301)
+                self.send_header("Location", self.path.replace("/moved", "/ok", 1))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            else:
+                status = 200
+            self.send_response(status)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            if body:
+                self.wfile.write(b"ok")
+
+        def do_HEAD(self):
+            self._respond(False)
+
+        def do_GET(self):
+            self._respond(True)
+
+        def log_message(self, *args):
+            pass
+
+    servers = []
+    for _ in range(count):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    return servers
+
+
+def benchmark(count=20000):
+    """Check count URLs spread over local stand-in hosts, then rerun against the cache"""
+    import tempfile
+
+    servers = start_test_servers()
+    kinds = ['ok', 'ok', 'ok', 'missing', 'nohead', 'moved']
+    children = [{'type': 'url', 'guid': str(i), 'id': str(i + 10), 'name': f"Link {i}",
+                 'url': f"http://127.0.0.1:{servers[i % len(servers)].server_address[1]}/{kinds[i % len(kinds)]}/{i}"}
+                for i in range(count)]
+    workdir = Path(tempfile.mkdtemp(prefix="link_checker_"))
+    export_file = workdir / "Bookmarks_Chrome.json"
+    export_file.write_text(json.dumps({'roots': {'bookmark_bar': {'type': 'folder', 'name': 'Bar', 'children': children},
+                                                 'other': {'type': 'folder', 'name': 'Other', 'children': []}}}))
+    cache = LinkCache(workdir / "link_cache.sqlite")
+    report = check_links(export_file, dead_folder=True, per_host_limit=16, cache=cache)
+    print(f"🔌 {report['client']}")
+    check_links(export_file, cache=cache)  # Everything is fresh now: no probes
+    for server in servers:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    # Usage: python link_checker.py check-links [export_file] [--report FILE] [--dead-folder]
+    #                                           [--per-host N] [--concurrency N]
+    #        python link_checker.py bench [count]
+    args = sys.argv[1:]
+    if args and args[0] == "bench":
+        benchmark(int(args[1]) if len(args) > 1 else 20000)
+    elif args and args[0] == "check-links":
+        def option(name, default):
+            return args[args.index(name) + 1] if name in args else default
+
+        positional = [arg for i, arg in enumerate(args[1:], 1)
+                      if not arg.startswith("--") and not args[i - 1] in ("--report", "--per-host", "--concurrency")]
+        check_links(positional[0] if positional else Path.cwd() / "exported_bookmarks" / "Bookmarks_Chrome.json",
+                    report_file=option("--report", None), dead_folder="--dead-folder" in args,
+                    per_host_limit=int(option("--per-host", 4)), concurrency=int(option("--concurrency", 200)))
+    else:
+        print("Usage: python link_checker.py check-links [export_file] [--report FILE] [--dead-folder] | bench [count]")
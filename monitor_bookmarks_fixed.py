@@ -1,34 +1,41 @@
+import os
+import sys
 import time
 import subprocess
 import threading
-import hashlib
 from pathlib import Path
-from watchdog.observers import Observer
+from polling_observer import create_observer
 from watchdog.events import FileSystemEventHandler
 from bookmarks_export import export_bookmarks, get_chrome_bookmarks_path
+from bookmarks_shards import export_sharded
+from bookmark_crdt import export_crdt
+from bookmark_tree import load_bookmarks
+from peer_sync import PeerHub, import_peer_tree, parse_peer_address
+from sync_queue import push_or_enqueue, get_outbound_queue
+from sync_history import commit_sync_changes
+from file_fingerprint import file_fingerprint
+from change_feed import maybe_start_feed_server
 
 
 class BookmarkChangeHandler(FileSystemEventHandler):
-    def __init__(self, export_dir):
+    def __init__(self, export_dir, sharded=False, crdt=False):
         self.export_dir = Path(export_dir)
+        self.sharded = sharded  # Per-folder shard layout instead of one JSON blob
+        self.crdt = crdt  # Per-device operation logs instead of whole-file snapshots
+        self.peer_hub = None  # Optional direct LAN transport beside git
         self.last_hash = None
         self.last_export_time = 0
         self.cooldown_period = 5  # 5 seconds cooldown
         self.processing_lock = threading.Lock()
         self.ignore_next_change = False
+        self.latency_stamp = None
         
         # Initialize with current file hash
         self._update_current_hash()
 
     def _get_file_hash(self, file_path):
-        """Get MD5 hash of file to detect actual changes"""
-        try:
-            if not Path(file_path).exists():
-                return None
-            with open(file_path, 'rb') as f:
-                return hashlib.md5(f.read()).hexdigest()
-        except (PermissionError, OSError):
-            return None
+        """Get fingerprint of file to detect actual changes (free if its stat is unchanged)"""
+        return file_fingerprint(file_path)
 
     def _update_current_hash(self):
         """Update the current hash of bookmarks file"""
@@ -68,6 +75,8 @@ class BookmarkChangeHandler(FileSystemEventHandler):
                 return
 
             print("📌 Real bookmark change detected, exporting...")
+            # Edit (file mtime) and detection times, stamped on the commit for latency tracking
+            self.latency_stamp = (os.path.getmtime(event.src_path), current_time)
             
             # Wait for file to be stable (Chrome might still be writing)
             time.sleep(1)
@@ -83,8 +92,17 @@ class BookmarkChangeHandler(FileSystemEventHandler):
     def _safe_export(self):
         """Safely export bookmarks with error handling"""
         try:
-            export_bookmarks(self.export_dir)
-            git_push_changes()
+            if self.crdt:
+                # Each device only appends to its own log; a rejected push merges the logs
+                git_push_changes(export_crdt(self.export_dir), stamp=self.latency_stamp)
+            elif self.sharded:
+                git_push_changes(export_sharded(self.export_dir), stamp=self.latency_stamp)
+            else:
+                export_file = export_bookmarks(self.export_dir)
+                # Peers get the delta immediately; git remains the durable path
+                if self.peer_hub:
+                    self.peer_hub.publish_file(export_file)
+                git_push_changes(stamp=self.latency_stamp)
             return True
         except Exception as e:
             print(f"❌ Export failed: {e}")
@@ -98,20 +116,32 @@ class BookmarkChangeHandler(FileSystemEventHandler):
             threading.Timer(3.0, lambda: setattr(self, 'ignore_next_change', False)).start()
 
 
-def git_push_changes():
+def git_push_changes(paths=None, stamp=None):
+    """Commit and push; when paths is given only those paths are staged.
+
+    stamp is (edit time, detection time) for the latency trailers.
+    """
+    pathspec = ["--"] + [str(path) for path in paths] if paths is not None else []
     try:
+        if paths is not None and not paths:
+            print("📝 No changes to commit")
+            return
+
         # Check if there are actually changes to commit
-        result = subprocess.run(["git", "status", "--porcelain"], 
+        result = subprocess.run(["git", "status", "--porcelain"] + pathspec,
                               capture_output=True, text=True, check=True)
         
         if not result.stdout.strip():
             print("📝 No changes to commit")
             return
             
-        subprocess.run(["git", "add", "."], check=True)
-        subprocess.run(["git", "commit", "-m", "🔁 Auto-sync bookmark changes"], check=True)
-        subprocess.run(["git", "push"], check=True)
-        print("🚀 Pushed to GitHub")
+        if paths is not None:
+            subprocess.run(["git", "add", "-A"] + pathspec, check=True)
+        else:
+            subprocess.run(["git", "add", "."], check=True)
+        commit_sync_changes("🔁 Auto-sync bookmark changes", stamp=stamp)
+        if push_or_enqueue(bookmarks_file=get_chrome_bookmarks_path()):
+            print("🚀 Pushed to GitHub")
         
     except subprocess.CalledProcessError as e:
         print(f"❌ Git operation failed: {e}")
@@ -126,9 +156,28 @@ if __name__ == "__main__":
     folder_to_watch = bookmarks_path.parent
     export_dir = Path.cwd() / "exported_bookmarks"
 
-    handler_instance = BookmarkChangeHandler(export_dir)
+    handler_instance = BookmarkChangeHandler(export_dir, sharded="--sharded" in sys.argv,
+                                             crdt="--crdt" in sys.argv)
     event_handler = handler_instance
-    observer = Observer()
+
+    # Optional peer transport: --peer-listen HOST:PORT|SOCKET, --peer HOST:PORT|SOCKET
+    # (listening beyond loopback needs BOOKMARKS_SYNC_PEER_SECRET, shared by every peer)
+    if "--peer-listen" in sys.argv or "--peer" in sys.argv:
+        def apply_peer_tree(tree):
+            handler_instance.set_ignore_next_change(True)
+            import_peer_tree(tree)
+
+        peer_hub = PeerHub(on_update=apply_peer_tree)
+        peer_hub.load(load_bookmarks(bookmarks_path))
+        if "--peer-listen" in sys.argv:
+            peer_hub.listen(parse_peer_address(sys.argv[sys.argv.index("--peer-listen") + 1]))
+        for index, arg in enumerate(sys.argv):
+            if arg == "--peer":
+                peer_hub.connect(parse_peer_address(sys.argv[index + 1]))
+        handler_instance.peer_hub = peer_hub
+        print("🔗 Peer sync: ACTIVE")
+
+    observer = create_observer()
     observer.schedule(event_handler, path=str(folder_to_watch), recursive=False)
 
     print(f"👀 Watching for changes in: {folder_to_watch}")
@@ -137,6 +186,15 @@ if __name__ == "__main__":
     
     observer.start()
 
+    # Structured change events for local consumers (BOOKMARKS_SYNC_FEED)
+    maybe_start_feed_server()
+
+    # Retry syncs left unpushed by a previous run (offline, remote down, ...)
+    outbound_queue = get_outbound_queue()
+    if outbound_queue.depth():
+        print(f"📮 {outbound_queue.depth()} queued syncs pending, flushing in background")
+        outbound_queue.start()
+
     try:
         while True:
             time.sleep(1)
@@ -0,0 +1,176 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import tempfile
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing.shared_memory import SharedMemory
+from bookmark_tree import structure_hash, core_bookmark_hash, count_url_nodes, index_nodes, synthetic_bookmarks
+from chrome_checksum import verify_checksum, set_checksum, TornReadError
+from sync_filters import SyncFilter, filter_tree
+
+
+STAGES = ('structure_hash', 'core_hash', 'count', 'index')
+DIGEST_SIZE = 8
+
+
+def _index_digest(node):
+    payload = "\0".join(str(node[key]) for key in ('parent', 'index', 'type', 'name', 'url'))
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=DIGEST_SIZE).digest()
+
+
+def compact_index(data):
+    """guid -> record digest, packed as one newline-joined string and one bytes blob"""
+    nodes = index_nodes(data)
+    return {'guids': "\n".join(str(guid) for guid in nodes), 'digests': b"".join(_index_digest(node) for node in nodes.values())}
+
+
+def unpack_index(index):
+    guids = index['guids'].split("\n") if index['guids'] else []
+    digests = index['digests']
+    return {guid: digests[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE] for i, guid in enumerate(guids)}
+
+
+def diff_index(old_index, new_index):
+    """Added, removed and changed guids between two compact indexes"""
+    old, new = unpack_index(old_index), unpack_index(new_index)
+    return {
+        'added': [guid for guid in new if guid not in old],
+        'removed': [guid for guid in old if guid not in new],
+        'changed': [guid for guid, digest in new.items() if guid in old and old[guid] != digest],
+    }
+
+
+def analyze_bytes(raw, stages=STAGES, rules=None):
+    """Parse a Bookmarks file's bytes once and run the requested stages on it"""
+    data = json.loads(raw)
+    if not verify_checksum(data):
+        raise TornReadError("checksum mismatch")
+    if rules is not None:
+        data = filter_tree(data, SyncFilter(rules))
+    results = {}
+    if 'structure_hash' in stages:
+        results['structure_hash'] = structure_hash(data)
+    if 'core_hash' in stages:
+        results['core_hash'] = core_bookmark_hash(data)
+    if 'count' in stages:
+        results['count'] = count_url_nodes(data)
+    if 'index' in stages:
+        results['index'] = compact_index(data)
+    return results
+
+
+def _analyze_shared(name, size, stages, rules=None):
+    """Worker side: read the file bytes straight from the parent's shared memory block"""
+    # Workers share the parent's resource tracker, which unlinks the block once
+    shm = SharedMemory(name=name)
+    try:
+        view = shm.buf[:size]
+        try:
+            raw = bytes(view)
+        finally:
+            view.release()
+    finally:
+        shm.close()
+    return analyze_bytes(raw, stages, rules)
+
+
+class ParsePool:
+    """Runs parse/diff/hash stages in worker processes instead of the event thread.
+
+    The file is read once into a shared memory block that the worker maps by
+    name, so file contents never go through the executor's pipe; only the small
+    results (hashes, counts, packed indexes) come back.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def submit(self, filepath, stages=STAGES, rules=None):
+        size = os.path.getsize(filepath)
+        shm = SharedMemory(create=True, size=max(size, 1))
+        try:
+            with open(filepath, 'rb') as f:
+                size = f.readinto(shm.buf[:size])
+            future = self.executor.submit(_analyze_shared, shm.name, size, tuple(stages), rules)
+        except BaseException:
+            shm.close()
+            shm.unlink()
+            raise
+
+        def release(_):
+            shm.close()
+            shm.unlink()
+
+        future.add_done_callback(release)
+        return future
+
+    def analyze(self, filepath, stages=STAGES, retries=5, delay=0.2, rules=None):
+        """Blocking analyze with the same torn-read retries as read_bookmarks_consistent"""
+        for attempt in range(retries):
+            try:
+                return self.submit(filepath, stages, rules).result()
+            except ValueError:  # JSONDecodeError or TornReadError from the worker
+                if attempt == retries - 1:
+                    raise TornReadError(f"Inconsistent read of {filepath} after {retries} attempts")
+                time.sleep(delay)
+
+    def close(self):
+        self.executor.shutdown()
+
+
+def benchmark(profiles=8, bookmarks=50000, max_workers=None):
+    """Throughput of the full stage set over many large profiles, inline vs pool sizes"""
+    workdir = Path(tempfile.mkdtemp(prefix="parse_pool_bench_"))
+    files = []
+    for i in range(profiles):
+        path = workdir / f"Bookmarks_{i}"
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(set_checksum(synthetic_bookmarks(bookmarks, seed=i)), f, indent=3)
+        files.append(path)
+    size_mb = sum(path.stat().st_size for path in files) / 1e6
+    print(f"📦 {profiles} profiles x {bookmarks} bookmarks ({size_mb:.0f} MB)")
+
+    start = time.perf_counter()
+    for path in files:
+        analyze_bytes(path.read_bytes())
+    inline = time.perf_counter() - start
+    print(f"🧵 inline (event thread): {inline:.2f}s, {profiles / inline:.2f} profiles/s")
+
+    max_workers = max_workers or os.cpu_count() or 1
+    workers = 1
+    while True:
+        pool = ParsePool(workers)
+        pool.analyze(files[0], ('count',))  # Warm up the worker processes
+        start = time.perf_counter()
+        wait([pool.submit(path) for path in files])
+        elapsed = time.perf_counter() - start
+        pool.close()
+        print(f"⚙️ pool x{workers}: {elapsed:.2f}s, {profiles / elapsed:.2f} profiles/s "
+              f"({inline / elapsed:.2f}x inline)")
+        if workers >= max_workers:
+            break
+        workers = min(workers * 2, max_workers)
+
+    for path in files:
+        path.unlink()
+    workdir.rmdir()
+
+
+if __name__ == "__main__":
+    # Usage: python parse_pool.py bench [profiles] [bookmarks]
+    #        python parse_pool.py <Bookmarks file>
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 8,
+                  int(sys.argv[3]) if len(sys.argv) > 3 else 50000)
+    elif len(sys.argv) > 1:
+        pool = ParsePool(1)
+        result = pool.analyze(sys.argv[1])
+        result['index'] = f"{len(result['index']['digests']) // DIGEST_SIZE} nodes"
+        print(json.dumps(result, indent=2))
+        pool.close()
+    else:
+        print("Usage: python parse_pool.py bench [profiles] [bookmarks] | <Bookmarks file>")
@@ -0,0 +1,251 @@
+import os
+import sys
+import glob
+import json
+import time
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from watchdog.events import FileCreatedEvent, FileDeletedEvent, FileModifiedEvent
+from bookmarks_export import get_state_dir
+
+
+MODES = ('native', 'poll', 'auto')
+WATCHERS_FILE_NAME = "watchers.json"
+NETWORK_FILESYSTEMS = {'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'fuse.sshfs', 'sshfs', '9p', 'afs', 'davfs', 'fuse.rclone'}
+MIN_INTERVAL = 0.5   # Right after a change (Chrome often writes again shortly after)
+MAX_INTERVAL = 10.0  # Idle
+BACKOFF = 1.5
+NATIVE_GRACE = 1.0   # How long a native event may lag behind the poller before it counts as missed
+
+
+def _network_filesystem(path):
+    """True if path lives on a network mount (SMB/NFS/...)"""
+    if os.name == 'nt':
+        return str(path).startswith("\\\\")
+    try:
+        with open("/proc/mounts", 'r') as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return False  # No /proc (macOS): stay native unless configured
+    resolved = os.path.realpath(path)
+    best, fstype = "", None
+    for mount_point, mount_type in mounts:
+        mount_point = mount_point.replace("\\040", " ")
+        if (resolved == mount_point or resolved.startswith(mount_point.rstrip("/") + "/")) and len(mount_point) > len(best):
+            best, fstype = mount_point, mount_type
+    return fstype in NETWORK_FILESYSTEMS
+
+
+def watcher_mode(path):
+    """Watcher backend for a directory: watchers.json entry, then BOOKMARKS_SYNC_WATCHER, then auto-detect.
+
+    watchers.json (in the state dir) maps directory paths to 'native', 'poll' or 'auto'.
+    """
+    try:
+        with open(get_state_dir() / WATCHERS_FILE_NAME, 'r', encoding='utf-8') as f:
+            configured = json.load(f).get(str(Path(path).resolve()))
+    except (FileNotFoundError, json.JSONDecodeError):
+        configured = None
+    mode = configured or os.environ.get("BOOKMARKS_SYNC_WATCHER")
+    if mode in MODES:
+        return mode
+    return 'auto' if _network_filesystem(path) else 'native'
+
+
+def _signature(filepath):
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class PolledWatch:
+    """One watched directory: only the named files are stat'ed.
+
+    Names may reach into subdirectories ("shards/manifest.json") and use
+    wildcards ("oplog/*.jsonl"); wildcards are matched again on every poll.
+    """
+
+    def __init__(self, handler, path, filenames, mode):
+        self.handler = handler
+        self.path = str(path)
+        self.patterns = [os.path.join(self.path, name) for name in filenames]
+        self.mode = mode
+        self.signatures = {}
+        self.refresh()
+        self.signatures = {filepath: _signature(filepath) for filepath in self.files}
+        self.interval = MIN_INTERVAL
+        self.next_due = time.monotonic() + self.interval
+        self.last_native = 0.0
+        self.pending = []  # (detected_at, event) waiting to see if the native observer reports them
+        self.metrics = {'mode': mode, 'polls': 0, 'changes_caught': 0, 'native_caught': 0, 'native_missed': 0}
+
+    def refresh(self):
+        """Re-match wildcard names; a file that vanished stays until its deletion was seen"""
+        files = []
+        for pattern in self.patterns:
+            files.extend(sorted(glob.glob(pattern)) if any(c in pattern for c in "*?[") else [pattern])
+        matched = set(files)
+        files.extend(filepath for filepath, signature in self.signatures.items()
+                     if signature is not None and filepath not in matched)
+        self.files = files
+
+
+class _NativeTap:
+    """Forwards native events to the real handler, noting when they arrive"""
+
+    def __init__(self, watch):
+        self.watch = watch
+
+    def dispatch(self, event):
+        if event.src_path in self.watch.files or getattr(event, 'dest_path', None) in self.watch.files:
+            self.watch.last_native = time.monotonic()
+        self.watch.handler.dispatch(event)
+
+
+class AdaptivePollingObserver:
+    """Drop-in for watchdog's Observer with per-directory native/poll/auto backends.
+
+    poll:   stats only the watched files; the interval drops to MIN_INTERVAL after a
+            change and backs off to MAX_INTERVAL while idle. All due watches are
+            stat'ed together in one batch.
+    auto:   native events plus polling; a change the native observer did not report
+            within NATIVE_GRACE is dispatched by the poller and counted as missed.
+    native: plain watchdog Observer.
+    """
+
+    def __init__(self, stat_workers=8):
+        self.watches = []
+        self.native = None
+        self.stat_workers = stat_workers
+        self.stopped = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def schedule(self, event_handler, path, recursive=False, filenames=("Bookmarks",), mode=None):
+        mode = mode or watcher_mode(path)
+        if mode in ('native', 'auto'):
+            if self.native is None:
+                from watchdog.observers import Observer
+                self.native = Observer()
+        if mode == 'native':
+            return self.native.schedule(event_handler, path=str(path), recursive=recursive)
+
+        watch = PolledWatch(event_handler, path, filenames, mode)
+        if mode == 'auto':
+            self.native.schedule(_NativeTap(watch), path=str(path), recursive=recursive)
+        with self.lock:
+            self.watches.append(watch)
+        print(f"🐢 Polling {', '.join(filenames)} in {path} ({mode})")
+        return watch
+
+    def start(self):
+        if self.native is not None:
+            self.native.start()
+        if self.watches:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.native is not None:
+            self.native.stop()
+        self.save_metrics()
+
+    def join(self, timeout=None):
+        if self.native is not None:
+            self.native.join(timeout)
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def is_alive(self):
+        return (self.thread is not None and self.thread.is_alive()) or (self.native is not None and self.native.is_alive())
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=self.stat_workers) as pool:
+            while not self.stopped.is_set():
+                now = time.monotonic()
+                with self.lock:
+                    due = [watch for watch in self.watches if watch.next_due <= now or watch.pending]
+                    wake = min((watch.next_due for watch in self.watches), default=now + MAX_INTERVAL)
+                if due:
+                    for watch in due:
+                        if watch.next_due <= now:
+                            watch.refresh()
+                    # One batch of stats for every due profile; a slow network mount only delays its own result
+                    files = [filepath for watch in due for filepath in watch.files]
+                    signatures = dict(zip(files, pool.map(_signature, files)))
+                    for watch in due:
+                        self._check(watch, signatures, time.monotonic())
+                    with self.lock:
+                        wake = min(watch.next_due for watch in self.watches)
+                        if any(watch.pending for watch in self.watches):
+                            wake = min(wake, time.monotonic() + NATIVE_GRACE / 4)
+                self.stopped.wait(max(0.0, wake - time.monotonic()))
+
+    def _check(self, watch, signatures, now):
+        if now >= watch.next_due:
+            watch.metrics['polls'] += 1
+            changed = False
+            for filepath in watch.files:
+                old, new = watch.signatures.get(filepath), signatures[filepath]
+                if old == new:
+                    continue
+                watch.signatures[filepath] = new
+                changed = True
+                watch.metrics['changes_caught'] += 1
+                if old is None:
+                    event = FileCreatedEvent(filepath)
+                elif new is None:
+                    event = FileDeletedEvent(filepath)
+                else:
+                    event = FileModifiedEvent(filepath)
+                if watch.mode == 'poll':
+                    watch.handler.dispatch(event)
+                else:
+                    # The change happened at most one interval ago
+                    watch.pending.append((now - watch.interval, event))
+            watch.interval = MIN_INTERVAL if changed else min(watch.interval * BACKOFF, MAX_INTERVAL)
+            watch.next_due = now + watch.interval
+
+        # auto: let the native observer deliver it first, step in if it didn't
+        remaining = []
+        for window_start, event in watch.pending:
+            if watch.last_native >= window_start:
+                watch.metrics['native_caught'] += 1
+            elif now - window_start >= watch.interval + NATIVE_GRACE:
+                watch.metrics['native_missed'] += 1
+                print(f"🐢 Native watcher missed a change to {Path(event.src_path).name}, dispatching from poll")
+                watch.handler.dispatch(event)
+            else:
+                remaining.append((window_start, event))
+        watch.pending = remaining
+
+    def metrics(self):
+        with self.lock:
+            return {watch.path: dict(watch.metrics, interval=round(watch.interval, 2)) for watch in self.watches}
+
+    def save_metrics(self):
+        if not self.watches:
+            return
+        with open(get_state_dir() / "watcher_metrics.json", 'w', encoding='utf-8') as f:
+            json.dump(self.metrics(), f, indent=2)
+
+
+def create_observer():
+    """Observer for the monitors: polls network-mounted profiles, native events elsewhere"""
+    return AdaptivePollingObserver()
+
+
+if __name__ == "__main__":
+    # Usage: python polling_observer.py mode <dir>      (which backend a directory gets)
+    #        python polling_observer.py metrics
+    if len(sys.argv) > 2 and sys.argv[1] == "mode":
+        print(f"👀 {sys.argv[2]}: {watcher_mode(sys.argv[2])}")
+    elif len(sys.argv) > 1 and sys.argv[1] == "metrics":
+        metrics_file = get_state_dir() / "watcher_metrics.json"
+        print(metrics_file.read_text() if metrics_file.exists() else "ℹ️ No watcher metrics yet")
+    else:
+        print("Usage: python polling_observer.py mode <dir> | metrics")
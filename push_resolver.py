@@ -0,0 +1,344 @@
+import sys
+import json
+import time
+import random
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from bookmarks_export import get_state_dir
+from chrome_checksum import set_checksum
+from peer_sync import flatten_tree, unflatten_tree
+from bookmarks_shards import MANIFEST_NAME, assemble_shards, write_shards
+from sync_history import EXPORT_PATH, commit_sync_changes
+from sync_latency import push_command
+
+
+MAX_ATTEMPTS = 5
+SHARDS_PATH = f"{Path(EXPORT_PATH).parent.as_posix()}/shards"
+_metrics_lock = threading.Lock()
+
+
+def _content(record):
+    """What a side actually changed; indexes shift whenever a sibling comes or goes"""
+    return record['parent'], record['node']
+
+
+def _merge_record(base, ours, theirs):
+    """Three-way merge of one node: parent and each field merge separately; ours wins real conflicts"""
+    if base is None:
+        return ours if ours is not None else theirs
+
+    def pick(b, o, t):
+        return t if o == b else o
+
+    merged = dict(ours)
+    if ours['parent'] == base['parent'] and theirs['parent'] != base['parent']:
+        merged['parent'], merged['index'] = theirs['parent'], theirs['index']
+    node = {}
+    for key in set(base['node']) | set(ours['node']) | set(theirs['node']):
+        value = pick(base['node'].get(key), ours['node'].get(key), theirs['node'].get(key))
+        if value is not None:
+            node[key] = value
+    merged['node'] = node
+    return merged
+
+
+def three_way_merge(base_data, ours_data, theirs_data):
+    """Merge two bookmark trees by guid against their common ancestor.
+
+    Adds from both sides are kept, an edit beats a concurrent delete, deleted
+    folders come back if the other side put something in them, and moves that
+    would form a cycle fall back to theirs.
+    """
+    base = flatten_tree(base_data) if base_data else {}
+    ours = flatten_tree(ours_data)
+    theirs = flatten_tree(theirs_data)
+
+    merged = {}
+    for guid in list(ours) + [guid for guid in theirs if guid not in ours]:
+        b, o, t = base.get(guid), ours.get(guid), theirs.get(guid)
+        if o is not None and t is not None:
+            merged[guid] = _merge_record(b, o, t)
+        elif o is not None:
+            # Missing from theirs: new here, or deleted there (unless we changed it since)
+            if b is None or _content(o) != _content(b):
+                merged[guid] = o
+        elif t is not None:
+            if b is None or _content(t) != _content(b):
+                merged[guid] = t
+
+    # Keep the folders that surviving nodes live in
+    changed = True
+    while changed:
+        changed = False
+        for guid, record in list(merged.items()):
+            parent = record['parent']
+            if parent is not None and parent not in merged:
+                restored = ours.get(parent) or theirs.get(parent) or base.get(parent)
+                if restored is None:
+                    record['parent'] = None  # Unknown parent: should not happen, leave as a root
+                    continue
+                merged[parent] = restored
+                changed = True
+
+    # A move on each side can form a cycle; undo ours for the node that closes it
+    for guid in list(merged):
+        seen = set()
+        node = guid
+        while node is not None and node in merged and node not in seen:
+            seen.add(node)
+            node = merged[node]['parent']
+        if node is not None and node in seen:
+            fallback = theirs.get(guid) or base.get(guid)
+            merged[guid]['parent'], merged[guid]['index'] = fallback['parent'], fallback['index']
+
+    _renumber_duplicate_ids(merged)
+    meta = {key: value for key, value in ours_data.items() if key not in ('roots', 'checksum')}
+    return set_checksum(unflatten_tree(merged, meta))
+
+
+def _renumber_duplicate_ids(flat):
+    """Both machines' Chrome hand out ids from the same counter; give clashing newcomers fresh ones"""
+    seen = set()
+    ids = [int(record['node']['id']) for record in flat.values() if str(record['node'].get('id', '')).isdigit()]
+    next_id = max(ids, default=0) + 1
+    for record in flat.values():
+        node_id = record['node'].get('id')
+        if node_id is None:
+            continue
+        if node_id in seen:
+            record['node'] = dict(record['node'], id=str(next_id))
+            next_id += 1
+        seen.add(record['node']['id'])
+
+
+def _git(repo_dir, *args, check=True):
+    return subprocess.run(["git", *args], cwd=repo_dir, capture_output=True, text=True, check=check)
+
+
+def _tree_at(repo_dir, rev):
+    result = _git(repo_dir, "show", f"{rev}:{EXPORT_PATH}", check=False)
+    return json.loads(result.stdout) if result.returncode == 0 else None
+
+
+def _shards_at(repo_dir, rev):
+    """Tree assembled from the shard layout at rev, or None if rev has none"""
+    if not rev or _git(repo_dir, "cat-file", "-e", f"{rev}:{SHARDS_PATH}/{MANIFEST_NAME}",
+                       check=False).returncode != 0:
+        return None
+
+    def load_shard(name):
+        return json.loads(_git(repo_dir, "show", f"{rev}:{SHARDS_PATH}/{name}").stdout)
+
+    return assemble_shards(SHARDS_PATH, load_shard)
+
+
+def _union_oplog(repo_dir, path):
+    """Resolve a conflicted op log: every op from both sides, once, in clock order"""
+    ops = {}
+    for stage in (2, 3):
+        for line in _git(repo_dir, "show", f":{stage}:{path}", check=False).stdout.splitlines():
+            if line.strip():
+                ops.setdefault(line.strip(), json.loads(line))
+    ordered = sorted(ops.items(), key=lambda item: item[1]['ts'][0])
+    with open(Path(repo_dir) / path, 'w', encoding='utf-8') as f:
+        f.writelines(line + "\n" for line, _ in ordered)
+    _git(repo_dir, "add", "--", path)
+
+
+def _apply_merged(merged, bookmarks_file):
+    """Write a merged tree into the browser profile the repository syncs"""
+    from bookmarks_export import get_chrome_bookmarks_path
+    from bookmarks_import_fixed import import_bookmarks, safe_copy_bookmarks
+
+    merged_file = Path(tempfile.gettempdir()) / "Bookmarks_Chrome.merged.json"
+    with open(merged_file, 'w', encoding='utf-8') as f:
+        json.dump(merged, f, indent=3, ensure_ascii=False)
+    try:
+        own_profile = Path(bookmarks_file) == get_chrome_bookmarks_path()
+    except Exception:  # No default profile on this OS; only explicit ones (sync_host tenants)
+        own_profile = False
+    if own_profile:
+        import_bookmarks(merged_file)  # Deferral and selective sync rules apply
+    else:
+        safe_copy_bookmarks(merged_file, bookmarks_file)
+
+
+def resolve_against_remote(repo_dir=".", upstream="origin/main", bookmarks_file=None):
+    """Merge upstream into HEAD with a semantic merge of the bookmark export; returns True on success.
+
+    bookmarks_file is the browser profile this repository syncs; the merged
+    tree is written there. Without it nothing outside the repository changes.
+    """
+    base_sha = _git(repo_dir, "merge-base", "HEAD", upstream, check=False).stdout.strip()
+    ours = _tree_at(repo_dir, "HEAD")
+    theirs = _tree_at(repo_dir, upstream)
+    ours_shards = _shards_at(repo_dir, "HEAD")
+    theirs_shards = _shards_at(repo_dir, upstream)
+
+    # Everything else merges as text; the export is replaced by the semantic merge
+    merge = _git(repo_dir, "merge", "--no-commit", "--no-ff", "-q", upstream, check=False)
+    if _git(repo_dir, "rev-parse", "-q", "--verify", "MERGE_HEAD", check=False).returncode != 0:
+        # Refused before starting (e.g. local changes in the way, or nothing to merge): nothing to undo
+        print(f"❌ Could not merge {upstream}: {(merge.stderr or merge.stdout).strip()}")
+        return False
+    if ours is not None and theirs is not None:
+        merged = three_way_merge(_tree_at(repo_dir, base_sha) if base_sha else None, ours, theirs)
+        with open(Path(repo_dir) / EXPORT_PATH, 'w', encoding='utf-8') as f:
+            json.dump(merged, f, indent=3, ensure_ascii=False)
+        _git(repo_dir, "add", EXPORT_PATH)
+    else:
+        merged = None
+
+    # Shards merge the same way, then are rewritten with a manifest that matches them
+    if ours_shards is not None and theirs_shards is not None and ours_shards != theirs_shards:
+        merged_shards = three_way_merge(_shards_at(repo_dir, base_sha), ours_shards, theirs_shards)
+        shard_dir = Path(repo_dir) / SHARDS_PATH
+        (shard_dir / MANIFEST_NAME).unlink(missing_ok=True)  # Rewrite every shard, conflicted or not
+        write_shards(shard_dir, merged_shards)
+        _git(repo_dir, "add", "-A", "--", SHARDS_PATH)
+        if merged is None:
+            merged, ours = merged_shards, ours_shards
+
+    unresolved = []
+    for path in _git(repo_dir, "diff", "--name-only", "--diff-filter=U").stdout.splitlines():
+        if path.endswith(".jsonl"):
+            _union_oplog(repo_dir, path)
+        else:
+            unresolved.append(path)
+    if unresolved:
+        _git(repo_dir, "merge", "--abort", check=False)
+        print(f"❌ Can't merge concurrent changes to {', '.join(unresolved)}")
+        return False
+
+    commit = commit_sync_changes("🔀 Merged concurrent bookmark changes", repo_dir, check=False)
+    if commit.returncode != 0:
+        _git(repo_dir, "merge", "--abort", check=False)
+        print(f"❌ Could not record merge: {commit.stderr.strip()}")
+        return False
+
+    if bookmarks_file and merged is not None and merged != ours:
+        # The profile now holds the other side's changes too
+        _apply_merged(merged, bookmarks_file)
+    return True
+
+
+def _branch_status(result):
+    """Porcelain flag of the branch ref update: ' ', '+', '*' or '=' ok, '!' rejected, None if never reached"""
+    for line in result.stdout.splitlines():
+        fields = line.split("\t")
+        if len(fields) >= 2 and ":refs/heads/" in fields[1]:
+            return fields[0][:1]
+    return None
+
+
+def push_with_resolution(repo_dir=".", max_attempts=MAX_ATTEMPTS, bookmarks_file=None):
+    """git push; when the branch update is rejected fetch, merge by guid, recommit and retry.
+
+    Only the branch decides success (a failed latency-notes update does not).
+    Returns the last push's CompletedProcess, with returncode 0 on success.
+    """
+    for attempt in range(1, max_attempts + 1):
+        command = push_command(repo_dir)
+        result = subprocess.run(command[:2] + ["--porcelain"] + command[2:], cwd=repo_dir,
+                                capture_output=True, text=True)
+        status = _branch_status(result)
+        if result.returncode == 0 or status in (" ", "+", "*", "="):
+            _record(attempt, 'pushed')
+            return subprocess.CompletedProcess(result.args, 0, result.stdout, result.stderr)
+        # '!' covers non-fast-forward and losing the remote ref-lock race alike
+        if status != "!" or attempt == max_attempts:
+            break
+        print(f"🔀 Push rejected (attempt {attempt}), merging remote bookmark changes...")
+        if _git(repo_dir, "fetch", "-q", "origin", check=False).returncode != 0 or \
+                not resolve_against_remote(repo_dir, bookmarks_file=bookmarks_file):
+            break
+        # Desynchronise machines that keep colliding
+        time.sleep(random.uniform(0, 0.1 * 2 ** attempt))
+    _record(attempt, 'failed')
+    return result
+
+
+def _metrics_file():
+    return get_state_dir() / "push_contention.json"
+
+
+def _record(attempts, outcome):
+    with _metrics_lock:
+        try:
+            metrics = json.loads(_metrics_file().read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            metrics = {'pushes': 0, 'contended': 0, 'failed': 0, 'attempts': {}}
+        metrics['pushes'] += 1
+        metrics['contended'] += attempts > 1
+        metrics['failed'] += outcome == 'failed'
+        metrics['attempts'][str(attempts)] = metrics['attempts'].get(str(attempts), 0) + 1
+        metrics['contention_rate'] = round(metrics['contended'] / metrics['pushes'], 4)
+        _metrics_file().write_text(json.dumps(metrics, indent=2))
+
+
+def simulate(pushers=4, rounds=10):
+    """Concurrent pushers against a local bare repo; checks that no bookmark is lost"""
+    workdir = Path(tempfile.mkdtemp(prefix="push_resolver_"))
+    remote = workdir / "remote.git"
+    subprocess.run(["git", "init", "-q", "--bare", "-b", "main", str(remote)], check=True)
+    seed = workdir / "seed"
+    subprocess.run(["git", "clone", "-q", str(remote), str(seed)], check=True, capture_output=True)
+    (seed / EXPORT_PATH).parent.mkdir(parents=True)
+    tree = {'version': 1, 'roots': {name: {'type': 'folder', 'name': name, 'id': str(i + 1), 'guid': f"root-{name}",
+                                           'children': []} for i, name in enumerate(('bookmark_bar', 'other', 'synced'))}}
+    (seed / EXPORT_PATH).write_text(json.dumps(set_checksum(tree), indent=3))
+    for args in (["add", "-A"], ["-c", "user.name=seed", "-c", "user.email=seed@local", "commit", "-q", "-m", "seed"],
+                 ["push", "-q", "origin", "main"]):
+        _git(seed, *args)
+
+    clones = []
+    for p in range(pushers):
+        clone = workdir / f"pusher{p}"
+        subprocess.run(["git", "clone", "-q", str(remote), str(clone)], check=True, capture_output=True)
+        _git(clone, "config", "user.name", f"pusher{p}")
+        _git(clone, "config", "user.email", f"pusher{p}@local")
+        clones.append(clone)
+
+    failures = []
+
+    def pusher(p, clone):
+        for r in range(rounds):
+            data = json.loads((clone / EXPORT_PATH).read_text())
+            ids = [int(record['node']['id']) for record in flatten_tree(data).values()]
+            data['roots']['bookmark_bar']['children'].append(
+                {'type': 'url', 'guid': f"p{p}-r{r}", 'id': str(max(ids) + 1), 'name': f"Pusher {p} #{r}",
+                 'url': f"https://example.com/{p}/{r}"})
+            (clone / EXPORT_PATH).write_text(json.dumps(set_checksum(data), indent=3))
+            _git(clone, "commit", "-q", "-am", f"pusher {p} round {r}")
+            if push_with_resolution(clone, max_attempts=20).returncode != 0:
+                failures.append((p, r))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=pusher, args=(p, clone)) for p, clone in enumerate(clones)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    _git(seed, "pull", "-q")
+    final = flatten_tree(json.loads((seed / EXPORT_PATH).read_text()))
+    missing = [f"p{p}-r{r}" for p in range(pushers) for r in range(rounds) if f"p{p}-r{r}" not in final]
+    print(f"🏁 {pushers} pushers x {rounds} rounds in {elapsed:.1f}s: {len(missing)} bookmarks lost, "
+          f"{len(failures)} pushes given up")
+    print(f"📊 {_metrics_file().read_text()}")
+    return not missing and not failures
+
+
+if __name__ == "__main__":
+    # Usage: python push_resolver.py simulate [pushers] [rounds]
+    #        python push_resolver.py metrics
+    if len(sys.argv) > 1 and sys.argv[1] == "simulate":
+        ok = simulate(int(sys.argv[2]) if len(sys.argv) > 2 else 4, int(sys.argv[3]) if len(sys.argv) > 3 else 10)
+        sys.exit(0 if ok else 1)
+    elif len(sys.argv) > 1 and sys.argv[1] == "metrics":
+        print(_metrics_file().read_text() if _metrics_file().exists() else "ℹ️ No pushes recorded yet")
+    else:
+        print("Usage: python push_resolver.py simulate [pushers] [rounds] | metrics")
@@ -2,12 +2,17 @@ import time
 import subprocess
 import threading
 import hashlib
-import json
 import os
 from pathlib import Path
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+from polling_observer import create_observer
+from watchdog.events import FileSystemEventHandler, FileModifiedEvent
 from bookmarks_export import export_bookmarks, get_chrome_bookmarks_path
+from bookmark_search import update_search_index
+from sync_history import commit_sync_changes, update_history_index
+from sync_state import SyncState
+from sync_queue import push_or_enqueue, get_outbound_queue
+from change_feed import maybe_start_feed_server
+from chrome_checksum import read_bookmarks_consistent, TornReadError
 
 
 class SmartBookmarkDetector(FileSystemEventHandler):
@@ -17,29 +22,47 @@ class SmartBookmarkDetector(FileSystemEventHandler):
         
         self.sync_lock = threading.Lock()
         self.processing = False
+        self.latency_stamp = None
         self.last_sync_time = 0
         self.cooldown_period = 3  # 3 seconds between checks
         
-        # Store bookmark counts and structure
-        chrome_bookmarks = get_chrome_bookmarks_path()
-        self.last_bookmark_count = self.count_bookmarks(chrome_bookmarks)
-        self.last_bookmark_urls = self.get_all_bookmark_urls(chrome_bookmarks)
-        self.last_folder_structure = self.get_folder_structure(chrome_bookmarks)
+        # Store bookmark counts and structure (warm start from the last synced state)
+        self.bookmarks_path = get_chrome_bookmarks_path()
+        self.state = SyncState()
+        snapshot = self.state.load_snapshot('smart', self.bookmarks_path)
+        if snapshot:
+            self.last_bookmark_count = snapshot['count']
+            self.last_bookmark_urls = set(snapshot['urls'])
+            self.last_folder_structure = set(snapshot['folders'])
+        else:
+            self.last_bookmark_count = self.count_bookmarks(self.bookmarks_path) or 0
+            self.last_bookmark_urls = self.get_all_bookmark_urls(self.bookmarks_path) or set()
+            self.last_folder_structure = self.get_folder_structure(self.bookmarks_path) or set()
+            self._save_state()
         
         print(f"📊 Initial state: {self.last_bookmark_count} bookmarks")
         print(f"📁 Initial folders: {len(self.last_folder_structure)} folders")
 
+    def _save_state(self):
+        """Persist the synced bookmark index for the next warm start"""
+        self.state.save_snapshot('smart', self.bookmarks_path,
+                                 count=self.last_bookmark_count,
+                                 urls=sorted(self.last_bookmark_urls),
+                                 folders=sorted(self.last_folder_structure))
+
     def count_bookmarks(self, filepath):
-        """Count total number of actual bookmarks (not folders)"""
+        """Count total number of actual bookmarks (not folders); None on a torn read"""
         try:
             if not Path(filepath).exists():
                 return 0
                 
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = read_bookmarks_consistent(filepath)
             
             return self._count_bookmarks_recursive(data.get('roots', {}))
             
+        except TornReadError as e:
+            print(f"⏳ {e}")
+            return None
         except Exception as e:
             print(f"❌ Error counting bookmarks: {e}")
             return 0
@@ -71,13 +94,15 @@ class SmartBookmarkDetector(FileSystemEventHandler):
             if not Path(filepath).exists():
                 return set()
                 
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = read_bookmarks_consistent(filepath)
             
             urls = set()
             self._collect_urls_recursive(data.get('roots', {}), urls)
             return urls
             
+        except TornReadError as e:
+            print(f"⏳ {e}")
+            return None
         except Exception as e:
             print(f"❌ Error getting URLs: {e}")
             return set()
@@ -105,13 +130,15 @@ class SmartBookmarkDetector(FileSystemEventHandler):
             if not Path(filepath).exists():
                 return set()
                 
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = read_bookmarks_consistent(filepath)
             
             folders = set()
             self._collect_folders_recursive(data.get('roots', {}), folders, "")
             return folders
             
+        except TornReadError as e:
+            print(f"⏳ {e}")
+            return None
         except Exception as e:
             print(f"❌ Error getting folders: {e}")
             return set()
@@ -148,6 +175,10 @@ class SmartBookmarkDetector(FileSystemEventHandler):
             current_urls = self.get_all_bookmark_urls(filepath)
             current_folders = self.get_folder_structure(filepath)
             
+            # A torn read is not a change; keep the last state and wait for the next event
+            if current_count is None or current_urls is None or current_folders is None:
+                return False, []
+            
             # Compare counts
             count_changed = current_count != self.last_bookmark_count
             
@@ -225,9 +256,16 @@ class SmartBookmarkDetector(FileSystemEventHandler):
                 for change in changes:
                     print(f"   • {change}")
                 
+                # Edit (file mtime) and detection times, stamped on the commit for latency tracking
+                self.latency_stamp = (os.path.getmtime(event.src_path), current_time)
+
                 # Export and sync
-                export_bookmarks(self.export_dir)
+                export_file = export_bookmarks(self.export_dir)
+                update_search_index(export_file)
                 self.git_push_changes()
+                update_history_index(self.export_dir.parent)
+                self._save_state()
+                self.state.record_sync(self.bookmarks_path, export_file, self.export_dir.parent)
                 
                 self.last_sync_time = current_time
                 print("✅ Bookmark sync completed")
@@ -246,10 +284,9 @@ class SmartBookmarkDetector(FileSystemEventHandler):
             
             if result.stdout.strip():
                 subprocess.run(["git", "add", "."], check=True, cwd=self.export_dir.parent)
-                subprocess.run(["git", "commit", "-m", "🔖 Bookmark structure changed"], 
-                             check=True, cwd=self.export_dir.parent)
-                subprocess.run(["git", "push"], check=True, cwd=self.export_dir.parent)
-                print("🚀 Pushed to Git")
+                commit_sync_changes("🔖 Bookmark structure changed", self.export_dir.parent, self.latency_stamp)
+                if push_or_enqueue(self.export_dir.parent, self.bookmarks_path):
+                    print("🚀 Pushed to Git")
             else:
                 print("ℹ️ No file changes to push")
                 
@@ -278,10 +315,26 @@ def main():
     detector = SmartBookmarkDetector(export_dir)
     
     # Create observer
-    observer = Observer()
+    observer = create_observer()
     observer.schedule(detector, path=str(folder_to_watch), recursive=False)
     
     observer.start()
+
+    # Structured change events for local consumers (BOOKMARKS_SYNC_FEED)
+    maybe_start_feed_server()
+
+    # Retry syncs left unpushed by a previous run (offline, remote down, ...)
+    outbound_queue = get_outbound_queue()
+    if outbound_queue.depth():
+        print(f"📮 {outbound_queue.depth()} queued syncs pending, flushing in background")
+        outbound_queue.start()
+
+    # Catch up on local changes made while the detector was not running
+    direction = detector.state.catch_up_direction(
+        chrome_bookmarks_path, export_dir / "Bookmarks_Chrome.json", export_dir.parent)
+    if direction == 'export':
+        print("🔄 Local bookmarks changed while offline, checking...")
+        detector.on_modified(FileModifiedEvent(str(chrome_bookmarks_path)))
     
     try:
         print("✅ Monitoring started. Try:")
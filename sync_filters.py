@@ -0,0 +1,223 @@
+import os
+import sys
+import json
+import fnmatch
+import hashlib
+import tempfile
+from pathlib import Path
+from bookmark_tree import BOOKMARK_ROOTS, load_bookmarks
+from bookmarks_export import get_state_dir
+from chrome_checksum import set_checksum
+
+
+FILTERS_FILE_NAME = "sync_filters.json"
+
+# Scope of a folder under the rules
+OUT = 0      # excluded: never walked, hashed or exported; kept as-is locally on import
+PARTIAL = 1  # only on the way to an included folder: walked for its in-scope children
+IN = 2       # included: synced (minus nested exclusions)
+
+
+class SyncFilter:
+    """Per-machine selective sync rules.
+
+    Rules (all optional), matched with fnmatch against paths like
+    "bookmark_bar/Work/Team" (the root name comes first):
+      roots         root names to sync (default: all three)
+      include       folder paths to sync; if empty, everything under the roots
+      exclude       folder paths never to sync (wins over include)
+      exclude_urls  URL patterns never to sync
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.roots = rules.get('roots') or BOOKMARK_ROOTS
+        self.include = rules.get('include', [])
+        self.exclude = rules.get('exclude', [])
+        self.exclude_urls = rules.get('exclude_urls', [])
+
+    def folder_scope(self, path, parent_scope=None):
+        """Scope of the folder at path; parent_scope is None for a root"""
+        if parent_scope == OUT or any(fnmatch.fnmatchcase(path, pattern) for pattern in self.exclude):
+            return OUT
+        if parent_scope == IN or not self.include:
+            return IN
+        if any(fnmatch.fnmatchcase(path, pattern) for pattern in self.include):
+            return IN
+        if any(self._leads_to(path, pattern) for pattern in self.include):
+            return PARTIAL
+        return OUT
+
+    @staticmethod
+    def _leads_to(path, pattern):
+        """True if folders below path could match pattern"""
+        segments = path.split("/")
+        pattern_segments = pattern.split("/")
+        if len(pattern_segments) > len(segments) and all(
+                fnmatch.fnmatchcase(segment, pattern_segment)
+                for segment, pattern_segment in zip(segments, pattern_segments)):
+            return True
+        # '*' also matches '/', so a wildcard pattern can reach deeper than its segment count
+        return "*" in pattern and path.startswith(pattern.split("*", 1)[0].rstrip("/"))
+
+    def keeps_url(self, url):
+        return not any(fnmatch.fnmatchcase(url, pattern) for pattern in self.exclude_urls)
+
+    def child_scope(self, child, path, scope):
+        """Scope of a child node of a folder at path with the given scope"""
+        if child.get('type') == 'folder':
+            return self.folder_scope(f"{path}/{child.get('name', '')}", scope)
+        if scope == IN and self.keeps_url(child.get('url', '')):
+            return IN
+        return OUT
+
+
+def load_sync_filter(filters_file=None):
+    """This machine's rules (BOOKMARKS_SYNC_FILTERS or the state dir), or None to sync everything"""
+    filters_file = Path(filters_file or os.environ.get("BOOKMARKS_SYNC_FILTERS")
+                        or get_state_dir() / FILTERS_FILE_NAME)
+    try:
+        with open(filters_file, 'r', encoding='utf-8') as f:
+            return SyncFilter(json.load(f))
+    except FileNotFoundError:
+        return None
+
+
+def filter_tree(data, sync_filter):
+    """Copy of the tree with only in-scope nodes; excluded subtrees are never descended into"""
+    def prune(node, path, scope):
+        children = []
+        for child in node.get('children', []):
+            if not isinstance(child, dict):
+                continue
+            child_scope = sync_filter.child_scope(child, path, scope)
+            if child_scope == OUT:
+                continue
+            if child.get('type') == 'folder':
+                child = prune(child, f"{path}/{child.get('name', '')}", child_scope)
+                # A folder only on the way to includes is dropped if none were found
+                if child_scope == PARTIAL and not child['children']:
+                    continue
+            children.append(child)
+        return dict(node, children=children)
+
+    filtered = {key: value for key, value in data.items() if key not in ('roots', 'checksum')}
+    filtered['roots'] = {}
+    for root_name, root in data.get('roots', {}).items():
+        if not isinstance(root, dict):
+            continue
+        scope = sync_filter.folder_scope(root_name) if root_name in sync_filter.roots else OUT
+        # Out-of-scope roots stay (empty) so the file remains a valid Chrome tree
+        filtered['roots'][root_name] = prune(root, root_name, scope) if scope != OUT else dict(root, children=[])
+    return set_checksum(filtered)
+
+
+def merge_filtered(local_data, incoming_data, sync_filter):
+    """Apply a synced tree to the local one without touching out-of-scope local nodes.
+
+    In-scope nodes come from incoming (in its order); local nodes the rules
+    exclude stay at their original positions. Folders present on both sides are
+    matched by guid (then name) and merged recursively.
+    """
+    def merge(local, incoming, path, scope):
+        local_children = [child for child in local.get('children', []) if isinstance(child, dict)]
+        local_by_guid = {child.get('guid'): child for child in local_children}
+        local_folders_by_name = {child.get('name'): child for child in local_children
+                                 if child.get('type') == 'folder'}
+        matched = set()
+        merged = []
+        for child in incoming.get('children', []):
+            if not isinstance(child, dict):
+                continue
+            child_scope = sync_filter.child_scope(child, path, scope)
+            if child_scope == OUT:
+                continue
+            if child.get('type') == 'folder':
+                counterpart = local_by_guid.get(child.get('guid')) or local_folders_by_name.get(child.get('name'))
+                if counterpart is not None and counterpart.get('type') == 'folder':
+                    matched.add(id(counterpart))
+                    child = merge(counterpart, child, f"{path}/{child.get('name', '')}", child_scope)
+            merged.append(child)
+
+        for index, child in enumerate(local_children):
+            child_scope = sync_filter.child_scope(child, path, scope)
+            if child_scope == OUT:
+                merged.insert(min(index, len(merged)), child)
+            elif child.get('type') == 'folder' and id(child) not in matched:
+                # Gone remotely, but it may still hold excluded local nodes
+                stripped = merge(child, dict(child, children=[]), f"{path}/{child.get('name', '')}", child_scope)
+                if stripped['children']:
+                    merged.insert(min(index, len(merged)), stripped)
+        return dict(incoming, children=merged)
+
+    result = dict(local_data)
+    result['roots'] = dict(local_data.get('roots', {}))
+    for root_name in sync_filter.roots:
+        local_root = local_data.get('roots', {}).get(root_name)
+        incoming_root = incoming_data.get('roots', {}).get(root_name)
+        if not isinstance(local_root, dict) or not isinstance(incoming_root, dict):
+            continue
+        scope = sync_filter.folder_scope(root_name)
+        if scope != OUT:
+            result['roots'][root_name] = merge(local_root, incoming_root, root_name, scope)
+    return set_checksum(result)
+
+
+def scope_to_shared(local_data, shared_data, sync_filter):
+    """The shared tree with this machine's in-scope part replaced by its local one.
+
+    What an export under rules must publish: folders outside this machine's
+    scope belong to other machines and are kept from shared_data as they are.
+    Without a shared tree yet, only the in-scope part is exported.
+    """
+    if not shared_data or not shared_data.get('roots'):
+        return filter_tree(local_data, sync_filter)
+    return merge_filtered(shared_data, local_data, sync_filter)
+
+
+def apply_sync_filter_file(import_file, bookmarks_file):
+    """File to import: import_file merged into the live file under this machine's rules.
+
+    Without rules the import file is returned unchanged (whole-file replace).
+    """
+    sync_filter = load_sync_filter()
+    if sync_filter is None:
+        return Path(import_file)
+
+    from chrome_checksum import read_bookmarks_consistent
+
+    incoming = load_bookmarks(import_file)
+    local = read_bookmarks_consistent(bookmarks_file) if Path(bookmarks_file).exists() else {'roots': {}}
+    # One file per profile: sync_host imports several profiles concurrently
+    profile = hashlib.sha1(str(Path(bookmarks_file).resolve()).encode()).hexdigest()[:12]
+    merged_file = Path(tempfile.gettempdir()) / f"Bookmarks_Chrome.filtered.{profile}.json"
+    with open(merged_file, 'w', encoding='utf-8') as f:
+        json.dump(merge_filtered(local, incoming, sync_filter), f, indent=3, ensure_ascii=False)
+    print("🎯 Merged synced bookmarks into local tree (selective sync rules)")
+    return merged_file
+
+
+def preview(bookmarks_file, sync_filter):
+    """Counts of bookmarks synced vs total under the current rules"""
+    from bookmark_tree import iter_bookmarks
+
+    data = load_bookmarks(bookmarks_file)
+    total = sum(1 for _ in iter_bookmarks(data))
+    kept = sum(1 for _ in iter_bookmarks(filter_tree(data, sync_filter)))
+    return kept, total
+
+
+if __name__ == "__main__":
+    # Usage: python sync_filters.py show
+    #        python sync_filters.py preview [Bookmarks file]
+    sync_filter = load_sync_filter()
+    if sync_filter is None:
+        print(f"ℹ️ No sync filters ({get_state_dir() / FILTERS_FILE_NAME}); everything is synced")
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == "preview":
+        from bookmarks_export import get_chrome_bookmarks_path
+        source = sys.argv[2] if len(sys.argv) > 2 else get_chrome_bookmarks_path()
+        kept, total = preview(source, sync_filter)
+        print(f"🔎 {kept} of {total} bookmarks would be synced")
+    else:
+        print(json.dumps(sync_filter.rules, indent=2))
@@ -0,0 +1,263 @@
+import re
+import sys
+import json
+import sqlite3
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from bookmark_tree import diff_trees, index_nodes
+from bookmarks_export import get_state_dir
+from sync_latency import format_latency_trailers
+
+
+EXPORT_PATH = "exported_bookmarks/Bookmarks_Chrome.json"
+
+# Commit trailer names for the change counts of each sync commit
+TRAILERS = {
+    'count': "Bookmarks-Count",
+    'added_urls': "Bookmarks-Added-URLs",
+    'removed_urls': "Bookmarks-Removed-URLs",
+    'added_folders': "Bookmarks-Added-Folders",
+    'removed_folders': "Bookmarks-Removed-Folders",
+}
+TRAILER_PATTERN = re.compile(r"^(Bookmarks-[A-Za-z-]+):\s*(-?\d+)\s*$", re.MULTILINE)
+
+
+def format_change_trailers(counts):
+    """Render change counts as git trailer lines"""
+    return "\n".join(f"{TRAILERS[key]}: {value}" for key, value in counts.items() if key in TRAILERS)
+
+
+def parse_change_trailers(message):
+    """Extract change counts from a commit message; missing trailers are omitted"""
+    names = {name: key for key, name in TRAILERS.items()}
+    return {names[name]: int(value) for name, value in TRAILER_PATTERN.findall(message) if name in names}
+
+
+def change_counts(old_data, new_data):
+    """Counts recorded as trailers: bookmarks now, and URLs / folder paths added and removed"""
+    def summarize(data):
+        count, urls, folders = 0, set(), set()
+        for node in (index_nodes(data) if data else {}).values():
+            if node['type'] == 'url':
+                count += 1
+                urls.add(node['url'])
+            elif node['type'] == 'folder' and node['parent'] is not None:
+                folders.add(node['path'])
+        return count, urls, folders
+
+    _, old_urls, old_folders = summarize(old_data)
+    count, new_urls, new_folders = summarize(new_data)
+    return {
+        'count': count,
+        'added_urls': len(new_urls - old_urls),
+        'removed_urls': len(old_urls - new_urls),
+        'added_folders': len(new_folders - old_folders),
+        'removed_folders': len(old_folders - new_folders),
+    }
+
+
+def staged_change_counts(repo_dir=".", export_path=EXPORT_PATH):
+    """Change counts of the staged export against HEAD; empty if the export is not part of the commit"""
+    if subprocess.run(["git", "diff", "--cached", "--quiet", "--", export_path], cwd=repo_dir).returncode == 0:
+        return {}
+
+    def tree_at(rev):
+        result = subprocess.run(["git", "show", f"{rev}:{export_path}"], cwd=repo_dir, capture_output=True, text=True)
+        try:
+            return json.loads(result.stdout) if result.returncode == 0 else None
+        except json.JSONDecodeError:
+            return None
+
+    new_data = tree_at("")  # ":path" is the staged blob
+    return change_counts(tree_at("HEAD"), new_data) if new_data is not None else {}
+
+
+def commit_sync_changes(subject, repo_dir=".", stamp=None, check=True):
+    """Commit what is staged with change-count and latency trailers.
+
+    Every sync committer goes through here so summaries and the latency report
+    see all of them. stamp is (edit time, detection time) when known.
+    """
+    trailers = format_change_trailers(staged_change_counts(repo_dir))
+    trailers = "\n".join(filter(None, [trailers, format_latency_trailers(stamp)]))
+    return subprocess.run(["git", "commit", "-q", "-m", subject, "-m", trailers], cwd=repo_dir,
+                          capture_output=True, text=True, check=check)
+
+
+def parse_time(value):
+    """Accept epoch seconds or an ISO date/datetime"""
+    try:
+        return int(value)
+    except ValueError:
+        return int(datetime.fromisoformat(value).timestamp())
+
+
+class SyncHistoryIndex:
+    """Persistent commit-time -> snapshot blob index over a sync repository"""
+
+    def __init__(self, repo_dir=".", db_path=None, export_path=EXPORT_PATH):
+        self.repo_dir = Path(repo_dir).resolve()
+        self.export_path = export_path
+        self.db_path = Path(db_path) if db_path else get_state_dir() / "history_index.db"
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                repo TEXT NOT NULL,
+                sha TEXT NOT NULL,
+                time INTEGER NOT NULL,
+                blob TEXT,
+                subject TEXT,
+                counts TEXT,
+                PRIMARY KEY (repo, sha)
+            );
+            CREATE INDEX IF NOT EXISTS snapshots_time ON snapshots (repo, time);
+            CREATE TABLE IF NOT EXISTS index_state (
+                repo TEXT PRIMARY KEY,
+                last_sha TEXT
+            );
+        """)
+
+    def close(self):
+        self.conn.close()
+
+    def _git(self, *args):
+        return subprocess.run(["git", *args], cwd=self.repo_dir, capture_output=True,
+                              text=True, check=True).stdout
+
+    def _last_indexed(self):
+        row = self.conn.execute("SELECT last_sha FROM index_state WHERE repo = ?",
+                                (str(self.repo_dir),)).fetchone()
+        if not row:
+            return None
+        # History rewritten (e.g. by compaction) since the last run: start over
+        result = subprocess.run(["git", "merge-base", "--is-ancestor", row[0], "HEAD"],
+                                cwd=self.repo_dir, capture_output=True)
+        return row[0] if result.returncode == 0 else None
+
+    def update(self):
+        """Index commits that touched the export since the last run; returns how many"""
+        last_sha = self._last_indexed()
+        repo = str(self.repo_dir)
+        if last_sha is None:
+            with self.conn:
+                self.conn.execute("DELETE FROM snapshots WHERE repo = ?", (repo,))
+
+        revision = f"{last_sha}..HEAD" if last_sha else "HEAD"
+        # Merge commits print no raw lines unless diffed against their first parent
+        output = self._git("log", "--reverse", "--raw", "--no-abbrev", "--diff-merges=first-parent",
+                           "--format=%x1e%H%x1f%ct%x1f%B%x1f", revision, "--", self.export_path)
+
+        rows = []
+        for record in output.split("\x1e")[1:]:
+            sha, commit_time, message, raw = record.split("\x1f")
+            blob = None
+            for line in raw.strip().splitlines():
+                fields = line.split("\t")[0].split()
+                blob = None if fields[-1] == "D" else fields[3]
+            if not raw.strip():
+                # Same export as the first parent (older git: any merge); read it from the commit
+                blob = subprocess.run(["git", "rev-parse", "--verify", "-q", f"{sha}:{self.export_path}"],
+                                      cwd=self.repo_dir, capture_output=True, text=True).stdout.strip() or None
+            rows.append((repo, sha, int(commit_time), blob, message.split("\n", 1)[0],
+                         json.dumps(parse_change_trailers(message))))
+
+        head = self._git("rev-parse", "HEAD").strip()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.conn.execute("INSERT OR REPLACE INTO index_state VALUES (?, ?)", (repo, head))
+        return len(rows)
+
+    def snapshot_record(self, timestamp):
+        """Latest indexed snapshot at or before timestamp"""
+        return self.conn.execute("""
+            SELECT sha, time, blob FROM snapshots
+            WHERE repo = ? AND time <= ? ORDER BY time DESC LIMIT 1
+        """, (str(self.repo_dir), timestamp)).fetchone()
+
+    def tree_at(self, timestamp):
+        """Bookmark tree as it was at timestamp (None if there was no export yet)"""
+        record = self.snapshot_record(timestamp)
+        if not record or not record[2]:
+            return None
+        return json.loads(self._git("cat-file", "blob", record[2]))
+
+    def changes_between(self, start, end):
+        """guid-level diff between the trees at two points in time"""
+        return diff_trees(self.tree_at(start), self.tree_at(end))
+
+    def summary_between(self, start, end):
+        """Sum the recorded change counts of sync commits in (start, end] without reading blobs"""
+        totals = {key: 0 for key in TRAILERS if key != 'count'}
+        commits = 0
+        for (counts,) in self.conn.execute("""
+            SELECT counts FROM snapshots WHERE repo = ? AND time > ? AND time <= ?
+        """, (str(self.repo_dir), start, end)):
+            commits += 1
+            for key, value in json.loads(counts).items():
+                if key in totals:
+                    totals[key] += value
+        totals['commits'] = commits
+        return totals
+
+    def restore_at(self, timestamp, destination):
+        """Write the snapshot at timestamp to destination (e.g. for import_bookmarks)"""
+        record = self.snapshot_record(timestamp)
+        if not record or not record[2]:
+            return None
+        content = subprocess.run(["git", "cat-file", "blob", record[2]], cwd=self.repo_dir,
+                                 capture_output=True, check=True).stdout
+        Path(destination).write_bytes(content)
+        return destination
+
+
+def update_history_index(repo_dir="."):
+    """Incrementally index new sync commits; never raises"""
+    try:
+        index = SyncHistoryIndex(repo_dir)
+        try:
+            added = index.update()
+        finally:
+            index.close()
+        if added:
+            print(f"🕰️ History index: {added} new snapshots")
+    except Exception as e:
+        print(f"⚠️ History index update failed: {e}")
+
+
+if __name__ == "__main__":
+    # Usage: python sync_history.py at <time> [--restore FILE]
+    #        python sync_history.py diff <t1> <t2>
+    #        python sync_history.py summary <t1> <t2>
+    if len(sys.argv) < 3:
+        print("Usage: python sync_history.py at <time> [--restore FILE] | diff <t1> <t2> | summary <t1> <t2>")
+        sys.exit(1)
+
+    index = SyncHistoryIndex(Path.cwd())
+    index.update()
+    command = sys.argv[1]
+
+    if command == "at":
+        moment = parse_time(sys.argv[2])
+        if "--restore" in sys.argv:
+            destination = sys.argv[sys.argv.index("--restore") + 1]
+            restored = index.restore_at(moment, destination)
+            print(f"✅ Restored to {restored}" if restored else "❌ No snapshot at that time")
+        else:
+            record = index.snapshot_record(moment)
+            tree = index.tree_at(moment)
+            if tree is None:
+                print("❌ No snapshot at that time")
+            else:
+                print(f"🕰️ Snapshot {record[0][:8]} from {datetime.fromtimestamp(record[1])}")
+                print(json.dumps(tree.get('roots', {}), indent=2, ensure_ascii=False))
+    elif command == "diff":
+        changes = index.changes_between(parse_time(sys.argv[2]), parse_time(sys.argv[3]))
+        for kind, nodes in changes.items():
+            for node in nodes:
+                print(f"{kind:8} {node['path']}  {node['name']}  {node.get('url') or ''}")
+    elif command == "summary":
+        print(json.dumps(index.summary_between(parse_time(sys.argv[2]), parse_time(sys.argv[3])), indent=2))
+
+    index.close()
@@ -0,0 +1,350 @@
+import os
+import sys
+import json
+import time
+import heapq
+import random
+import itertools
+import threading
+import subprocess
+from collections import deque
+from pathlib import Path
+from bookmarks_export import export_bookmarks, get_state_dir
+from bookmarks_import_fixed import safe_copy_bookmarks
+from bookmark_only_monitor import BookmarkOnlyHandler
+from sync_state import SyncState, file_signature
+from sync_queue import push_or_enqueue, get_outbound_queue
+from sync_history import commit_sync_changes
+from sync_filters import apply_sync_filter_file
+
+
+# Job kinds in priority order: pulling remote changes in beats background exports
+PRIORITIES = ('import', 'export')
+
+
+class TokenBucket:
+    """Per-tenant rate limit on git operations"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate  # tokens per second
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """Take tokens; returns 0 if allowed now, else seconds to wait before retrying"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0
+            return (tokens - self.tokens) / self.rate
+
+
+class Tenant:
+    """One profile/repo pair served by the host"""
+
+    def __init__(self, name, bookmarks_path, repo_dir, git_rate, git_burst):
+        self.name = name
+        self.bookmarks_path = Path(bookmarks_path).expanduser()
+        self.repo_dir = Path(repo_dir).expanduser()
+        self.export_dir = self.repo_dir / "exported_bookmarks"
+        self.export_file = self.export_dir / "Bookmarks_Chrome.json"
+        self.state_dir = get_state_dir() / "tenants" / name
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        # Same structure-hash detection as the single-user monitor, with isolated state
+        self.handler = BookmarkOnlyHandler(self.export_dir, self.bookmarks_path,
+                                           SyncState(self.state_dir / "sync_state.json"))
+        self.bucket = TokenBucket(git_rate, git_burst)
+        self.signature = file_signature(self.bookmarks_path)
+        self.next_import = 0
+        self.metrics = {'exports': 0, 'imports': 0, 'unchanged': 0, 'errors': 0,
+                        'rate_limited': 0, 'git_ops': 0, 'max_queue_wait': 0.0,
+                        'last_duration': 0.0, 'last_sync': None, 'last_error': None}
+
+
+class FairScheduler:
+    """Per-tenant job queues served round-robin, imports before exports.
+
+    Each tenant holds at most one pending job per kind (repeats coalesce) and runs
+    at most one job at a time, so a busy tenant never holds up the others.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.pending = {}  # tenant name -> {kind: ready_at}
+        self.rings = {kind: deque() for kind in PRIORITIES}  # tenants with a due job
+        self.delayed = []  # heap of (ready_at, seq, tenant, kind)
+        self.seq = itertools.count()
+        self.busy = set()
+        self.closed = False
+
+    def submit(self, tenant, kind, delay=0):
+        ready_at = time.time() + delay
+        with self.cond:
+            jobs = self.pending.setdefault(tenant.name, {})
+            if kind in jobs:
+                # Coalesce: a later submit only pushes the settle deadline out
+                if ready_at <= jobs[kind]:
+                    return
+                jobs[kind] = ready_at
+            else:
+                jobs[kind] = ready_at
+                if delay <= 0:
+                    self.rings[kind].append(tenant)
+                    self.cond.notify()
+                    return
+            heapq.heappush(self.delayed, (ready_at, next(self.seq), tenant, kind))
+            self.cond.notify()
+
+    def _promote_due(self, now):
+        while self.delayed and self.delayed[0][0] <= now:
+            ready_at, _, tenant, kind = heapq.heappop(self.delayed)
+            if self.pending.get(tenant.name, {}).get(kind) == ready_at:
+                self.rings[kind].append(tenant)
+
+    def get(self):
+        """Block until a job is due; returns (tenant, kind, queue_wait) or None when closed"""
+        with self.cond:
+            while not self.closed:
+                now = time.time()
+                self._promote_due(now)
+                for kind in PRIORITIES:
+                    ring = self.rings[kind]
+                    for _ in range(len(ring)):
+                        tenant = ring.popleft()
+                        ready_at = self.pending[tenant.name].get(kind)
+                        if ready_at is None or ready_at > now:
+                            continue  # Already served, or re-deferred (the heap re-adds it)
+                        if tenant.name in self.busy:
+                            ring.append(tenant)
+                            continue
+                        del self.pending[tenant.name][kind]
+                        self.busy.add(tenant.name)
+                        return tenant, kind, now - ready_at
+                timeout = self.delayed[0][0] - now if self.delayed else None
+                self.cond.wait(timeout)
+            return None
+
+    def done(self, tenant):
+        with self.cond:
+            self.busy.discard(tenant.name)
+            self.cond.notify_all()
+
+    def depth(self):
+        with self.cond:
+            return sum(len(jobs) for jobs in self.pending.values())
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class SyncHost:
+    """Serves many tenants from one process with a bounded worker pool.
+
+    Change detection is a single stat scan over every tenant (no watch or thread
+    per tenant); exports and periodic imports are queued on the fair scheduler.
+    """
+
+    def __init__(self, tenants, workers=8, poll_interval=2, settle_delay=2, import_interval=300):
+        self.tenants = tenants
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.settle_delay = settle_delay  # Let Chrome finish writing before exporting
+        self.import_interval = import_interval
+        self.scheduler = FairScheduler()
+        self.threads = []
+        self.running = True
+
+        # Stagger the first fetches so a restart doesn't hit the git server all at once
+        now = time.time()
+        for tenant in tenants:
+            tenant.next_import = now + random.uniform(0, import_interval)
+
+    # --- jobs -----------------------------------------------------------------
+
+    def _git(self, tenant, *args):
+        tenant.metrics['git_ops'] += 1
+        return subprocess.run(["git", *args], cwd=tenant.repo_dir, capture_output=True, text=True)
+
+    def _export(self, tenant):
+        handler = tenant.handler
+        current_hash = handler.get_bookmark_structure_hash(tenant.bookmarks_path)
+        if current_hash is None or current_hash == handler.last_bookmark_hash:
+            tenant.metrics['unchanged'] += 1
+            return
+
+        # Edit (file mtime) and detection times, stamped on the commit for latency tracking
+        stamp = (os.path.getmtime(tenant.bookmarks_path), time.time())
+        export_file = export_bookmarks(tenant.export_dir, tenant.bookmarks_path)
+        self._git(tenant, "add", "--", str(export_file))
+        if self._git(tenant, "diff", "--cached", "--quiet").returncode != 0:
+            tenant.metrics['git_ops'] += 1
+            commit_sync_changes("🔖 Bookmark changes detected", tenant.repo_dir, stamp, check=False)
+            push_or_enqueue(tenant.repo_dir, tenant.bookmarks_path)
+
+        handler.last_bookmark_hash = current_hash
+        handler.state.save_snapshot('bookmark_only', tenant.bookmarks_path, structure_hash=current_hash)
+        handler.state.record_sync(tenant.bookmarks_path, export_file, tenant.repo_dir)
+        tenant.metrics['exports'] += 1
+
+    def _import(self, tenant):
+        fetch = self._git(tenant, "fetch", "-q")
+        if fetch.returncode != 0:
+            raise RuntimeError(f"git fetch failed: {fetch.stderr.strip()}")
+        if self._git(tenant, "rev-parse", "HEAD").stdout == self._git(tenant, "rev-parse", "@{u}").stdout:
+            tenant.metrics['unchanged'] += 1
+            return
+        pull = self._git(tenant, "pull", "-q", "--rebase")
+        if pull.returncode != 0:
+            raise RuntimeError(f"git pull failed: {pull.stderr.strip()}")
+
+        handler = tenant.handler
+        remote_hash = handler.get_bookmark_structure_hash(tenant.export_file)
+        if remote_hash and remote_hash != handler.last_bookmark_hash:
+            # Selective sync rules keep this machine's out-of-scope folders
+            import_file = apply_sync_filter_file(tenant.export_file, tenant.bookmarks_path)
+            safe_copy_bookmarks(import_file, tenant.bookmarks_path)
+            handler.last_bookmark_hash = remote_hash
+            handler.state.save_snapshot('bookmark_only', tenant.bookmarks_path, structure_hash=remote_hash)
+            tenant.metrics['imports'] += 1
+        # Our own write must not come back as an export
+        tenant.signature = file_signature(tenant.bookmarks_path)
+        handler.state.record_sync(tenant.bookmarks_path, tenant.export_file, tenant.repo_dir)
+
+    def _worker(self):
+        while True:
+            job = self.scheduler.get()
+            if job is None:
+                return
+            tenant, kind, queue_wait = job
+            metrics = tenant.metrics
+            try:
+                metrics['max_queue_wait'] = max(metrics['max_queue_wait'], round(queue_wait, 3))
+                wait = tenant.bucket.reserve()
+                if wait:
+                    metrics['rate_limited'] += 1
+                    self.scheduler.submit(tenant, kind, delay=wait)
+                    continue
+                start = time.perf_counter()
+                (self._import if kind == 'import' else self._export)(tenant)
+                metrics['last_duration'] = round(time.perf_counter() - start, 3)
+                metrics['last_sync'] = time.time()
+            except Exception as e:
+                metrics['errors'] += 1
+                metrics['last_error'] = str(e)
+                print(f"❌ [{tenant.name}] {kind} failed: {e}")
+            finally:
+                self.scheduler.done(tenant)
+
+    # --- scanning -------------------------------------------------------------
+
+    def scan(self):
+        """One pass over every tenant: queue exports for changed files and due imports"""
+        now = time.time()
+        for tenant in self.tenants:
+            signature = file_signature(tenant.bookmarks_path)
+            if signature != tenant.signature:
+                tenant.signature = signature
+                self.scheduler.submit(tenant, 'export', delay=self.settle_delay)
+            if now >= tenant.next_import:
+                tenant.next_import = now + self.import_interval
+                self.scheduler.submit(tenant, 'import')
+
+    def metrics(self):
+        totals = {}
+        for tenant in self.tenants:
+            for key in ('exports', 'imports', 'unchanged', 'errors', 'rate_limited', 'git_ops'):
+                totals[key] = totals.get(key, 0) + tenant.metrics[key]
+        return {
+            'host': dict(totals, tenants=len(self.tenants), workers=self.workers,
+                         queue_depth=self.scheduler.depth(),
+                         outbound_queue=get_outbound_queue().depth()),
+            'tenants': {tenant.name: tenant.metrics for tenant in self.tenants},
+        }
+
+    def write_metrics(self, metrics_file):
+        tmp = Path(metrics_file).with_suffix(".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.metrics(), f, indent=1)
+        os.replace(tmp, metrics_file)
+
+    def start(self):
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._worker, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        get_outbound_queue().start()
+
+    def run(self, metrics_file=None, metrics_interval=30):
+        metrics_file = metrics_file or get_state_dir() / "sync_host_metrics.json"
+        self.start()
+        last_metrics = 0
+        try:
+            while self.running:
+                scan_start = time.time()
+                self.scan()
+                if scan_start - last_metrics >= metrics_interval:
+                    self.write_metrics(metrics_file)
+                    last_metrics = scan_start
+                time.sleep(max(0, self.poll_interval - (time.time() - scan_start)))
+        finally:
+            self.stop()
+            self.write_metrics(metrics_file)
+
+    def stop(self):
+        self.running = False
+        self.scheduler.close()
+
+
+def load_tenants(config_file, git_rate=0.2, git_burst=5):
+    """Tenants from a JSON list of {"name", "bookmarks", "repo"} entries"""
+    with open(config_file, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    return [Tenant(entry['name'], entry['bookmarks'], entry['repo'],
+                   entry.get('git_rate', git_rate), entry.get('git_burst', git_burst))
+            for entry in entries]
+
+
+def main():
+    # Usage: python sync_host.py <tenants.json> [--workers N] [--import-interval SECONDS] [--process-pool]
+    if len(sys.argv) < 2:
+        print("Usage: python sync_host.py <tenants.json> [--workers N] [--import-interval SECONDS] "
+              "[--process-pool]")
+        sys.exit(1)
+
+    workers = int(sys.argv[sys.argv.index("--workers") + 1]) if "--workers" in sys.argv else 8
+    import_interval = (int(sys.argv[sys.argv.index("--import-interval") + 1])
+                       if "--import-interval" in sys.argv else 300)
+
+    tenants = load_tenants(sys.argv[1])
+
+    # Parse/hash large profiles in worker processes so they don't serialize on the GIL
+    if "--process-pool" in sys.argv:
+        from parse_pool import ParsePool
+        parse_pool = ParsePool()
+        for tenant in tenants:
+            tenant.handler.parse_pool = parse_pool
+        print(f"⚙️ Process pool: {parse_pool.workers} workers")
+    host = SyncHost(tenants, workers=workers, import_interval=import_interval)
+
+    print("🏢 Multi-tenant Bookmark Sync Host")
+    print(f"👥 Tenants: {len(tenants)}")
+    print(f"🧵 Workers: {workers}")
+    print("📋 Imports are served before exports, round-robin across tenants")
+    print("🛑 Press Ctrl+C to stop")
+
+    try:
+        host.run()
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping sync host...")
+    print(json.dumps(host.metrics()['host'], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import re
+import sys
+import math
+import time
+import sqlite3
+import subprocess
+from pathlib import Path
+from bookmarks_export import get_state_dir, get_device_id
+
+
+# Commit trailers stamped by the exporting device (epoch seconds)
+LATENCY_TRAILER_PATTERN = re.compile(r"^Sync-(Device|Edited|Detected|Committed):\s*(\S+)\s*$", re.MULTILINE)
+# Push times can't be in the commit itself; each device writes git notes under its own ref
+NOTES_PREFIX = "sync-latency"
+REMOTE_NOTES_PREFIX = "remote-sync-latency"
+STAGES = [('detect', 'detected', 'edited'), ('commit', 'committed', 'detected'), ('push', 'pushed', 'committed'),
+          ('propagate', 'pulled', 'pushed'), ('apply', 'applied', 'pulled')]
+
+
+def _ref_name(device):
+    return re.sub(r"[^A-Za-z0-9._-]", "_", device)
+
+
+def format_latency_trailers(stamp=None):
+    """Trailer lines for a sync commit; stamp is (edit time = Bookmarks mtime, detection time)"""
+    lines = [f"Sync-Device: {get_device_id()}"]
+    if stamp:
+        lines += [f"Sync-Edited: {stamp[0]:.3f}", f"Sync-Detected: {stamp[1]:.3f}"]
+    return "\n".join(lines + [f"Sync-Committed: {time.time():.3f}"])
+
+
+def parse_latency_trailers(message):
+    values = dict(LATENCY_TRAILER_PATTERN.findall(message))
+    record = {'device': values.get('Device')}
+    for name in ('Edited', 'Detected', 'Committed'):
+        if name in values:
+            record[name.lower()] = float(values[name])
+    return record
+
+
+def _git(repo_dir, *args, check=False):
+    return subprocess.run(["git", *args], cwd=repo_dir, capture_output=True, text=True, check=check)
+
+
+def push_command(repo_dir="."):
+    """git push argv; stamps unpushed commits with a push-time note pushed alongside them"""
+    unpushed = _git(repo_dir, "rev-list", "@{u}..HEAD")
+    commits = unpushed.stdout.split() if unpushed.returncode == 0 else []
+    if not commits:
+        return ["git", "push"]
+    notes_ref = f"refs/notes/{NOTES_PREFIX}/{_ref_name(get_device_id())}"
+    pushed_at = f"Sync-Pushed: {time.time():.3f}"
+    for sha in commits:
+        _git(repo_dir, "notes", "--ref", notes_ref, "add", "-f", "-m", pushed_at, sha)
+    # The notes ref is only ever written by this device, so forcing it can't clobber anyone
+    return ["git", "push", "origin", "HEAD", f"+{notes_ref}:{notes_ref}"]
+
+
+class LatencyTracker:
+    """Edit-to-visible samples for commits this device pulled and applied"""
+
+    def __init__(self, repo_dir=".", db_path=None):
+        self.repo_dir = Path(repo_dir)
+        self.db_path = Path(db_path) if db_path else get_state_dir() / "sync_latency.db"
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS samples (
+                sha TEXT PRIMARY KEY, origin TEXT, target TEXT,
+                edited REAL, detected REAL, committed REAL, pushed REAL, pulled REAL, applied REAL)""")
+
+    def incoming(self, upstream="origin/main", base="HEAD"):
+        """Trailer/notes timestamps of fetched commits after base from other devices"""
+        log = _git(self.repo_dir, "log", "--format=%H%x00%B%x1e", f"{base}..{upstream}")
+        if log.returncode != 0:
+            return []
+        records = []
+        for entry in log.stdout.split("\x1e"):
+            if "\x00" not in entry:
+                continue
+            sha, message = entry.strip().split("\x00", 1)
+            record = parse_latency_trailers(message)
+            if record['device'] and record['device'] != get_device_id():
+                records.append(dict(record, sha=sha))
+        if records:
+            _git(self.repo_dir, "fetch", "-q", "origin",
+                 f"+refs/notes/{NOTES_PREFIX}/*:refs/notes/{REMOTE_NOTES_PREFIX}/*")
+            for record in records:
+                note = _git(self.repo_dir, "notes", "--ref",
+                            f"{REMOTE_NOTES_PREFIX}/{_ref_name(record['device'])}", "show", record['sha'])
+                match = re.search(r"Sync-Pushed:\s*(\S+)", note.stdout)
+                record['pushed'] = float(match.group(1)) if match else None
+        return records
+
+    def record_pulled(self, records, pulled_at=None):
+        pulled_at = pulled_at or time.time()
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO samples VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL)",
+            [(r['sha'], r['device'], get_device_id(), r.get('edited'), r.get('detected'), r.get('committed'),
+              r.get('pushed'), pulled_at) for r in records])
+        self.conn.commit()
+
+    def mark_applied(self, applied_at=None):
+        """Every pulled commit is visible once the tip it led to has been imported"""
+        cursor = self.conn.execute("UPDATE samples SET applied = ? WHERE applied IS NULL AND pulled IS NOT NULL",
+                                   (applied_at or time.time(),))
+        self.conn.commit()
+        return cursor.rowcount
+
+    def report(self, since=None):
+        """Per origin->target pair: count, end-to-end p50/p90/p99 and median per stage (seconds)"""
+        rows = self.conn.execute(
+            "SELECT origin, target, edited, detected, committed, pushed, pulled, applied FROM samples "
+            "WHERE applied IS NOT NULL AND applied >= ?", (since or 0,)).fetchall()
+        pairs = {}
+        for origin, target, *times in rows:
+            pairs.setdefault((origin, target), []).append(
+                dict(zip(('edited', 'detected', 'committed', 'pushed', 'pulled', 'applied'), times)))
+
+        report = {}
+        for (origin, target), samples in sorted(pairs.items()):
+            end_to_end = sorted(s['applied'] - (s['edited'] or s['detected'] or s['committed']) for s in samples)
+            stats = {'count': len(samples), 'p50': percentile(end_to_end, 50), 'p90': percentile(end_to_end, 90),
+                     'p99': percentile(end_to_end, 99), 'stages': {}}
+            for stage, end, start in STAGES:
+                durations = sorted(s[end] - s[start] for s in samples if s[end] is not None and s[start] is not None)
+                if durations:
+                    stats['stages'][stage] = percentile(durations, 50)
+            report[f"{origin} -> {target}"] = stats
+        return report
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return round(sorted_values[rank], 3)
+
+
+_tracker = None
+
+
+def get_latency_tracker(repo_dir="."):
+    global _tracker
+    if _tracker is None:
+        _tracker = LatencyTracker(repo_dir)
+    return _tracker
+
+
+if __name__ == "__main__":
+    # Usage: python sync_latency.py report [days]
+    days = float(sys.argv[2]) if len(sys.argv) > 2 else None
+    report = get_latency_tracker().report(time.time() - days * 86400 if days else None)
+    if not report:
+        print("ℹ️ No latency samples yet")
+    for pair, stats in report.items():
+        stages = ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in stats['stages'].items())
+        print(f"⏱️ {pair}: n={stats['count']} p50 {stats['p50']:.1f}s p90 {stats['p90']:.1f}s "
+              f"p99 {stats['p99']:.1f}s  ({stages})")
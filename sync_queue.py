@@ -0,0 +1,218 @@
+import os
+import sys
+import json
+import time
+import random
+import subprocess
+import threading
+from pathlib import Path
+from bookmarks_export import get_state_dir
+from push_resolver import push_with_resolution
+
+
+class OutboundQueue:
+    """Durable queue of repositories with commits that still need to be pushed.
+
+    One JSON file per entry survives restarts. Entries for the same repository
+    are coalesced once the backlog grows, and a single successful push clears
+    them all because git pushes every pending commit at once.
+    """
+
+    def __init__(self, queue_dir=None, coalesce_threshold=10, base_delay=5, max_delay=300,
+                 probe_timeout=10):
+        self.queue_dir = Path(queue_dir) if queue_dir else get_state_dir() / "outbound_queue"
+        self.queue_dir.mkdir(parents=True, exist_ok=True)
+        self.coalesce_threshold = coalesce_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.probe_timeout = probe_timeout
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.stats = {'pushed': 0, 'failed_attempts': 0, 'probes': 0, 'last_error': None}
+
+    # --- storage ----------------------------------------------------------
+
+    def _entry_files(self):
+        return sorted(self.queue_dir.glob("*.json"))
+
+    def _read(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path, entry):
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+
+    def entries(self):
+        return [(path, entry) for path in self._entry_files()
+                if (entry := self._read(path)) is not None]
+
+    def depth(self):
+        """Queue depth metric: number of pending sync entries"""
+        return len(self._entry_files())
+
+    def metrics(self):
+        entries = [entry for _, entry in self.entries()]
+        oldest = min((entry['created'] for entry in entries), default=None)
+        return dict(self.stats,
+                    depth=len(entries),
+                    pending_syncs=sum(entry.get('count', 1) for entry in entries),
+                    oldest_age=round(time.time() - oldest, 1) if oldest else 0)
+
+    # --- queueing -----------------------------------------------------------
+
+    def enqueue(self, repo_dir=".", reason="push failed", bookmarks_file=None):
+        """Record that repo_dir has unpushed commits; bookmarks_file is the profile it syncs"""
+        now = time.time()
+        entry = {'repo_dir': str(Path(repo_dir).resolve()), 'reason': reason, 'created': now,
+                 'count': 1, 'attempts': 0, 'next_attempt': now + self.base_delay,
+                 'bookmarks_file': str(bookmarks_file) if bookmarks_file else None}
+        with self.lock:
+            self._write(self.queue_dir / f"{time.time_ns()}.json", entry)
+            if self.depth() > self.coalesce_threshold:
+                self._coalesce()
+        print(f"📮 Queued sync for later push (queue depth: {self.depth()})")
+        self.wakeup.set()
+
+    def _coalesce(self):
+        """Merge all entries of a repository into its oldest entry"""
+        by_repo = {}
+        for path, entry in self.entries():
+            by_repo.setdefault(entry['repo_dir'], []).append((path, entry))
+        for group in by_repo.values():
+            if len(group) < 2:
+                continue
+            keep_path, keep = group[0]
+            keep['count'] = sum(entry.get('count', 1) for _, entry in group)
+            keep['attempts'] = min(entry['attempts'] for _, entry in group)
+            keep['next_attempt'] = min(entry['next_attempt'] for _, entry in group)
+            keep['bookmarks_file'] = next((entry['bookmarks_file'] for _, entry in group
+                                           if entry.get('bookmarks_file')), None)
+            self._write(keep_path, keep)
+            for path, _ in group[1:]:
+                path.unlink(missing_ok=True)
+
+    def clear(self, repo_dir):
+        """Drop every entry for repo_dir (after any successful push)"""
+        repo_dir = str(Path(repo_dir).resolve())
+        with self.lock:
+            for path, entry in self.entries():
+                if entry['repo_dir'] == repo_dir:
+                    path.unlink(missing_ok=True)
+
+    # --- flushing -------------------------------------------------------------
+
+    def _backoff(self, attempts):
+        delay = min(self.max_delay, self.base_delay * 2 ** attempts)
+        return delay * random.uniform(0.5, 1.5)  # Jitter so a fleet doesn't retry in lockstep
+
+    def probe(self, repo_dir):
+        """Cheap reachability check against the remote"""
+        self.stats['probes'] += 1
+        try:
+            result = subprocess.run(["git", "ls-remote", "--exit-code", "-q", "origin", "HEAD"],
+                                    cwd=repo_dir, capture_output=True, timeout=self.probe_timeout)
+            return result.returncode == 0
+        except (subprocess.TimeoutExpired, OSError):
+            return False
+
+    def flush(self, force=False):
+        """Push every repository whose entry is due (or all with force); returns pushes done"""
+        now = time.time()
+        pushed = 0
+        due = {}
+        for path, entry in self.entries():
+            if force or entry['next_attempt'] <= now:
+                due.setdefault(entry['repo_dir'], []).append((path, entry))
+
+        for repo_dir, group in due.items():
+            if self.probe(repo_dir):
+                # Merges with concurrent remote changes go into the profile that queued the push
+                bookmarks_file = next((entry['bookmarks_file'] for _, entry in group
+                                       if entry.get('bookmarks_file')), None)
+                result = push_with_resolution(repo_dir, bookmarks_file=bookmarks_file)
+                if result.returncode == 0:
+                    synced = sum(entry.get('count', 1) for _, entry in group)
+                    self.clear(repo_dir)
+                    self.stats['pushed'] += 1
+                    pushed += 1
+                    print(f"🚀 Flushed {synced} queued syncs for {repo_dir}")
+                    continue
+                self.stats['last_error'] = result.stderr.strip()
+            else:
+                self.stats['last_error'] = "remote unreachable"
+
+            self.stats['failed_attempts'] += 1
+            with self.lock:
+                for path, entry in group:
+                    entry['attempts'] += 1
+                    entry['next_attempt'] = time.time() + self._backoff(entry['attempts'])
+                    if path.exists():
+                        self._write(path, entry)
+        return pushed
+
+    def next_due(self):
+        return min((entry['next_attempt'] for _, entry in self.entries()), default=None)
+
+    def start(self):
+        """Flush in a background thread, sleeping until the next entry is due"""
+        if self.thread:
+            return self.thread
+
+        def run():
+            while True:
+                due = self.next_due()
+                timeout = None if due is None else max(0, due - time.time())
+                self.wakeup.wait(timeout)
+                self.wakeup.clear()
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"⚠️ Queue flush error: {e}")
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        return self.thread
+
+
+_queue = None
+
+
+def get_outbound_queue():
+    """Process-wide queue instance"""
+    global _queue
+    if _queue is None:
+        _queue = OutboundQueue()
+    return _queue
+
+
+def push_or_enqueue(repo_dir=".", bookmarks_file=None):
+    """git push (merging concurrent remote changes); on failure queue the sync for retry.
+
+    bookmarks_file is the browser profile repo_dir syncs; a merge with remote
+    changes is written back there (and nowhere if it is not given).
+    """
+    queue = get_outbound_queue()
+    result = push_with_resolution(repo_dir, bookmarks_file=bookmarks_file)
+    if result.returncode == 0:
+        queue.clear(repo_dir)
+        return True
+
+    print(f"❌ Git push failed: {result.stderr.strip()}")
+    queue.enqueue(repo_dir, result.stderr.strip() or "push failed", bookmarks_file)
+    queue.start()
+    return False
+
+
+if __name__ == "__main__":
+    # Usage: python sync_queue.py [status|flush]
+    queue = get_outbound_queue()
+    if len(sys.argv) > 1 and sys.argv[1] == "flush":
+        queue.flush(force=True)
+    print(json.dumps(queue.metrics(), indent=2))
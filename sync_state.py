@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import tempfile
+import subprocess
+import threading
+from pathlib import Path
+from bookmarks_export import get_state_dir
+
+
+STATE_FILE_NAME = "sync_state.json"
+_lock = threading.Lock()
+
+
+def file_signature(filepath):
+    """Cheap identity of a file's current contents: [inode, size, mtime_ns]"""
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+    return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+
+def git_upstream_tip(repo_dir="."):
+    """Last fetched remote tip (no network access)"""
+    result = subprocess.run(["git", "rev-parse", "@{u}"], cwd=repo_dir,
+                            capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+class SyncState:
+    """Small persisted JSON document of last-synced snapshots, keyed by file"""
+
+    def __init__(self, state_file=None):
+        self.state_file = Path(state_file) if state_file else get_state_dir() / STATE_FILE_NAME
+        self.data = self._read()
+
+    def _read(self):
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, section, key):
+        return self.data.get(section, {}).get(str(key))
+
+    def put(self, section, key, value):
+        with _lock:
+            # Re-read so sections written by the other monitor process survive
+            self.data = self._read()
+            self.data.setdefault(section, {})[str(key)] = value
+            tmp = self.state_file.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False)
+            os.replace(tmp, self.state_file)
+
+    def load_snapshot(self, section, filepath):
+        """Values saved at the last sync of filepath, or None"""
+        return self.get(section, filepath)
+
+    def save_snapshot(self, section, filepath, **values):
+        """Persist values describing filepath as of now (with its stat signature)"""
+        self.put(section, filepath, dict(values, signature=file_signature(filepath)))
+
+    def record_sync(self, bookmarks_path, export_file, repo_dir="."):
+        """Remember what the live file, export and remote looked like after a sync"""
+        self.put('last_sync', bookmarks_path, {
+            'live': file_signature(bookmarks_path),
+            'export': file_signature(export_file),
+            'remote_tip': git_upstream_tip(repo_dir),
+        })
+
+    def decide_direction(self, bookmarks_path, export_file, repo_dir="."):
+        """Work out what changed while no daemon was running, from stats only.
+
+        Returns 'export', 'import', 'conflict', 'none' or 'unknown' (never synced).
+        """
+        last = self.get('last_sync', bookmarks_path)
+        if not last:
+            return 'unknown'
+
+        live_changed = file_signature(bookmarks_path) != last['live']
+        synced_changed = (file_signature(export_file) != last['export']
+                          or git_upstream_tip(repo_dir) != last['remote_tip'])
+
+        if live_changed and synced_changed:
+            return 'conflict'
+        if live_changed:
+            return 'export'
+        if synced_changed:
+            return 'import'
+        return 'none'
+
+    def resolve_conflict(self, bookmarks_path, export_file, repo_dir="."):
+        """Merge live and synced bookmarks that both changed while offline.
+
+        The base is the export at the remote tip of the last sync; ours is the
+        live file and theirs the current remote export. The live file is backed
+        up first, and left alone if there is no base to merge against. Returns
+        True once the merged tree is in the live file and needs exporting.
+        """
+        from fast_copy import backup_file
+        from push_resolver import three_way_merge, _tree_at
+        from chrome_checksum import read_bookmarks_consistent, set_checksum
+        from bookmarks_import_fixed import import_bookmarks, is_chrome_running
+        from deferred_import import defer_enabled
+
+        backup_path = get_state_dir() / f"Bookmarks.conflict-{int(time.time())}"
+        backup_file(bookmarks_path, backup_path)
+        print(f"📋 Backed up live bookmarks to {backup_path}")
+
+        last = self.get('last_sync', bookmarks_path) or {}
+        tip = git_upstream_tip(repo_dir)
+        base = _tree_at(repo_dir, last['remote_tip']) if last.get('remote_tip') else None
+        theirs = _tree_at(repo_dir, tip) if tip else None
+        if theirs is None and Path(export_file).exists():
+            with open(export_file, 'r', encoding='utf-8') as f:
+                theirs = json.load(f)
+        if base is None or theirs is None:
+            print("⚠️ No common base for the offline changes; skipped (resolve by hand from the backup)")
+            return False
+
+        merged = three_way_merge(base, read_bookmarks_consistent(bookmarks_path), theirs)
+        merged_file = Path(tempfile.gettempdir()) / "Bookmarks_Chrome.offline-merge.json"
+        with open(merged_file, 'w', encoding='utf-8') as f:
+            json.dump(set_checksum(merged), f, indent=3, ensure_ascii=False)
+        deferred = defer_enabled() and is_chrome_running()
+        if not import_bookmarks(merged_file):
+            return False
+
+        # The synced side is consumed; only the (merged) live file is left to export
+        self.put('last_sync', bookmarks_path, dict(last, export=file_signature(export_file), remote_tip=tip))
+        if deferred:
+            print("⏸️ Merged bookmarks are applied when Chrome exits; the export follows then")
+            return False
+        print("🔀 Merged offline changes from both sides")
+        return True
+
+    def catch_up_direction(self, bookmarks_path, export_file, repo_dir="."):
+        """decide_direction for the export monitors, with 'conflict' merged by resolve_conflict.
+
+        Returns 'export', 'import', 'none' or 'unknown'.
+        """
+        direction = self.decide_direction(bookmarks_path, export_file, repo_dir)
+        if direction != 'conflict':
+            return direction
+        print("⚠️ Both local and synced bookmarks changed while offline, merging...")
+        return 'export' if self.resolve_conflict(bookmarks_path, export_file, repo_dir) else 'none'
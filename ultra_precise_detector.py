@@ -1,13 +1,18 @@
 import time
 import subprocess
 import threading
-import hashlib
-import json
 import os
 from pathlib import Path
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+from polling_observer import create_observer
+from watchdog.events import FileSystemEventHandler, FileModifiedEvent
 from bookmarks_export import export_bookmarks, get_chrome_bookmarks_path
+from bookmark_search import update_search_index
+from sync_state import SyncState
+from sync_queue import push_or_enqueue, get_outbound_queue
+from sync_history import commit_sync_changes
+from change_feed import maybe_start_feed_server
+from chrome_checksum import read_bookmarks_consistent, TornReadError
+from bookmark_tree import count_url_nodes, core_bookmark_hash
 
 
 class UltraPreciseBookmarkDetector(FileSystemEventHandler):
@@ -17,27 +22,45 @@ class UltraPreciseBookmarkDetector(FileSystemEventHandler):
         
         self.sync_lock = threading.Lock()
         self.processing = False
+        self.latency_stamp = None
         self.last_sync_time = 0
         self.cooldown_period = 2
+        self.parse_pool = None  # Optional parse_pool.ParsePool for parse/hash work
         
         # Multiple detection strategies
         chrome_bookmarks = get_chrome_bookmarks_path()
         self.file_path = chrome_bookmarks
         
-        # Strategy 1: Bookmark counting
-        self.last_bookmark_count = self.count_bookmarks()
-        
-        # Strategy 2: Core bookmark data hash
-        self.last_core_hash = self.get_core_bookmark_hash()
-        
-        # Strategy 3: File size tracking (rough indicator)
-        self.last_file_size = self.get_file_size()
+        # Warm start from the state saved at the last sync
+        self.state = SyncState()
+        snapshot = self.state.load_snapshot('ultra_precise', self.file_path)
+        if snapshot:
+            self.last_bookmark_count = snapshot['count']
+            self.last_core_hash = snapshot['core_hash']
+            self.last_file_size = snapshot['size']
+        else:
+            # Strategy 1: Bookmark counting
+            self.last_bookmark_count = self.count_bookmarks() or 0
+            
+            # Strategy 2: Core bookmark data hash
+            self.last_core_hash = self.get_core_bookmark_hash()
+            
+            # Strategy 3: File size tracking (rough indicator)
+            self.last_file_size = self.get_file_size()
+            self._save_state()
         
         # Strategy 4: Timing analysis
         self.recent_changes = []  # Track recent file changes
         
         print(f"📊 Initial: {self.last_bookmark_count} bookmarks, {self.last_file_size} bytes")
 
+    def _save_state(self):
+        """Persist the last synced detection values for the next warm start"""
+        self.state.save_snapshot('ultra_precise', self.file_path,
+                                 count=self.last_bookmark_count,
+                                 core_hash=self.last_core_hash,
+                                 size=self.last_file_size)
+
     def get_file_size(self):
         """Get current file size"""
         try:
@@ -46,35 +69,20 @@ class UltraPreciseBookmarkDetector(FileSystemEventHandler):
             return 0
 
     def count_bookmarks(self):
-        """Count actual bookmarks (Strategy 1)"""
+        """Count actual bookmarks (Strategy 1); None on a torn read"""
         try:
             if not os.path.exists(self.file_path):
                 return 0
-                
-            with open(self.file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            count = 0
-            
-            def count_recursive(node):
-                nonlocal count
-                if isinstance(node, dict):
-                    if node.get('type') == 'url':
-                        count += 1
-                    if 'children' in node:
-                        for child in node['children']:
-                            count_recursive(child)
-                    # Handle roots
-                    if not node.get('type') and not node.get('children'):
-                        for value in node.values():
-                            if isinstance(value, dict):
-                                count_recursive(value)
-            
-            if 'roots' in data:
-                count_recursive(data['roots'])
-            
-            return count
+
+            if self.parse_pool:
+                return self.parse_pool.analyze(self.file_path, ('count',))['count']
+
+            data = read_bookmarks_consistent(self.file_path)
+            return count_url_nodes(data)
             
+        except TornReadError as e:
+            print(f"⏳ {e}")
+            return None
         except Exception as e:
             print(f"❌ Count error: {e}")
             return 0
@@ -84,50 +92,12 @@ class UltraPreciseBookmarkDetector(FileSystemEventHandler):
         try:
             if not os.path.exists(self.file_path):
                 return None
-                
-            with open(self.file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # Extract minimal bookmark representation
-            core_data = []
-            
-            def extract_core(node, path=""):
-                if isinstance(node, dict):
-                    if node.get('type') == 'url':
-                        # Only store URL and name for bookmarks
-                        core_data.append({
-                            'url': node.get('url', ''),
-                            'name': node.get('name', ''),
-                            'path': path
-                        })
-                    elif node.get('type') == 'folder':
-                        # Store folder name and path
-                        folder_path = f"{path}/{node.get('name', '')}" if path else node.get('name', '')
-                        core_data.append({
-                            'type': 'folder',
-                            'name': node.get('name', ''),
-                            'path': folder_path
-                        })
-                        if 'children' in node:
-                            for child in node['children']:
-                                extract_core(child, folder_path)
-                    elif 'children' in node:
-                        for child in node['children']:
-                            extract_core(child, path)
-                    elif not node.get('type'):
-                        # Root level processing
-                        for key, value in node.items():
-                            if key in ['bookmark_bar', 'other', 'synced'] and isinstance(value, dict):
-                                extract_core(value, key)
-            
-            if 'roots' in data:
-                extract_core(data['roots'])
-            
-            # Sort for consistent hashing
-            core_data.sort(key=lambda x: (x.get('path', ''), x.get('name', ''), x.get('url', '')))
-            
-            core_json = json.dumps(core_data, sort_keys=True)
-            return hashlib.md5(core_json.encode()).hexdigest()
+
+            if self.parse_pool:
+                return self.parse_pool.analyze(self.file_path, ('core_hash',))['core_hash']
+
+            data = read_bookmarks_consistent(self.file_path)
+            return core_bookmark_hash(data)
             
         except Exception as e:
             print(f"❌ Hash error: {e}")
@@ -182,6 +152,10 @@ class UltraPreciseBookmarkDetector(FileSystemEventHandler):
             current_hash = self.get_core_bookmark_hash()
             current_size = self.get_file_size()
             
+            # A torn read is not a change; keep the last values for the next event
+            if current_count is None or current_hash is None:
+                return False, 0, ["Bookmarks file mid-write, skipped"]
+            
             # Strategy 1: Count change (most reliable)
             count_changed = current_count != self.last_bookmark_count
             
@@ -268,9 +242,15 @@ class UltraPreciseBookmarkDetector(FileSystemEventHandler):
                 
                 print("🔥 BOOKMARK CHANGE CONFIRMED!")
                 
+                # Edit (file mtime) and detection times, stamped on the commit for latency tracking
+                self.latency_stamp = (os.path.getmtime(event.src_path), current_time)
+
                 # Export and sync
-                export_bookmarks(self.export_dir)
+                export_file = export_bookmarks(self.export_dir)
+                update_search_index(export_file)
                 self.git_push_changes()
+                self._save_state()
+                self.state.record_sync(self.file_path, export_file, self.export_dir.parent)
                 
                 self.last_sync_time = current_time
                 print("✅ Sync completed")
@@ -288,10 +268,9 @@ class UltraPreciseBookmarkDetector(FileSystemEventHandler):
             
             if result.stdout.strip():
                 subprocess.run(["git", "add", "."], check=True, cwd=self.export_dir.parent)
-                subprocess.run(["git", "commit", "-m", "🎯 Confirmed bookmark change"], 
-                             check=True, cwd=self.export_dir.parent)
-                subprocess.run(["git", "push"], check=True, cwd=self.export_dir.parent)
-                print("🚀 Pushed to Git")
+                commit_sync_changes("🎯 Confirmed bookmark change", self.export_dir.parent, self.latency_stamp)
+                if push_or_enqueue(self.export_dir.parent, get_chrome_bookmarks_path()):
+                    print("🚀 Pushed to Git")
             else:
                 print("ℹ️ No changes to push")
                 
@@ -316,10 +295,26 @@ def main():
     print()
     
     detector = UltraPreciseBookmarkDetector(export_dir)
-    observer = Observer()
+    observer = create_observer()
     observer.schedule(detector, path=str(folder_to_watch), recursive=False)
     
     observer.start()
+
+    # Structured change events for local consumers (BOOKMARKS_SYNC_FEED)
+    maybe_start_feed_server()
+
+    # Retry syncs left unpushed by a previous run (offline, remote down, ...)
+    outbound_queue = get_outbound_queue()
+    if outbound_queue.depth():
+        print(f"📮 {outbound_queue.depth()} queued syncs pending, flushing in background")
+        outbound_queue.start()
+
+    # Catch up on local changes made while the detector was not running
+    direction = detector.state.catch_up_direction(
+        chrome_bookmarks_path, export_dir / "Bookmarks_Chrome.json", export_dir.parent)
+    if direction == 'export':
+        print("🔄 Local bookmarks changed while offline, checking...")
+        detector.on_modified(FileModifiedEvent(str(chrome_bookmarks_path)))
     
     try:
         print("✅ Ultra-precise monitoring active!")